@@ -0,0 +1,145 @@
+"""
+APIキーなしで動かせる、ストリーミング対応のローカル Fake チャットモデル。
+
+ノートブックの `LLM_PROVIDER` に実在のプロバイダーを設定しなくても、
+ストリーミング・計測・ベンチマーク系の補助モジュールを手元で試せるようにするためのもの。
+応答までの待ち時間 (first_token_latency) と1トークンごとの待ち時間 (token_latency) を指定でき、
+usage_metadata (入力/出力トークン数) も返すため、実際のチャットモデルと同じように計測できる。
+
+使い方:
+
+    from fake_llm import FakeStreamingChatModel
+    llm = FakeStreamingChatModel(responses=["こんにちは！", "ご用件は何でしょう？"], first_token_latency=0.2, token_latency=0.01)
+    for chunk in llm.stream("やあ"):
+        print(chunk.content, end="")
+
+応答を入力に応じて変えたい場合は、responses の代わりに respond (メッセージのリストを受け取って str か AIMessage を返す関数) を渡す。
+"""
+import asyncio
+import json
+import math
+import threading
+import time
+from typing import Any, Callable, List, Optional, Union
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+
+def count_fake_tokens(text, chars_per_token=4):
+    """文字数からおおよそのトークン数を求める (Fake モデル用の簡易トークナイザ)。"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / chars_per_token)
+
+
+def split_fake_tokens(text, chars_per_token=4):
+    """文字列を chars_per_token 文字ずつのトークンに分割する。日本語のように空白で区切れない文でもストリーミングできる。"""
+    return [text[i:i + chars_per_token] for i in range(0, len(text), chars_per_token)]
+
+
+def _message_text(message):
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(block if isinstance(block, str) else str(block.get("text", "")) for block in content)
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """
+    固定の応答 (responses を順番に繰り返す) または respond 関数の戻り値を、トークン単位でストリーミングする Fake チャットモデル。
+
+    - responses: 返す応答 (str または AIMessage) のリスト。末尾まで使うと先頭に戻る。
+    - respond: 入力メッセージのリストを受け取って応答 (str または AIMessage) を返す関数。指定時は responses より優先。
+    - first_token_latency: 最初のトークンを返すまでの待ち時間 (秒)。
+    - token_latency: 2つ目以降のトークン1つごとの待ち時間 (秒)。
+    - chars_per_token: 1トークンとみなす文字数。
+    """
+
+    responses: List[Union[str, AIMessage]] = []
+    respond: Optional[Callable[[List[BaseMessage]], Union[str, AIMessage]]] = None
+    first_token_latency: float = 0.0
+    token_latency: float = 0.0
+    chars_per_token: int = 4
+    model_name: str = "fake-streaming-chat"
+
+    _index: int = PrivateAttr(default=0)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming-chat"
+
+    @property
+    def _identifying_params(self):
+        return {"model_name": self.model_name}
+
+    def bind_tools(self, tools, **kwargs):
+        # ツールの実行可否は respond 関数側で決める (ToolCall を含む AIMessage を返せばよい)
+        return self
+
+    def _next_response(self, messages):
+        if self.respond is not None:
+            response = self.respond(messages)
+        else:
+            if not self.responses:
+                raise ValueError("FakeStreamingChatModel には responses か respond のどちらかを指定してください。")
+            with self._lock:
+                response = self.responses[self._index % len(self.responses)]
+                self._index += 1
+        message = AIMessage(content=response) if isinstance(response, str) else response
+        prompt_tokens = sum(count_fake_tokens(_message_text(m), self.chars_per_token) for m in messages)
+        completion_tokens = count_fake_tokens(_message_text(message), self.chars_per_token)
+        usage_metadata = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        return message, usage_metadata
+
+    def _chunks(self, message, usage_metadata):
+        tokens = split_fake_tokens(_message_text(message), self.chars_per_token)
+        for token in tokens:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        # 最後のチャンクでツール呼び出しとトークン使用量を返す (実際のプロバイダーと同じ順序)
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="",
+            tool_call_chunks=[
+                {"name": tc["name"], "args": json.dumps(tc["args"], ensure_ascii=False), "id": tc["id"], "index": i}
+                for i, tc in enumerate(message.tool_calls)
+            ],
+            usage_metadata=usage_metadata,
+            response_metadata={"model_name": self.model_name},
+        ))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message, usage_metadata = self._next_response(messages)
+        n_tokens = len(split_fake_tokens(_message_text(message), self.chars_per_token))
+        time.sleep(self.first_token_latency + self.token_latency * max(n_tokens - 1, 0))
+        result_message = AIMessage(
+            content=message.content,
+            tool_calls=message.tool_calls,
+            name=message.name,
+            usage_metadata=usage_metadata,
+            response_metadata={"model_name": self.model_name},
+        )
+        return ChatResult(generations=[ChatGeneration(message=result_message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # on_llm_new_token コールバックは BaseChatModel.stream 側で呼ばれるため、ここでは呼ばない
+        message, usage_metadata = self._next_response(messages)
+        time.sleep(self.first_token_latency)
+        for i, chunk in enumerate(self._chunks(message, usage_metadata)):
+            if i > 0 and chunk.message.content:
+                time.sleep(self.token_latency)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        message, usage_metadata = self._next_response(messages)
+        await asyncio.sleep(self.first_token_latency)
+        for i, chunk in enumerate(self._chunks(message, usage_metadata)):
+            if i > 0 and chunk.message.content:
+                await asyncio.sleep(self.token_latency)
+            yield chunk
@@ -285,7 +285,9 @@ def generate_blanks_in_code_v2(code_lines, num_blanks, problem_keywords):
     return temp_modified_lines
 
 
-def process_notebook(notebook_path, output_path_template, num_blanks_map):
+def process_notebook(notebook_path, output_path_template, num_blanks_map, as_overlay=False):
+    # as_overlay=True のときは、難易度別ノートブックの代わりに元のノートブックとの差分 (notebook_overlay.py の形式) を書き出す
+    # (output_path_template の .ipynb は .overlay.json に置き換える)
     try:
         with open(notebook_path, 'r', encoding='utf-8') as f:
             notebook_content = json.load(f)
@@ -345,8 +347,13 @@ def process_notebook(notebook_path, output_path_template, num_blanks_map):
         output_path = output_path_template.format(difficulty=difficulty)
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         try:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(new_notebook, f, indent=1, ensure_ascii=False)
+            if as_overlay:
+                from notebook_overlay import OVERLAY_SUFFIX, make_overlay, write_overlay
+                output_path = output_path.removesuffix(".ipynb") + OVERLAY_SUFFIX
+                write_overlay(make_overlay(notebook_path, new_notebook, output_path, trailing_newline=False), output_path)
+            else:
+                with open(output_path, 'w', encoding='utf-8') as f:
+                    json.dump(new_notebook, f, indent=1, ensure_ascii=False)
             print(f"Successfully generated: {output_path}")
         except IOError:
             print(f"Error: Could not write to output file {output_path}")
@@ -0,0 +1,354 @@
+"""
+LLMクライアントの呼び出しを計測するオプトインのラッパー。
+
+準備セルの「LLMクライアントの動的初期化」で作った `llm` (どのプロバイダーでもよい) に
+コールバックハンドラーを付け足すだけなので、`bind_tools` や `with_structured_output` などの使い方は変わらない。
+呼び出しごとに次の値を記録し、ノード単位のレポートにまとめる。
+
+*   リクエスト全体のレイテンシ
+*   最初のトークンが届くまでの時間 (TTFT, ストリーミング時のみ)
+*   ストリーミング時の出力速度 (tokens/sec)
+*   入力/出力トークン数と概算コスト
+*   どのグラフノードから呼ばれたか (LangGraph が付与する `langgraph_node` メタデータ)
+
+準備セルでの使い方 (「LLMクライアントの動的初期化」セルの末尾に追加):
+
+    ENABLE_LLM_METRICS = True
+    if ENABLE_LLM_METRICS:
+        from llm_metrics import LLMMetrics, instrument_llm
+        llm_metrics = LLMMetrics()
+        llm = instrument_llm(llm, llm_metrics)
+
+    # グラフ実行後
+    llm_metrics.print_report()
+
+このファイルを直接実行すると、Fake ストリーミングモデル (fake_llm.py) を使ってオフラインでデモを行う。
+    python llm_metrics.py
+"""
+import contextlib
+import contextvars
+import statistics
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# 100万トークンあたりの料金 (USD, 入力, 出力)。各ノートブックの既定モデルの参考値なので、最新の価格は各社の料金ページで確認すること。
+PRICING_PER_MILLION_TOKENS = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "claude-3-haiku-20240307": (0.25, 1.25),
+    "anthropic.claude-3-haiku-20240307-v1:0": (0.25, 1.25),
+}
+
+# グラフの外 (ノートブックのセルから直接 llm.invoke した場合など) で呼ばれたときのノード名
+OUTSIDE_GRAPH = "(グラフ外)"
+
+_current_run_label = contextvars.ContextVar("llm_metrics_run_label", default=None)
+
+
+@dataclass
+class LLMCallRecord:
+    """LLM呼び出し1回分の計測結果。"""
+    node: str
+    model: Optional[str]
+    run_label: Optional[str]
+    latency: float
+    ttft: Optional[float] = None
+    streamed_tokens: int = 0
+    tokens_per_sec: Optional[float] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cost: Optional[float] = None
+    error: Optional[str] = None
+
+
+class LLMMetricsCallbackHandler(BaseCallbackHandler):
+    """チャットモデルのコールバックを受け取り、呼び出しごとの計測結果を LLMMetrics に渡すハンドラー。"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, metadata, invocation_params):
+        metadata = metadata or {}
+        invocation_params = invocation_params or {}
+        model = (
+            metadata.get("ls_model_name")
+            or invocation_params.get("model")
+            or invocation_params.get("model_name")
+            or invocation_params.get("model_id")
+        )
+        with self._lock:
+            self._in_flight[run_id] = {
+                "start": time.perf_counter(),
+                "first_token": None,
+                "last_token": None,
+                "streamed_tokens": 0,
+                "node": metadata.get("langgraph_node", OUTSIDE_GRAPH),
+                "model": model,
+                "run_label": _current_run_label.get(),
+            }
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, tags=None,
+                            metadata=None, **kwargs):
+        self._start(run_id, metadata, kwargs.get("invocation_params"))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, tags=None,
+                     metadata=None, **kwargs):
+        self._start(run_id, metadata, kwargs.get("invocation_params"))
+
+    def on_llm_new_token(self, token, *, chunk=None, run_id, parent_run_id=None, **kwargs):
+        # ツール呼び出しのみのチャンクや終端の空チャンクはトークンとして数えない
+        if not token:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            call = self._in_flight.get(run_id)
+            if call is None:
+                return
+            if call["first_token"] is None:
+                call["first_token"] = now
+            call["last_token"] = now
+            call["streamed_tokens"] += 1
+
+    def on_llm_end(self, response, *, run_id, parent_run_id=None, **kwargs):
+        end = time.perf_counter()
+        with self._lock:
+            call = self._in_flight.pop(run_id, None)
+        if call is None:
+            return
+        prompt_tokens, completion_tokens = _extract_token_usage(response)
+        self.metrics.add(_make_record(call, end, prompt_tokens, completion_tokens, self.metrics.pricing))
+
+    def on_llm_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        end = time.perf_counter()
+        with self._lock:
+            call = self._in_flight.pop(run_id, None)
+        if call is None:
+            return
+        record = _make_record(call, end, None, None, self.metrics.pricing)
+        record.error = f"{type(error).__name__}: {error}"
+        self.metrics.add(record)
+
+
+def _extract_token_usage(response):
+    """LLMResult から (入力トークン数, 出力トークン数) を取り出す。取得できない場合は None。"""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens"), usage.get("output_tokens")
+    # usage_metadata に対応していない古いクライアント向け (OpenAI 形式の token_usage)
+    token_usage = (response.llm_output or {}).get("token_usage") or {}
+    if token_usage:
+        return token_usage.get("prompt_tokens"), token_usage.get("completion_tokens")
+    return None, None
+
+
+def _make_record(call, end, prompt_tokens, completion_tokens, pricing):
+    ttft = None
+    tokens_per_sec = None
+    if call["first_token"] is not None:
+        ttft = call["first_token"] - call["start"]
+        stream_duration = call["last_token"] - call["first_token"]
+        if call["streamed_tokens"] > 1 and stream_duration > 0:
+            tokens_per_sec = (call["streamed_tokens"] - 1) / stream_duration
+    cost = None
+    price = pricing.get(call["model"])
+    if price and prompt_tokens is not None and completion_tokens is not None:
+        cost = (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+    return LLMCallRecord(
+        node=call["node"],
+        model=call["model"],
+        run_label=call["run_label"],
+        latency=end - call["start"],
+        ttft=ttft,
+        streamed_tokens=call["streamed_tokens"],
+        tokens_per_sec=tokens_per_sec,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cost=cost,
+    )
+
+
+class LLMMetrics:
+    """
+    LLM呼び出しの計測結果を集め、ノード単位のレポートにまとめる。
+
+    `track(label)` の中で実行した呼び出しにはラベルが付くため、グラフ実行1回分ごとにレポートを分けられる。
+    """
+
+    def __init__(self, pricing=None):
+        self.pricing = dict(PRICING_PER_MILLION_TOKENS)
+        self.pricing.update(pricing or {})
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def reset(self):
+        with self._lock:
+            self.records = []
+
+    @contextlib.contextmanager
+    def track(self, label):
+        """with ブロック内のLLM呼び出しに label を付けて記録する。"""
+        token = _current_run_label.set(label)
+        try:
+            yield self
+        finally:
+            _current_run_label.reset(token)
+
+    def get_records(self, label=None):
+        with self._lock:
+            records = list(self.records)
+        if label is None:
+            return records
+        return [r for r in records if r.run_label == label]
+
+    def report(self, label=None):
+        """
+        ノード名をキーにした集計結果の辞書を返す。"__total__" キーには全ノードの合計が入る。
+        """
+        records = self.get_records(label)
+        by_node = {}
+        for record in records:
+            by_node.setdefault(record.node, []).append(record)
+        report = {node: _summarize(node_records) for node, node_records in by_node.items()}
+        if records:
+            report["__total__"] = _summarize(records)
+        return report
+
+    def print_report(self, label=None):
+        report = self.report(label)
+        title = f"--- LLM呼び出しレポート{f' ({label})' if label else ''} ---"
+        print(title)
+        if not report:
+            print("  記録されたLLM呼び出しはありません。")
+            return
+        print(f"{'ノード':<20} {'回数':>4} {'平均[s]':>8} {'p95[s]':>8} {'TTFT[s]':>8} {'tok/s':>8} {'入力tok':>8} {'出力tok':>8} {'コスト[$]':>10} {'エラー':>6}")
+        for node, row in report.items():
+            name = "合計" if node == "__total__" else node
+            print(
+                f"{name:<20} {row['calls']:>4d} {row['avg_latency']:>8.3f} {row['p95_latency']:>8.3f} "
+                f"{_fmt(row['avg_ttft'], '.3f'):>8} {_fmt(row['avg_tokens_per_sec'], '.1f'):>8} "
+                f"{row['prompt_tokens']:>8d} {row['completion_tokens']:>8d} {_fmt(row['cost'], '.6f'):>10} {row['errors']:>6d}"
+            )
+
+
+def _fmt(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return statistics.mean(values) if values else None
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _summarize(records):
+    costs = [r.cost for r in records if r.cost is not None]
+    return {
+        "calls": len(records),
+        "errors": sum(1 for r in records if r.error),
+        "total_latency": sum(r.latency for r in records),
+        "avg_latency": statistics.mean(r.latency for r in records),
+        "p95_latency": _percentile([r.latency for r in records], 0.95),
+        "avg_ttft": _mean(r.ttft for r in records),
+        "avg_tokens_per_sec": _mean(r.tokens_per_sec for r in records),
+        "prompt_tokens": sum(r.prompt_tokens or 0 for r in records),
+        "completion_tokens": sum(r.completion_tokens or 0 for r in records),
+        "cost": sum(costs) if costs else None,
+    }
+
+
+def instrument_llm(llm, metrics=None):
+    """
+    llm に計測用のコールバックハンドラーを追加したコピーを返す。元の llm は変更しない。
+    metrics を省略した場合は新しい LLMMetrics を作り、`llm.callbacks` のハンドラー経由で参照できる。
+    """
+    metrics = metrics if metrics is not None else LLMMetrics()
+    handler = LLMMetricsCallbackHandler(metrics)
+    existing = llm.callbacks
+    if existing is None:
+        callbacks = [handler]
+    elif isinstance(existing, list):
+        callbacks = existing + [handler]
+    else:
+        # CallbackManager が設定されている場合
+        callbacks = existing.copy()
+        callbacks.add_handler(handler, inherit=True)
+    return llm.model_copy(update={"callbacks": callbacks})
+
+
+def get_metrics(llm):
+    """instrument_llm で計測を有効にした llm から LLMMetrics を取り出す。"""
+    callbacks = llm.callbacks or []
+    handlers = callbacks if isinstance(callbacks, list) else callbacks.handlers
+    for handler in handlers:
+        if isinstance(handler, LLMMetricsCallbackHandler):
+            return handler.metrics
+    return None
+
+
+if __name__ == "__main__":
+    from typing import Annotated, TypedDict
+
+    from langchain_core.messages import HumanMessage
+    from langgraph.graph import END, StateGraph
+    from langgraph.graph.message import add_messages
+
+    from fake_llm import FakeStreamingChatModel
+
+    llm = FakeStreamingChatModel(
+        responses=[
+            "LangGraphはLLMアプリケーションをグラフとして構築するためのライブラリです。",
+            "要約: LangGraphでグラフ型のLLMアプリを作れます。",
+        ],
+        model_name="gpt-4o-mini",  # 料金表の参考値でコストを概算させる
+        first_token_latency=0.2,
+        token_latency=0.01,
+    )
+    llm_metrics = LLMMetrics()
+    llm = instrument_llm(llm, llm_metrics)
+
+    class DemoState(TypedDict):
+        messages: Annotated[list, add_messages]
+
+    def answer_node(state: DemoState):
+        return {"messages": [llm.invoke(state["messages"])]}
+
+    def summary_node(state: DemoState):
+        return {"messages": [llm.invoke(state["messages"] + [HumanMessage(content="一文で要約してください。")])]}
+
+    workflow = StateGraph(DemoState)
+    workflow.add_node("answer", answer_node)
+    workflow.add_node("summary", summary_node)
+    workflow.set_entry_point("answer")
+    workflow.add_edge("answer", "summary")
+    workflow.add_edge("summary", END)
+    graph = workflow.compile()
+
+    # invoke では TTFT は記録されず、stream_mode="messages" ではトークン単位で届くため TTFT と tokens/sec が記録される
+    with llm_metrics.track("invoke"):
+        graph.invoke({"messages": [HumanMessage(content="LangGraphとは？")]})
+    with llm_metrics.track("stream"):
+        for _ in graph.stream({"messages": [HumanMessage(content="LangGraphとは？")]}, stream_mode="messages"):
+            pass
+
+    llm_metrics.print_report("invoke")
+    print()
+    llm_metrics.print_report("stream")
@@ -0,0 +1,359 @@
+"""
+各ノートブックの準備セル (APIキー/環境変数の設定、LLMクライアントの初期化) を1つにまとめた共通モジュール。
+
+これまでは各ノートブックに、全プロバイダー分の環境変数チェックとクライアント初期化のコードが貼り付けられていた。
+このモジュールでは次のようにしている。
+
+*   プロバイダーの SDK (langchain_openai など) は、そのプロバイダーのクライアントを初めて作るときに import する
+    (このモジュール自体の import は標準ライブラリだけなので軽い)
+*   APIキーは環境変数 → .env (python-dotenv がある場合) → Google Colab のシークレットの順に探す
+*   setup_llm は代理オブジェクト (LazyLLM) を返し、SDK の import とクライアントの作成は llm を初めて使うときに行う
+    (準備セルはすぐに終わり、LLM を使わないセルだけを実行するときは SDK を import しない)
+*   クライアントは (プロバイダー, モデル, パラメーター) ごとにメモ化し、同じ設定で何度呼んでも同じインスタンスを返す
+*   各 SDK の import にかかった時間を import_timings() で確認できる
+
+ノートブックでの使い方 (準備セル):
+
+    LLM_PROVIDER = "openai"
+    from llm_setup import setup_llm; llm = setup_llm(LLM_PROVIDER)
+
+`LLM_PROVIDER = "offline"` を指定すると、APIキーなしで fake_llm.py の Fake チャットモデルを使う。
+("fake" という名前は、ノートブックの `if LLM_PROVIDER != "fake":` で LLM を使うセルを飛ばすために使われているため避けている)
+
+このファイルを直接実行すると、このモジュールの import 時間とプロバイダー SDK の import 時間、メモ化の効果、
+カーネルの起動から最初の LLM 呼び出しまでの時間 (クライアントをすぐに作る場合と初回利用時に作る場合) を表示する。
+    python llm_setup.py
+"""
+import importlib
+import os
+import sys
+import threading
+import time
+
+SUPPORTED_PROVIDERS = ("openai", "azure", "google", "google_genai", "anthropic", "bedrock", "offline")
+
+DEFAULT_MODELS = {
+    "openai": "gpt-4o-mini",
+    "azure": None,  # デプロイメント名 (AZURE_OPENAI_DEPLOYMENT_NAME) を使う
+    "google": "gemini-2.0-flash",
+    "google_genai": "gemini-2.0-flash",
+    "anthropic": "claude-3-haiku-20240307",
+    "bedrock": "anthropic.claude-3-haiku-20240307-v1:0",
+    "offline": "fake-streaming-chat",
+}
+
+# プロバイダー -> (クライアントのモジュール, クラス名)
+CLIENT_CLASSES = {
+    "openai": ("langchain_openai", "ChatOpenAI"),
+    "azure": ("langchain_openai", "AzureChatOpenAI"),
+    "google": ("langchain_google_vertexai", "ChatVertexAI"),
+    "google_genai": ("langchain_google_genai", "ChatGoogleGenerativeAI"),
+    "anthropic": ("langchain_anthropic", "ChatAnthropic"),
+    "bedrock": ("langchain_aws", "ChatBedrock"),
+    "offline": ("fake_llm", "FakeStreamingChatModel"),
+}
+
+_import_timings = {}
+_clients = {}
+_proxies = {}  # setup_llm が返した LazyLLM (キーは _clients と同じ)
+_lock = threading.RLock()
+_dotenv_loaded = False
+_colab_userdata = None
+_colab_probed = False
+
+
+def import_timings():
+    """このモジュール経由で初めて import したモジュールごとの import 時間 (秒) を返す。"""
+    return dict(_import_timings)
+
+
+def _lazy_import(module_name):
+    """モジュールを import し、初回の import 時間を記録する。"""
+    already_loaded = module_name in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if not already_loaded and module_name not in _import_timings:
+        _import_timings[module_name] = time.perf_counter() - start
+    return module
+
+
+def _load_dotenv_once():
+    global _dotenv_loaded
+    if _dotenv_loaded:
+        return
+    _dotenv_loaded = True
+    try:
+        dotenv = _lazy_import("dotenv")
+    except ImportError:
+        return  # python-dotenv がなければ環境変数だけを使う
+    dotenv.load_dotenv()
+
+
+def _colab_secrets():
+    """Google Colab 上なら google.colab.userdata を、そうでなければ None を返す。"""
+    global _colab_userdata, _colab_probed
+    if not _colab_probed:
+        _colab_probed = True
+        try:
+            _colab_userdata = _lazy_import("google.colab.userdata")
+        except ImportError:
+            _colab_userdata = None
+    return _colab_userdata
+
+
+def get_secret(name, default=None):
+    """環境変数 (.env を含む) → Colab のシークレット の順に値を探す。"""
+    _load_dotenv_once()
+    value = os.environ.get(name)
+    if not value and _colab_secrets() is not None:
+        try:
+            value = _colab_secrets().get(name)
+        except Exception:
+            value = None
+    return value or default
+
+
+def _require(name, description):
+    value = get_secret(name)
+    if not value:
+        raise ValueError(
+            f"{description}が設定されていません。環境変数 {name} を設定するか、Colab環境の場合はシークレットに {name} を設定してください。"
+        )
+    return value
+
+
+def load_provider_env(provider):
+    """選択したプロバイダーに必要なAPIキー/環境変数を読み込み、SDK が参照する環境変数に設定する。"""
+    if provider not in SUPPORTED_PROVIDERS:
+        raise ValueError(f"Unsupported LLM_PROVIDER: {provider}. Please choose from {', '.join(repr(p) for p in SUPPORTED_PROVIDERS)}.")
+    if provider == "openai":
+        os.environ["OPENAI_API_KEY"] = _require("OPENAI_API_KEY", "OpenAI APIキー")
+    elif provider == "azure":
+        os.environ["AZURE_OPENAI_API_KEY"] = _require("AZURE_OPENAI_API_KEY", "Azure OpenAI APIキー")
+        os.environ["AZURE_OPENAI_ENDPOINT"] = _require("AZURE_OPENAI_ENDPOINT", "Azure OpenAI エンドポイント")
+        os.environ["OPENAI_API_VERSION"] = get_secret("OPENAI_API_VERSION", "2023-07-01-preview")
+        os.environ["AZURE_OPENAI_DEPLOYMENT_NAME"] = _require("AZURE_OPENAI_DEPLOYMENT_NAME", "Azure OpenAI デプロイメント名")
+    elif provider == "google":
+        os.environ["GOOGLE_CLOUD_PROJECT"] = _require("GOOGLE_CLOUD_PROJECT_ID", "Google Cloud Project ID")
+        os.environ["GOOGLE_CLOUD_LOCATION"] = get_secret("GOOGLE_CLOUD_LOCATION", "us-central1")
+        if _colab_secrets() is not None:
+            _lazy_import("google.colab.auth").authenticate_user()  # Vertex AI を使う場合は Colab での認証を推奨
+    elif provider == "google_genai":
+        os.environ["GOOGLE_API_KEY"] = _require("GOOGLE_API_KEY", "Google APIキー")
+    elif provider == "anthropic":
+        os.environ["ANTHROPIC_API_KEY"] = _require("ANTHROPIC_API_KEY", "Anthropic APIキー")
+    elif provider == "bedrock":
+        for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+            value = get_secret(name)  # IAMロールを使う場合は不要
+            if value:
+                os.environ[name] = value
+        region = _require("AWS_REGION_NAME", "AWSリージョン名")
+        os.environ["AWS_DEFAULT_REGION"] = region  # boto3が参照する標準的なリージョン環境変数名
+        os.environ["AWS_REGION"] = region
+
+
+def _client_class(provider):
+    module_name, class_name = CLIENT_CLASSES[provider]
+    return getattr(_lazy_import(module_name), class_name)
+
+
+def _create_client(provider, model, temperature, params):
+    cls = _client_class(provider)
+    if provider == "azure":
+        return cls(
+            azure_deployment=model or os.environ.get("AZURE_OPENAI_DEPLOYMENT_NAME"),
+            openai_api_version=os.environ.get("OPENAI_API_VERSION"),
+            temperature=temperature,
+            **params,
+        )
+    if provider == "google":
+        return cls(
+            model_name=model, temperature=temperature,
+            project=os.environ.get("GOOGLE_CLOUD_PROJECT"), location=os.environ.get("GOOGLE_CLOUD_LOCATION"),
+            **params,
+        )
+    if provider == "bedrock":
+        model_kwargs = dict(params.pop("model_kwargs", {}), temperature=temperature)
+        return cls(model_id=model, model_kwargs=model_kwargs, **params)
+    if provider == "offline":  # APIキー不要のローカルモデル (temperature は使わない)
+        params.setdefault("responses", ["これは Fake LLM の応答です。"])
+        return cls(model_name=model, **params)
+    return cls(model=model, temperature=temperature, **params)  # openai, google_genai, anthropic
+
+
+def get_llm(provider="openai", model=None, temperature=0, **params):
+    """
+    プロバイダーの LLM クライアントを返す。(provider, model, temperature, params) が同じなら、2回目以降は同じインスタンスを返す。
+    model を省略するとノートブックと同じ既定のモデルを使う。環境変数の読み込みは load_provider_env で先に行っておくこと。
+    """
+    if provider not in SUPPORTED_PROVIDERS:
+        raise ValueError(f"Unsupported LLM_PROVIDER: {provider}. Please choose from {', '.join(repr(p) for p in SUPPORTED_PROVIDERS)}.")
+    model = model or DEFAULT_MODELS[provider]
+    key = (provider, model, temperature, repr(sorted(params.items())))
+    with _lock:
+        if key not in _clients:
+            _clients[key] = _create_client(provider, model, temperature, dict(params))
+        return _clients[key]
+
+
+def describe_llm(llm):
+    """クライアントのモデル名を取り出す (ノートブックの初期化セルの表示と同じ)。"""
+    return (
+        getattr(llm, "model", None)
+        or getattr(llm, "model_name", None)
+        or getattr(llm, "model_id", None)
+        or getattr(llm, "azure_deployment", None)
+    )
+
+
+class LazyLLM:
+    """
+    初めて使われたときに get_llm でクライアントを作る代理オブジェクト (setup_llm が返す)。
+    属性の参照・メソッド呼び出し・`|` での連結・isinstance の判定は、作成したクライアントにそのまま委譲する。
+    """
+
+    __slots__ = ("_spec", "_client")
+
+    def __init__(self, provider, model, temperature, params):
+        object.__setattr__(self, "_spec", (provider, model, temperature, params))
+        object.__setattr__(self, "_client", None)
+
+    def _resolve(self):
+        client = self._client
+        if client is None:
+            provider, model, temperature, params = self._spec
+            client = get_llm(provider, model=model, temperature=temperature, **params)
+            object.__setattr__(self, "_client", client)
+        return client
+
+    @property
+    def is_loaded(self):
+        """クライアントを作成済みか (SDK を import 済みか)。"""
+        return self._client is not None
+
+    # isinstance(llm, BaseChatModel) などは __class__ を見るため、作成したクライアントのクラスを返す
+    __class__ = property(lambda self: self._resolve().__class__)
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
+    def __dir__(self):
+        return dir(self._resolve())
+
+    def __or__(self, other):
+        return self._resolve() | other
+
+    def __ror__(self, other):
+        return other | self._resolve()
+
+    def __repr__(self):
+        if self._client is not None:
+            return repr(self._client)
+        provider, model, _, _ = self._spec
+        return f"LazyLLM(provider={provider!r}, model={model!r}, 未作成)"
+
+
+def client_type_name(provider):
+    """プロバイダーのクライアントのクラス名 (SDK は import しない)。"""
+    module_name, class_name = CLIENT_CLASSES[provider]
+    return f"{module_name}.{class_name}"
+
+
+def setup_llm(provider="openai", model=None, temperature=0, verbose=True, lazy=True, **params):
+    """
+    ノートブックの準備セル用: 環境変数を読み込み、llm を返す。
+    lazy=True (既定) では LazyLLM を返し、SDK の import とクライアントの作成は llm を初めて使うときに行う。
+    同じ設定で呼び直すと同じ llm を返す。
+    """
+    load_provider_env(provider)
+    if not lazy:
+        llm = get_llm(provider, model=model, temperature=temperature, **params)
+    else:
+        model = model or DEFAULT_MODELS[provider]
+        key = (provider, model, temperature, repr(sorted(params.items())))
+        with _lock:
+            if key not in _proxies:
+                _proxies[key] = LazyLLM(provider, model, temperature, dict(params))
+            llm = _proxies[key]
+    if verbose:
+        print(f"LLM Provider: {provider}")
+        print(f"LLM Client Type: {client_type_name(provider)}" + (" (初めて使うときに作成します)" if lazy else ""))
+        model_name = model if lazy else describe_llm(llm)
+        print(f"LLM Model: {model_name or '(Could not determine model name from client attributes)'}")
+    return llm
+
+
+# ノートブックの準備セルと、LLM を使う最初のセルを模したもの (カーネルの起動から最初の呼び出しまでの計測用)
+_NOTEBOOK_SESSION = """
+import json, time
+marks = {}
+LLM_PROVIDER = "offline"
+from llm_setup import load_provider_env
+load_provider_env(LLM_PROVIDER)
+from llm_setup import setup_llm; llm = setup_llm(LLM_PROVIDER, verbose=False, lazy=%(lazy)r)
+marks["setup"] = time.time()
+response = llm.invoke("こんにちは")
+marks["first_call"] = time.time()
+print(json.dumps(marks))
+"""
+
+
+def measure_first_call(lazy, repeat=5):
+    """
+    新しいプロセス (カーネルの起動に相当) で準備セルと最初の LLM 呼び出しを実行し、
+    起動から準備セルの完了まで・最初の呼び出しの完了までの時間 (秒, 中央値) を返す。
+    """
+    import json
+    import statistics
+    import subprocess
+
+    setup_times, first_call_times = [], []
+    for _ in range(repeat):
+        started = time.time()
+        result = subprocess.run([sys.executable, "-c", _NOTEBOOK_SESSION % {"lazy": lazy}], capture_output=True,
+                                text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        marks = json.loads(result.stdout.strip().splitlines()[-1])
+        setup_times.append(marks["setup"] - started)
+        first_call_times.append(marks["first_call"] - started)
+    return statistics.median(setup_times), statistics.median(first_call_times)
+
+
+if __name__ == "__main__":
+    import subprocess
+
+    def measure_import(statement):
+        code = f"import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return float(result.stdout.strip()) if result.returncode == 0 else None
+
+    print("--- import 時間 (新しいプロセスで計測) ---")
+    print(f"import llm_setup: {measure_import('import llm_setup') * 1000:.1f} ms")
+    for provider, (module_name, _) in CLIENT_CLASSES.items():
+        if provider == "azure":
+            continue  # openai と同じモジュール
+        elapsed = measure_import(f"import {module_name}")
+        print(f"import {module_name} ({provider}): " + ("未インストール" if elapsed is None else f"{elapsed * 1000:.1f} ms"))
+
+    print("\n--- クライアントのメモ化 (offline プロバイダー) ---")
+    start = time.perf_counter()
+    first = setup_llm("offline")
+    first_time = time.perf_counter() - start
+    print(f"setup_llm の直後にクライアントを作成済みか: {first.is_loaded}")
+    start = time.perf_counter()
+    first.invoke("こんにちは")
+    invoke_time = time.perf_counter() - start
+    start = time.perf_counter()
+    second = setup_llm("offline", verbose=False)
+    second_time = time.perf_counter() - start
+    print(f"setup_llm: {first_time * 1000:.1f} ms / 最初の invoke (SDK の import を含む): {invoke_time * 1000:.1f} ms / "
+          f"2回目の setup_llm: {second_time * 1000:.3f} ms / 同じインスタンス: {first is second}")
+    print(f"import_timings(): { {name: round(sec * 1000, 1) for name, sec in import_timings().items()} } (ms)")
+
+    print("\n--- カーネルの起動から最初の LLM 呼び出しまで (offline プロバイダー, 新しいプロセス5回の中央値) ---")
+    for lazy, label in [(False, "準備セルでクライアントを作成"), (True, "初めて使うときに作成 (LazyLLM)")]:
+        setup_time, first_call_time = measure_first_call(lazy)
+        print(f"{label}: 準備セルの完了まで {setup_time * 1000:7.1f} ms / 最初の呼び出しの完了まで {first_call_time * 1000:7.1f} ms")
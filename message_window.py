@@ -0,0 +1,214 @@
+"""
+第5章 問題006 (カスタムリデューサー) の発展: 会話履歴を一定の長さに保つメッセージ用リデューサー。
+
+第3〜5章の状態は `messages: Annotated[list, add_messages]` で、会話が続くほど履歴が際限なく伸びる。
+チェックポインターを使うと毎ステップ履歴全体がシリアライズ・保存され、LLM にも毎回全体が送られるため、
+1ステップあたりのレイテンシとチェックポイントのサイズが会話の長さに比例して増えていく。
+
+`WindowedMessagesReducer` は add_messages と同じようにメッセージを追加・更新したあと、
+
+*   直近 max_messages 件、または max_tokens トークン以内に収まるように古いメッセージを落とす
+*   ツール呼び出し (tool_calls を持つ AIMessage) と対応する ToolMessage の組を分断しない (対応する呼び出しを失った ToolMessage は残さない)
+*   先頭の SystemMessage (システムプロンプト) と最新のメッセージは常に残す (最新のメッセージだけで上限を超える場合も)
+*   summarizer を指定すると、落としたメッセージを要約として1つの SystemMessage にまとめて残す
+
+使い方 (問題006と同じく Annotated にリデューサーを指定する):
+
+    from message_window import WindowedMessagesReducer
+    class ChatState(TypedDict):
+        messages: Annotated[list, WindowedMessagesReducer(max_messages=40)]
+
+LLM に要約させる場合は summarizer に (これまでの要約 or None, 落とすメッセージのリスト) -> 要約文字列 の関数を渡す。
+要約の呼び出し回数を抑えるため、fold_to を指定すると上限を超えたときに fold_to 件まで一度に畳み込む。
+
+このファイルを直接実行すると、1,000ターンの会話で add_messages とこのリデューサーの1ステップあたりのレイテンシと
+チェックポイントのサイズを比較する。
+    python message_window.py [--turns 1000]
+"""
+import argparse
+import time
+from typing import Annotated, TypedDict
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, StateGraph
+from langgraph.graph.message import add_messages
+
+SUMMARY_MESSAGE_ID = "__history_summary__"
+SUMMARY_PREFIX = "これまでの会話の要約:\n"
+
+
+def truncating_summarizer(previous_summary, dropped_messages, max_chars=2000):
+    """
+    LLM を使わない簡易要約: 落としたメッセージを「種類: 本文の先頭」の行にして、これまでの要約の後ろに追記し、末尾 max_chars 文字だけ残す。
+    """
+    lines = [previous_summary] if previous_summary else []
+    for message in dropped_messages:
+        text = message.content if isinstance(message.content, str) else str(message.content)
+        lines.append(f"{message.type}: {text[:80]}")
+    return "\n".join(lines)[-max_chars:]
+
+
+class WindowedMessagesReducer:
+    """
+    add_messages のあとに、履歴を max_messages 件 / max_tokens トークン以内に切り詰めるリデューサー。
+
+    - max_messages: 残す最大メッセージ数 (システムプロンプトと要約は数えない)。None なら件数では制限しない。
+    - max_tokens: 残すメッセージの合計トークン数の上限。None ならトークン数では制限しない。
+    - token_counter: メッセージのリスト -> トークン数 の関数 (省略時は langchain_core の count_tokens_approximately)。
+    - summarizer: (これまでの要約 or None, 落とすメッセージのリスト) -> 要約文字列 の関数。None なら落としたメッセージは捨てる。
+    - fold_to: 上限を超えたときに残す件数 (max_messages より小さくすると、要約の呼び出しが fold ごとにまとめて行われる)。
+
+    最新のメッセージ (ツール呼び出しの途中なら、呼び出した AIMessage 以降) は、それだけで上限を超えていても落とさない。
+    """
+
+    def __init__(self, max_messages=None, max_tokens=None, token_counter=None, summarizer=None, fold_to=None):
+        if max_messages is None and max_tokens is None:
+            raise ValueError("max_messages か max_tokens のどちらかを指定してください。")
+        if fold_to is not None and max_messages is not None and fold_to > max_messages:
+            raise ValueError("fold_to は max_messages 以下を指定してください。")
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter or count_tokens_approximately
+        self.summarizer = summarizer
+        self.fold_to = fold_to
+
+    def __call__(self, current_value, new_value):
+        messages = add_messages(current_value or [], new_value or [])
+        head, summary, body = self._split(messages)
+        if not self._over_limit(body):
+            return messages
+        target = self.fold_to if self.fold_to is not None else self.max_messages
+        cut = self._cut_index(body, target)
+        dropped, kept = body[:cut], body[cut:]
+        if self.summarizer is not None and dropped:
+            previous = summary.content[len(SUMMARY_PREFIX):] if summary is not None else None
+            summary = SystemMessage(content=SUMMARY_PREFIX + self.summarizer(previous, dropped), id=SUMMARY_MESSAGE_ID)
+        return head + ([summary] if summary is not None else []) + kept
+
+    def _split(self, messages):
+        """先頭の SystemMessage 群・要約メッセージ・それ以降の会話に分ける。"""
+        head_end = 0
+        while head_end < len(messages) and isinstance(messages[head_end], SystemMessage) and messages[head_end].id != SUMMARY_MESSAGE_ID:
+            head_end += 1
+        head, rest = messages[:head_end], messages[head_end:]
+        if rest and rest[0].id == SUMMARY_MESSAGE_ID:
+            return head, rest[0], rest[1:]
+        return head, None, rest
+
+    def _over_limit(self, body):
+        if self.max_messages is not None and len(body) > self.max_messages:
+            return True
+        return self.max_tokens is not None and self.token_counter(body) > self.max_tokens
+
+    def _cut_index(self, body, target):
+        """
+        body[cut:] が上限に収まり、かつ ToolMessage から始まらない最小の cut を返す。
+        ただし最新のメッセージ (ToolMessage で終わる場合は、それを呼び出した AIMessage から) は上限を超えていても必ず残す。
+        """
+        cut = 0
+        if target is not None:
+            cut = max(len(body) - target, 0)
+        if self.max_tokens is not None:
+            while cut < len(body) and self.token_counter(body[cut:]) > self.max_tokens:
+                cut += 1
+        # 対応する AIMessage (tool_calls) を落とした ToolMessage は残さない
+        while cut < len(body) and isinstance(body[cut], ToolMessage):
+            cut += 1
+        latest = len(body) - 1
+        while latest > 0 and isinstance(body[latest], ToolMessage):
+            latest -= 1
+        return min(cut, max(latest, 0))
+
+
+def check_tool_pairs(messages):
+    """すべての ToolMessage について、対応する tool_call を持つ AIMessage が手前に残っていれば True。"""
+    seen_call_ids = set()
+    for message in messages:
+        if isinstance(message, AIMessage):
+            seen_call_ids.update(tc["id"] for tc in message.tool_calls)
+        elif isinstance(message, ToolMessage) and message.tool_call_id not in seen_call_ids:
+            return False
+    return True
+
+
+# --- ベンチマーク ---
+
+def build_chat_graph(messages_reducer, checkpointer):
+    """
+    1ターンごとに (数ターンに1回はツール呼び出しを挟んで) 応答するだけのチャットグラフ。
+    応答ノードは LLM に渡す想定で履歴全体のトークン数を数えるため、履歴の長さがそのままノードの処理時間に表れる。
+    """
+
+    class ChatState(TypedDict):
+        messages: Annotated[list, messages_reducer]
+        turn: int
+
+    def chatbot_node(state: ChatState):
+        turn = state.get("turn", 0) + 1
+        prompt_tokens = count_tokens_approximately(state["messages"])
+        if turn % 5 == 0:
+            call_id = f"call_{turn}"
+            return {"turn": turn, "messages": [
+                AIMessage(content="", tool_calls=[{"name": "lookup", "args": {"turn": turn}, "id": call_id}]),
+                ToolMessage(content=f"ターン{turn}の検索結果", tool_call_id=call_id, name="lookup"),
+                AIMessage(content=f"検索結果を踏まえた回答です (入力 {prompt_tokens} トークン)。"),
+            ]}
+        return {"turn": turn, "messages": [AIMessage(content=f"ターン{turn}への回答です (入力 {prompt_tokens} トークン)。")]}
+
+    workflow = StateGraph(ChatState)
+    workflow.add_node("chatbot", chatbot_node)
+    workflow.set_entry_point("chatbot")
+    workflow.add_edge("chatbot", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def run_benchmark(messages_reducer, turns=1000, report_every=100):
+    """
+    1つのスレッドで turns ターンの会話を続け、report_every ターンごとに
+    (ターン, 直近 report_every ターンの平均レイテンシ, チェックポイントの状態のバイト数, 履歴の件数, ツールの組が保たれているか) を返す。
+    """
+    checkpointer = MemorySaver()
+    graph = build_chat_graph(messages_reducer, checkpointer)
+    config = {"configurable": {"thread_id": "window-benchmark"}}
+    graph.invoke({"messages": [SystemMessage(content="あなたは親切なアシスタントです。")], "turn": 0}, config)
+    rows, elapsed = [], 0.0
+    for turn in range(1, turns + 1):
+        start = time.perf_counter()
+        graph.invoke({"messages": [HumanMessage(content=f"ターン{turn}の質問です。LangGraphについて教えてください。")]}, config)
+        elapsed += time.perf_counter() - start
+        if turn % report_every == 0:
+            values = graph.get_state(config).values
+            _, checkpoint_bytes = checkpointer.serde.dumps_typed(values)
+            rows.append({
+                "turn": turn,
+                "avg_latency_ms": elapsed / report_every * 1000,
+                "checkpoint_bytes": len(checkpoint_bytes),
+                "messages": len(values["messages"]),
+                "tool_pairs_ok": check_tool_pairs(values["messages"]),
+            })
+            elapsed = 0.0
+    return rows
+
+
+def print_benchmark(label, rows):
+    print(f"\n[{label}]")
+    print(f"{'ターン':>6} {'平均レイテンシ[ms]':>18} {'チェックポイント[bytes]':>22} {'履歴件数':>8} {'ツールの組':>10}")
+    for row in rows:
+        print(f"{row['turn']:>6d} {row['avg_latency_ms']:>18.2f} {row['checkpoint_bytes']:>22d} {row['messages']:>8d} {str(row['tool_pairs_ok']):>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="会話履歴のウィンドウ化リデューサーのベンチマーク")
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--report-every", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"--- {args.turns}ターンの会話での1ステップあたりのレイテンシとチェックポイントのサイズ ---")
+    print_benchmark("add_messages (無制限)", run_benchmark(add_messages, args.turns, args.report_every))
+    print_benchmark("WindowedMessagesReducer(max_messages=40)",
+                    run_benchmark(WindowedMessagesReducer(max_messages=40), args.turns, args.report_every))
+    print_benchmark("WindowedMessagesReducer(max_messages=40, max_tokens=1000, fold_to=20, 簡易要約つき)",
+                    run_benchmark(WindowedMessagesReducer(max_messages=40, max_tokens=1000, summarizer=truncating_summarizer, fold_to=20),
+                                  args.turns, args.report_every))
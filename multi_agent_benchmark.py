@@ -0,0 +1,715 @@
+"""
+第4章 (問題002〜005) のマルチエージェント構成に対する、LLM呼び出し回数とレイテンシの回帰ベンチマーク。
+
+ルーティング用のプロンプトやエッジを少し変えただけで、スーパーバイザーが余分に LLM を往復させるようになることがある。
+本番ではそのままコストとレイテンシの増加につながるため、各解答例と同じグラフ構成を
+1回あたり一定の遅延を持つ台本どおりの Fake LLM (fake_llm.py) で実行し、次の値を基準値と比較する。
+
+*   ノードごとの LLM 呼び出し回数 (llm_metrics.py で計測)
+*   タスクごとのスーパーステップ数
+*   LLM 呼び出しの遅延から求めたエンドツーエンドの模擬レイテンシ
+
+いずれかが基準値より増えた場合は終了コード1で終了する。
+
+解答例のセルはノートブックの説明用の出力 (print) やツール呼び出しを含み、Markdown の中のコードとしてはそのまま実行できないため、
+ここではノード構成・ルーティング・LLM を呼ぶ箇所 (LLM_PROVIDER != "fake" の分岐) を解答例どおりに保ったまま、
+グラフを関数として組み直している。
+写しが解答例からずれていないかは、実行のたびに 4_multi_agent.ipynb の `<summary>解答00N</summary>` のコードと比べて確認する
+(ノード名・エッジ・条件付きエッジの行き先・LLM を呼ぶ箇所の数・スーパーバイザーのシステムプロンプト)。
+解答例を変更してこの確認が失敗したら、こちらの写しを合わせて更新してから基準値と比較すること。
+
+    python multi_agent_benchmark.py                    # 基準値と比較
+    python multi_agent_benchmark.py --update-baseline  # 基準値を更新
+"""
+import argparse
+import ast
+import inspect
+import json
+import os
+import re
+import sys
+import time
+from typing import Annotated, Any, Dict, List, Literal, Optional, TypedDict
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
+
+from fake_llm import FakeStreamingChatModel
+from llm_metrics import LLMMetrics, instrument_llm
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "multi_agent_benchmark_baseline.json")
+NOTEBOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "4_multi_agent.ipynb")
+
+# Fake LLM の1回あたりの遅延 (秒)
+LLM_CALL_DELAY = 0.05
+
+
+# --- 台本どおりに応答する Fake LLM ---
+
+def scripted_response(messages):
+    """
+    各解答例のプロンプトに対して、本物の LLM が返しそうな応答を決め打ちで返す。
+    スーパーバイザーのシステムプロンプトにはキーワードでルーティング判断を返し、それ以外には短い文章を返す。
+    """
+    system_text = " ".join(m.content for m in messages if isinstance(m, SystemMessage))
+    user_text = messages[-1].content if messages else ""
+    if "スーパーバイザー" in system_text:
+        if any(kw in user_text for kw in ["調べ", "調査"]):
+            return f"DelegateToResearcher: {user_text}"
+        if any(kw in user_text for kw in ["書い", "記事", "執筆"]):
+            return f"DelegateToWriter: {user_text}"
+        return "RespondToUser: こんにちは！ご用件は何でしょう？"
+    if "最終報告" in user_text:
+        return "最終報告: 各サブタスクの結果をまとめました。"
+    return "ご依頼の内容に沿って記事を作成しました。"
+
+
+def build_scripted_llm(delay=LLM_CALL_DELAY):
+    return FakeStreamingChatModel(respond=scripted_response, first_token_latency=delay)
+
+
+# --- 問題002: スーパーバイザーによるタスク割り振り ---
+
+class SupervisorAgentState(TypedDict):
+    messages: Annotated[List[BaseMessage], add_messages]
+    user_request: str
+    next_action: Optional[Literal["DelegateToResearcher", "DelegateToWriter", "RespondToUser", "FINISH"]]
+    research_task_description: Optional[str]
+    research_result: Optional[str]
+    writing_task_description: Optional[str]
+    final_draft: Optional[str]
+    supervisor_response: Optional[str]
+
+
+SUPERVISOR_SYSTEM_PROMPT = (
+    "あなたはタスクを分析し、リサーチャー、ライター、または自分自身（ユーザーへの応答）のいずれに "
+    "処理を割り振るかを決定するスーパーバイザーです。"
+    "可能なアクションは、「DelegateToResearcher: [調査指示]」、「DelegateToWriter: [執筆指示]」、"
+    "「RespondToUser: [ユーザーへの直接応答内容]」、「FINISH」のいずれかの形式で答えてください。"
+    "指示や応答内容には必ず具体的な内容を入れてください。"
+    "例1: ユーザーが「明日の東京の天気を調べて」と依頼したら、「DelegateToResearcher: 明日の東京の天気調査」と応答します。"
+    "例2: ユーザーが「AI倫理に関する記事を書いて」と依頼したら、「DelegateToWriter: AI倫理に関する記事執筆」と応答します。"
+    "例3: ユーザーが「こんにちは」と挨拶したら、「RespondToUser: こんにちは！ご用件は何でしょう？」と応答します。"
+)
+
+
+def build_q2_supervisor_graph(llm, route_decision=None):
+    """
+    route_decision を指定すると、スーパーバイザーの判断 (メッセージのリスト -> 判断文字列) をその関数で求める
+    (router_cache.CachedRouter を差し込む場合など)。省略時は llm を直接呼び出す。
+    """
+    def supervisor_agent(state: SupervisorAgentState) -> dict:
+        user_req = state.get("user_request") or state["messages"][-1].content
+        routing_messages = [SystemMessage(content=SUPERVISOR_SYSTEM_PROMPT), HumanMessage(content=user_req)]
+        if route_decision is None:
+            decision_text = llm.invoke(routing_messages).content.strip()
+        else:
+            decision_text = route_decision(routing_messages, workers=("researcher", "writer", "user_responder")).strip()
+        next_act, research_desc, write_desc, sup_resp = "RespondToUser", None, None, None
+        if decision_text.startswith("DelegateToResearcher:"):
+            next_act = "DelegateToResearcher"
+            research_desc = decision_text.replace("DelegateToResearcher:", "").strip() or user_req
+        elif decision_text.startswith("DelegateToWriter:"):
+            next_act = "DelegateToWriter"
+            write_desc = decision_text.replace("DelegateToWriter:", "").strip() or user_req
+        elif decision_text.startswith("RespondToUser:"):
+            sup_resp = decision_text.replace("RespondToUser:", "").strip()
+        elif decision_text == "FINISH":
+            next_act = "FINISH"
+        return {
+            "messages": [AIMessage(content=f"スーパーバイザー判断: {next_act}", name="Supervisor")],
+            "next_action": next_act,
+            "research_task_description": research_desc,
+            "writing_task_description": write_desc,
+            "supervisor_response": sup_resp,
+        }
+
+    def simple_researcher_node(state: SupervisorAgentState) -> dict:
+        result = f"「{state.get('research_task_description')}」に関するダミー調査結果です。"
+        return {"messages": [AIMessage(content=result, name="Researcher")], "research_result": result, "next_action": "FINISH"}
+
+    def simple_writer_node(state: SupervisorAgentState) -> dict:
+        input_for_writing = f"執筆指示: {state.get('writing_task_description')}\n"
+        if state.get("research_result"):
+            input_for_writing += f"利用可能な調査結果: {state['research_result'][:150]}...\n"
+        draft = llm.invoke(f"以下の指示と情報に基づいて記事を作成してください。\n{input_for_writing}").content
+        return {"messages": [AIMessage(content=draft, name="Writer")], "final_draft": draft, "next_action": "FINISH"}
+
+    def user_responder_node(state: SupervisorAgentState) -> dict:
+        return {"messages": [AIMessage(content=state.get("supervisor_response") or "", name="SupervisorDirectResponse")], "next_action": "FINISH"}
+
+    def route_by_supervisor_decision(state: SupervisorAgentState) -> str:
+        decision = state.get("next_action")
+        if decision == "DelegateToResearcher": return "researcher"
+        if decision == "DelegateToWriter": return "writer"
+        if decision == "RespondToUser": return "user_responder"
+        return END
+
+    workflow = StateGraph(SupervisorAgentState)
+    workflow.add_node("supervisor", supervisor_agent)
+    workflow.add_node("researcher", simple_researcher_node)
+    workflow.add_node("writer", simple_writer_node)
+    workflow.add_node("user_responder", user_responder_node)
+    workflow.set_entry_point("supervisor")
+    workflow.add_conditional_edges(
+        "supervisor", route_by_supervisor_decision,
+        {"researcher": "researcher", "writer": "writer", "user_responder": "user_responder", END: END},
+    )
+    workflow.add_conditional_edges("researcher", route_by_supervisor_decision, {END: END})
+    workflow.add_conditional_edges("writer", route_by_supervisor_decision, {END: END})
+    workflow.add_conditional_edges("user_responder", route_by_supervisor_decision, {END: END})
+    return workflow.compile(checkpointer=MemorySaver())
+
+
+def q2_inputs(request):
+    return {
+        "messages": [HumanMessage(content=request)], "user_request": request,
+        "next_action": None, "research_task_description": None, "research_result": None,
+        "writing_task_description": None, "final_draft": None, "supervisor_response": None,
+    }
+
+
+# --- 問題003: スーパーバイザーによる逐次連携ワークフロー ---
+
+class SequentialWorkflowState(TypedDict):
+    messages: Annotated[List[BaseMessage], add_messages]
+    user_request: str
+    current_phase: Optional[Literal["PLANNING", "RESEARCHING", "WRITING", "REVIEWING", "DONE", "ERROR"]]
+    research_topic: Optional[str]
+    research_findings: Optional[str]
+    article_draft: Optional[str]
+    review_comments: Optional[str]
+    final_product: Optional[str]
+    error_message: Optional[str]
+
+
+def build_q3_sequential_graph(llm):
+    # 解答例のスーパーバイザー・プランナーはルールベースで LLM を呼ばない。呼び出しが増えたら回帰として検出される。
+    def supervisor_planner_node(state: SequentialWorkflowState) -> dict:
+        current_phase = state.get("current_phase")
+        if not current_phase:
+            user_req = state.get("user_request", "")
+            match = re.search(r"「([^」]+)」について", user_req)
+            topic = match.group(1) if match else user_req[:30]
+            return {"current_phase": "RESEARCHING", "research_topic": topic,
+                    "messages": [AIMessage(content=f"計画: 「{topic}」の調査を開始します。", name="Supervisor")]}
+        update = {}
+        next_phase = None
+        if current_phase == "RESEARCHING" and state.get("research_findings"):
+            next_phase = "WRITING"
+        elif current_phase == "WRITING" and state.get("article_draft"):
+            next_phase = "REVIEWING"
+        elif current_phase == "REVIEWING" and state.get("review_comments"):
+            next_phase = "DONE"
+            update["final_product"] = state.get("article_draft")
+        if state.get("error_message") and not next_phase:
+            next_phase = "ERROR"
+        if next_phase:
+            update["current_phase"] = next_phase
+            update["messages"] = [AIMessage(content=f"次のフェーズ: {next_phase}", name="Supervisor")]
+        return update
+
+    def research_node(state: SequentialWorkflowState) -> dict:
+        findings = f"「{state['research_topic']}」に関するダミー調査結果。ポイントX, Y, Z。"
+        return {"research_findings": findings, "messages": [AIMessage(content=findings, name="Researcher")]}
+
+    def writing_node(state: SequentialWorkflowState) -> dict:
+        draft = f"タイトル: {state['research_topic']}の全貌\n\n{state['research_findings']}"
+        return {"article_draft": draft, "messages": [AIMessage(content=draft, name="Writer")]}
+
+    def review_node(state: SequentialWorkflowState) -> dict:
+        comments = "素晴らしい内容です。改善点は特に見当たりません。"
+        return {"review_comments": comments, "messages": [AIMessage(content=comments, name="Reviewer")]}
+
+    def error_node(state: SequentialWorkflowState) -> dict:
+        return {"messages": [AIMessage(content=f"エラー発生: {state.get('error_message')}", name="Error Handler")]}
+
+    def route_by_phase(state: SequentialWorkflowState) -> str:
+        phase = state.get("current_phase")
+        if phase == "RESEARCHING": return "researcher"
+        if phase == "WRITING": return "writer"
+        if phase == "REVIEWING": return "reviewer"
+        if phase == "DONE": return END
+        if phase == "ERROR": return "error_handler"
+        return "supervisor_planner"
+
+    workflow = StateGraph(SequentialWorkflowState)
+    workflow.add_node("supervisor_planner", supervisor_planner_node)
+    workflow.add_node("researcher", research_node)
+    workflow.add_node("writer", writing_node)
+    workflow.add_node("reviewer", review_node)
+    workflow.add_node("error_handler", error_node)
+    workflow.set_entry_point("supervisor_planner")
+    workflow.add_conditional_edges(
+        "supervisor_planner", route_by_phase,
+        {"researcher": "researcher", "writer": "writer", "reviewer": "reviewer",
+         "supervisor_planner": "supervisor_planner", END: END, "error_handler": "error_handler"},
+    )
+    workflow.add_edge("researcher", "supervisor_planner")
+    workflow.add_edge("writer", "supervisor_planner")
+    workflow.add_edge("reviewer", "supervisor_planner")
+    workflow.add_edge("error_handler", END)
+    return workflow.compile(checkpointer=MemorySaver())
+
+
+def q3_inputs(request):
+    return {
+        "messages": [HumanMessage(content=request)], "user_request": request,
+        "current_phase": None, "research_topic": None, "research_findings": None,
+        "article_draft": None, "review_comments": None, "final_product": None, "error_message": None,
+    }
+
+
+# --- 問題004: 階層型エージェント ---
+
+class HierarchicalAgentState(TypedDict):
+    messages: Annotated[List[BaseMessage], add_messages]
+    main_task_description: str
+    sub_tasks: Optional[List[Dict[str, Any]]]
+    final_aggregated_result: Optional[str]
+
+
+def build_q4_hierarchical_graph(llm):
+    def manager_decomposer_node(state: HierarchicalAgentState) -> dict:
+        task = state["main_task_description"]
+        if "天気" in task and ("観光" in task or "スポット" in task) and "レポート" in task:
+            location = "大阪" if "大阪" in task else "東京"
+            sub_tasks = [
+                {"id": "task_weather", "instruction": f"{location}の今日の天気調査", "assigned_to": "WeatherWorker", "status": "pending", "result": None, "dependencies": []},
+                {"id": "task_spots", "instruction": f"{location}の主要観光スポット3箇所調査", "assigned_to": "TourismWorker", "status": "pending", "result": None, "dependencies": []},
+                {"id": "task_report", "instruction": f"{location}の天気と観光スポットに関する統合レポート作成", "assigned_to": "ReportWriter", "status": "pending", "result": None, "dependencies": ["task_weather", "task_spots"]},
+            ]
+        else:
+            sub_tasks = [{"id": "task_general", "instruction": task, "assigned_to": "GeneralWorker", "status": "pending", "result": None, "dependencies": []}]
+        return {"sub_tasks": sub_tasks, "messages": [AIMessage(content=f"タスクを{len(sub_tasks)}個のサブタスクに分解しました。", name="ManagerDecomposer")]}
+
+    def manager_executor_coordinator_node(state: HierarchicalAgentState) -> dict:
+        # 解答例と同じく、1回の呼び出しで実行可能なサブタスクを1つだけ実行してマネージャーに戻る
+        updated = [st.copy() for st in state.get("sub_tasks", [])]
+        for task in updated:
+            if task["status"] != "pending":
+                continue
+            deps = {d: next((st for st in updated if st["id"] == d), None) for d in task.get("dependencies", [])}
+            if all(dep and dep["status"] == "completed" for dep in deps.values()):
+                task["result"] = f"ワーカー「{task['assigned_to']}」による「{task['instruction'][:20]}」の実行結果。"
+                task["status"] = "completed"
+                break
+        return {"sub_tasks": updated, "messages": [AIMessage(content="サブタスク実行調整中...", name="ManagerCoordinator")]}
+
+    def manager_aggregator_node(state: HierarchicalAgentState) -> dict:
+        sub_tasks = state.get("sub_tasks", [])
+        final_report = "統合最終報告書:\n" + "\n".join(f"- {t['instruction'][:30]}: {t['result']}" for t in sub_tasks)
+        if any(st["status"] == "completed" for st in sub_tasks):
+            final_report = llm.invoke(f"以下のサブタスクの実行結果を元に、ユーザーへの最終報告をまとめてください。\n{final_report}").content
+        return {"final_aggregated_result": final_report, "messages": [AIMessage(content=final_report, name="ManagerAggregator")]}
+
+    def route_hierarchical_manager_actions(state: HierarchicalAgentState) -> str:
+        sub_tasks = state.get("sub_tasks")
+        if not sub_tasks:
+            return "manager_decomposer_node"
+        if all(task.get("status") == "completed" for task in sub_tasks):
+            return "manager_aggregator_node"
+        return "manager_coordinator_node"
+
+    workflow = StateGraph(HierarchicalAgentState)
+    workflow.add_node("manager_decomposer_node", manager_decomposer_node)
+    workflow.add_node("manager_coordinator_node", manager_executor_coordinator_node)
+    workflow.add_node("manager_aggregator_node", manager_aggregator_node)
+    route_map = {
+        "manager_decomposer_node": "manager_decomposer_node",
+        "manager_coordinator_node": "manager_coordinator_node",
+        "manager_aggregator_node": "manager_aggregator_node",
+    }
+    workflow.set_conditional_entry_point(route_hierarchical_manager_actions, route_map)
+    workflow.add_edge("manager_decomposer_node", "manager_coordinator_node")
+    workflow.add_conditional_edges("manager_coordinator_node", route_hierarchical_manager_actions, route_map)
+    workflow.add_edge("manager_aggregator_node", END)
+    return workflow.compile(checkpointer=MemorySaver())
+
+
+def q4_inputs(request):
+    return {"messages": [HumanMessage(content=request)], "main_task_description": request,
+            "sub_tasks": None, "final_aggregated_result": None}
+
+
+# --- 問題005: 協調型リサーチボット ---
+
+class CollaborativeResearchBotState(TypedDict):
+    messages: Annotated[List[BaseMessage], add_messages]
+    user_original_request: str
+    clarified_request: Optional[str]
+    research_plan: Optional[List[Dict[str, Any]]]
+    collected_data: Dict[str, Any]
+    analysis_summary: Optional[str]
+    report_draft: Optional[str]
+    final_report: Optional[str]
+    current_phase: Optional[str]
+    current_task_id_being_processed: Optional[str]
+    error_message_for_chapter4: Optional[str]
+
+
+def build_q5_collaborative_graph(llm):
+    def ui_agent_clarifier(state):
+        return {"clarified_request": state["user_original_request"], "current_phase": "PLANNING",
+                "messages": [AIMessage(content="リクエストを承りました。", name="UIAgent")]}
+
+    def planning_supervisor_agent(state):
+        req = state.get("clarified_request") or state["user_original_request"]
+
+        def task(task_id, assigned_to, deps):
+            return {"task_id": task_id, "instruction": f"{req} ({task_id})", "assigned_to": assigned_to,
+                    "status": "pending", "result": None, "dependencies": deps}
+
+        if "LangGraph" in req and "マルチエージェント" in req and ("ベストプラクティス" in req or "レポート" in req):
+            plan = [task("lg_ma_bp_search", "WebSearcher", []), task("lg_ma_ex_search", "WebSearcher", []),
+                    task("lg_ma_analysis", "DataAnalyst", ["lg_ma_bp_search", "lg_ma_ex_search"]),
+                    task("lg_ma_reporting", "ReportGenerator", ["lg_ma_analysis"])]
+        else:
+            plan = [task("generic_search_main", "WebSearcher", []),
+                    task("generic_report_main", "ReportGenerator", ["generic_search_main"])]
+        return {"research_plan": plan, "current_phase": "RESEARCHING", "collected_data": {},
+                "messages": [AIMessage(content=f"計画を立案しました: {len(plan)}ステップ。", name="PlannerSupervisor")]}
+
+    def complete_task(state, result, store_in_collected_data=True):
+        task_id = state.get("current_task_id_being_processed")
+        plan = [p.copy() for p in state.get("research_plan", [])]
+        for p in plan:
+            if p["task_id"] == task_id:
+                p["status"], p["result"] = "completed", result
+        update = {"research_plan": plan, "messages": [AIMessage(content=f"タスク「{task_id}」完了。", name="Worker")]}
+        if store_in_collected_data:
+            update["collected_data"] = {**state.get("collected_data", {}), task_id: result}
+        return update
+
+    def web_searcher_worker(state):
+        return complete_task(state, f"「{state.get('current_task_id_being_processed')}」に関するウェブ検索結果。")
+
+    def data_analyst_worker(state):
+        update = complete_task(state, "分析結果: パターンXと傾向Y。")
+        update["analysis_summary"] = "分析結果: パターンXと傾向Y。"
+        return update
+
+    def report_generator_worker(state):
+        update = complete_task(state, "最終レポート", store_in_collected_data=False)
+        update["report_draft"] = "最終レポート"
+        return update
+
+    def next_pending(state, worker):
+        pending = next((t for t in state.get("research_plan", []) if t["status"] == "pending" and t["assigned_to"] == worker), None)
+        if pending and all(state.get("collected_data", {}).get(d) for d in pending.get("dependencies", [])):
+            return pending
+        return None
+
+    def overall_supervisor_node(state):
+        phase = state.get("current_phase")
+        next_phase, next_task_id = None, None
+        if state.get("error_message_for_chapter4"):
+            next_phase = "ERROR"
+        elif phase == "PLANNING":
+            next_phase = "RESEARCHING"
+        elif phase in ("RESEARCHING", "ANALYZING", "REPORTING"):
+            worker = {"RESEARCHING": "WebSearcher", "ANALYZING": "DataAnalyst", "REPORTING": "ReportGenerator"}[phase]
+            pending = next_pending(state, worker)
+            if pending:
+                next_phase, next_task_id = phase, pending["task_id"]
+            elif phase == "RESEARCHING":
+                next_phase = "ANALYZING"
+            elif phase == "ANALYZING":
+                next_phase = "REPORTING"
+            else:
+                return {"current_phase": "DONE", "final_report": state.get("report_draft"),
+                        "messages": [AIMessage(content="全レポート作成完了。", name="OverallSupervisor")]}
+        if next_phase:
+            return {"current_phase": next_phase, "current_task_id_being_processed": next_task_id,
+                    "messages": [AIMessage(content=f"次フェーズ: {next_phase}", name="OverallSupervisor")]}
+        return {"messages": [AIMessage(content=f"フェーズ「{phase}」で待機中。", name="OverallSupervisor")]}
+
+    def route_by_current_phase(state):
+        phase = state.get("current_phase")
+        task_id = state.get("current_task_id_being_processed")
+        if phase in ("ERROR", "DONE"):
+            return END
+        if task_id:
+            task = next((t for t in state.get("research_plan", []) if t["task_id"] == task_id and t["status"] == "pending"), None)
+            if task:
+                return {"WebSearcher": "web_searcher", "DataAnalyst": "data_analyst", "ReportGenerator": "report_generator"}[task["assigned_to"]]
+        return "overall_supervisor"
+
+    workflow = StateGraph(CollaborativeResearchBotState)
+    workflow.add_node("ui_agent", ui_agent_clarifier)
+    workflow.add_node("planner_supervisor", planning_supervisor_agent)
+    workflow.add_node("overall_supervisor", overall_supervisor_node)
+    workflow.add_node("web_searcher", web_searcher_worker)
+    workflow.add_node("data_analyst", data_analyst_worker)
+    workflow.add_node("report_generator", report_generator_worker)
+    workflow.set_entry_point("ui_agent")
+    workflow.add_edge("ui_agent", "planner_supervisor")
+    workflow.add_edge("planner_supervisor", "overall_supervisor")
+    workflow.add_conditional_edges(
+        "overall_supervisor", route_by_current_phase,
+        {"web_searcher": "web_searcher", "data_analyst": "data_analyst", "report_generator": "report_generator",
+         "overall_supervisor": "overall_supervisor", END: END},
+    )
+    workflow.add_edge("web_searcher", "overall_supervisor")
+    workflow.add_edge("data_analyst", "overall_supervisor")
+    workflow.add_edge("report_generator", "overall_supervisor")
+    return workflow.compile(checkpointer=MemorySaver())
+
+
+def q5_inputs(request):
+    return {"messages": [HumanMessage(content=request)], "user_original_request": request,
+            "clarified_request": None, "research_plan": None, "collected_data": {}, "analysis_summary": None,
+            "report_draft": None, "final_report": None, "current_phase": None,
+            "current_task_id_being_processed": None, "error_message_for_chapter4": None}
+
+
+# --- シナリオ定義 (各解答例の実行セルと同じリクエスト) ---
+
+SCENARIOS = [
+    ("q2_supervisor/research", build_q2_supervisor_graph, q2_inputs,
+     "LangGraphの分散型エージェントアーキテクチャについて調査し、その利点をまとめてください。"),
+    ("q2_supervisor/write", build_q2_supervisor_graph, q2_inputs,
+     "AIが創造性を発揮する事例について、感動的なブログ記事を執筆してください。"),
+    ("q2_supervisor/chat", build_q2_supervisor_graph, q2_inputs, "今日の天気は良いですね！"),
+    ("q3_sequential/article", build_q3_sequential_graph, q3_inputs,
+     "LangGraphの条件付きエッジ機能について、その利点と簡単な使用例を含む技術ブログ記事を作成してください。"),
+    ("q4_hierarchical/weather_report", build_q4_hierarchical_graph, q4_inputs,
+     "東京の天気と主要観光スポット（3箇所）を調べて、それらをまとめた短いレポートを作成してください。"),
+    ("q5_collaborative/best_practices", build_q5_collaborative_graph, q5_inputs,
+     "LangGraphを使ったマルチエージェントシステム構築のベストプラクティスについて包括的に調査し、その結果を詳細な技術レポートとしてまとめてください。"),
+]
+
+
+# --- ノートブックの解答例との差分チェック ---
+
+# 問題番号 -> この写しのグラフを作る関数
+SOLUTION_GRAPHS = {
+    "002": build_q2_supervisor_graph,
+    "003": build_q3_sequential_graph,
+    "004": build_q4_hierarchical_graph,
+    "005": build_q5_collaborative_graph,
+}
+
+_GRAPH_METHODS = ("add_node", "add_edge", "add_conditional_edges", "set_entry_point", "set_conditional_entry_point",
+                  "set_finish_point")
+_GRAPH_CALL_RE = re.compile(r"\.(" + "|".join(_GRAPH_METHODS) + r")\(")
+_NAMED_CONSTANTS = {"END": END, "START": START}
+
+
+def solution_code(problem, notebook_path=NOTEBOOK_PATH):
+    """ノートブックの `<summary>解答{problem}</summary>` に続く Python のコードブロックを返す。"""
+    with open(notebook_path, "r", encoding="utf-8") as f:
+        notebook = json.load(f)
+    for cell in notebook["cells"]:
+        source = "".join(cell["source"])
+        if f"<summary>解答{problem}</summary>" in source:
+            match = re.search(r"```python\n(.*?)```", source, re.S)
+            if match:
+                return match.group(1)
+    raise ValueError(f"{notebook_path} に解答{problem}のコードが見つかりません。")
+
+
+def _call_source(code, open_paren):
+    """code[open_paren] の "(" から対応する ")" までを返す (文字列とコメントの中の括弧は数えない)。"""
+    depth, quote, i = 0, None, open_paren
+    while i < len(code):
+        char = code[i]
+        if quote:
+            if char == "\\":
+                i += 1
+            elif code.startswith(quote, i):
+                i += len(quote) - 1
+                quote = None
+        elif char == "#":
+            i = code.find("\n", i)
+            if i < 0:
+                break
+        elif char in "\"'":
+            quote = code[i:i + 3] if code[i:i + 3] in ('"""', "'''") else char
+            i += len(quote) - 1
+        elif char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth -= 1
+            if depth == 0:
+                return code[open_paren:i + 1]
+        i += 1
+    raise ValueError(f"括弧が閉じていません: {code[open_paren:open_paren + 60]!r}")
+
+
+def _literal(node):
+    """グラフ構築の引数を値にする (END/START は定数の値、それ以外の名前は名前の文字列)。"""
+    if isinstance(node, ast.Name):
+        return _NAMED_CONSTANTS.get(node.id, node.id)
+    if isinstance(node, ast.Dict):
+        return {_literal(key): _literal(value) for key, value in zip(node.keys, node.values)}
+    return ast.literal_eval(node)
+
+
+def notebook_graph_structure(code):
+    """
+    解答例のコードからグラフ構築の呼び出し (add_node など) だけを取り出し、
+    {"nodes": ノード名のリスト, "edges": エッジの集合, "branches": {分岐元: 行き先の対応}} を返す。
+    解答例のコード全体は構文として正しくない場合があるため、呼び出しを1つずつ解析する。
+    """
+    nodes, edges, branches = [], set(), {}
+    for match in _GRAPH_CALL_RE.finditer(code):
+        call = ast.parse("f" + _call_source(code, match.end() - 1), mode="eval").body
+        method, args = match.group(1), [_literal(arg) for arg in call.args]
+        if method == "add_node":
+            nodes.append(args[0])
+        elif method == "add_edge":
+            edges.add((args[0], args[1]))
+        elif method == "set_entry_point":
+            edges.add((START, args[0]))
+        elif method == "set_finish_point":
+            edges.add((args[0], END))
+        elif method == "add_conditional_edges":
+            branches[args[0]] = args[2] if len(args) > 2 else None
+        else:  # set_conditional_entry_point
+            branches[START] = args[1] if len(args) > 1 else None
+    return {"nodes": nodes, "edges": edges, "branches": branches}
+
+
+def compiled_graph_structure(graph):
+    """コンパイル済みのグラフから notebook_graph_structure と同じ形の構成を返す。"""
+    builder = graph.builder
+    branches = {}
+    for source, specs in builder.branches.items():
+        for spec in specs.values():
+            branches[source] = spec.ends
+    return {"nodes": list(builder.nodes), "edges": set(builder.edges), "branches": branches}
+
+
+def solution_system_prompt(code):
+    """解答例のスーパーバイザーの `system_prompt = (...)` の文字列。なければ None。"""
+    match = re.search(r"system_prompt\s*=\s*\(", code)
+    if match is None:
+        return None
+    return ast.literal_eval(_call_source(code, match.end() - 1))
+
+
+def check_solution_drift(notebook_path=NOTEBOOK_PATH):
+    """この写しのグラフがノートブックの解答例と食い違っている箇所を、人が読める文字列のリストで返す。"""
+    problems = []
+    llm = build_scripted_llm(0)
+    for problem, build_graph in SOLUTION_GRAPHS.items():
+        code = solution_code(problem, notebook_path)
+        expected = notebook_graph_structure(code)
+        actual = compiled_graph_structure(build_graph(llm))
+        if sorted(expected["nodes"]) != sorted(actual["nodes"]):
+            problems.append(f"解答{problem}: ノードが異なります (ノートブック {expected['nodes']} / 写し {actual['nodes']})")
+        for edge in sorted(expected["edges"] ^ actual["edges"]):
+            where = "ノートブックにだけある" if edge in expected["edges"] else "写しにだけある"
+            problems.append(f"解答{problem}: {where}エッジ {edge[0]} -> {edge[1]}")
+        for source in sorted(set(expected["branches"]) | set(actual["branches"])):
+            if expected["branches"].get(source) != actual["branches"].get(source):
+                problems.append(f"解答{problem}: 「{source}」からの条件付きエッジの行き先が異なります "
+                                f"(ノートブック {expected['branches'].get(source)} / 写し {actual['branches'].get(source)})")
+        notebook_calls, copy_calls = code.count("llm.invoke("), inspect.getsource(build_graph).count("llm.invoke(")
+        if notebook_calls != copy_calls:
+            problems.append(f"解答{problem}: LLM を呼ぶ箇所の数が異なります (ノートブック {notebook_calls} / 写し {copy_calls})")
+        prompt = solution_system_prompt(code)
+        if problem == "002" and prompt != SUPERVISOR_SYSTEM_PROMPT:
+            problems.append(f"解答{problem}: スーパーバイザーのシステムプロンプトが異なります")
+    return problems
+
+
+def run_scenario(build_graph, make_inputs, request, delay=LLM_CALL_DELAY):
+    """シナリオを1回実行し、LLM呼び出し回数・スーパーステップ数・模擬レイテンシを返す。"""
+    metrics = LLMMetrics()
+    llm = instrument_llm(build_scripted_llm(delay), metrics)
+    graph = build_graph(llm)
+    config = {"configurable": {"thread_id": "benchmark"}, "recursion_limit": 50}
+    start = time.perf_counter()
+    graph.invoke(make_inputs(request), config=config)
+    wall_time = time.perf_counter() - start
+    # チェックポイントの step は入力の書き込みが -1、入力を状態に反映する __start__ が 0 なので、最終値がノードの実行ステップ数になる
+    supersteps = graph.get_state(config).metadata["step"]
+    report = metrics.report()
+    llm_calls = {node: row["calls"] for node, row in report.items() if node != "__total__"}
+    total_calls = sum(llm_calls.values())
+    return {
+        "llm_calls": llm_calls,
+        "total_llm_calls": total_calls,
+        "supersteps": supersteps,
+        # 各グラフのノードは逐次実行なので、模擬レイテンシは LLM 呼び出し回数 × 1回あたりの遅延になる
+        "simulated_latency": round(total_calls * delay, 6),
+        "wall_time": wall_time,
+    }
+
+
+def compare_with_baseline(results, baseline):
+    """基準値より増えた項目を、人が読める文字列のリストで返す。"""
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get("scenarios", {}).get(name)
+        if expected is None:
+            regressions.append(f"{name}: 基準値がありません (--update-baseline で追加してください)")
+            continue
+        for node, calls in result["llm_calls"].items():
+            expected_calls = expected["llm_calls"].get(node, 0)
+            if calls > expected_calls:
+                regressions.append(f"{name}: ノード「{node}」の LLM 呼び出しが {expected_calls} → {calls} 回に増加")
+        for key, label in (("supersteps", "スーパーステップ数"), ("simulated_latency", "模擬レイテンシ[s]")):
+            if result[key] > expected[key]:
+                regressions.append(f"{name}: {label}が {expected[key]} → {result[key]} に増加")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="第4章マルチエージェント構成の LLM 呼び出し回数・レイテンシ回帰ベンチマーク")
+    parser.add_argument("--update-baseline", action="store_true", help="現在の計測結果で基準値ファイルを書き換える")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基準値ファイルのパス")
+    args = parser.parse_args(argv)
+
+    drift = check_solution_drift()
+    if drift:
+        print("--- 写しのグラフが 4_multi_agent.ipynb の解答例と異なります (写しを更新してください) ---")
+        for line in drift:
+            print(f"  {line}")
+        return 1
+
+    results = {}
+    print(f"{'シナリオ':<36} {'LLM呼び出し':>10} {'ステップ':>8} {'模擬[s]':>8} {'実測[s]':>8}  ノード別")
+    for name, build_graph, make_inputs, request in SCENARIOS:
+        result = run_scenario(build_graph, make_inputs, request)
+        results[name] = result
+        print(f"{name:<36} {result['total_llm_calls']:>10d} {result['supersteps']:>8d} "
+              f"{result['simulated_latency']:>8.3f} {result['wall_time']:>8.3f}  {result['llm_calls']}")
+
+    if args.update_baseline:
+        baseline = {
+            "llm_call_delay": LLM_CALL_DELAY,
+            "scenarios": {
+                name: {key: result[key] for key in ("llm_calls", "total_llm_calls", "supersteps", "simulated_latency")}
+                for name, result in results.items()
+            },
+        }
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=1, ensure_ascii=False)
+            f.write("\n")
+        print(f"\n基準値を更新しました: {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"\nError: 基準値ファイルが見つかりません: {args.baseline} (--update-baseline で作成してください)")
+        return 1
+
+    regressions = compare_with_baseline(results, baseline)
+    if regressions:
+        print("\n--- 回帰を検出しました ---")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\nすべてのシナリオが基準値以内です。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
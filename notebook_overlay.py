@@ -0,0 +1,244 @@
+"""
+難易度別ノートブック (1_easy / 2_normal / 3_hard) を、元のノートブックとの差分 (オーバーレイ) で保存する形式と、
+オーバーレイから通常の .ipynb を組み立てる materializer。
+
+難易度別のノートブックは、解答欄セル以外は元のノートブックと同じ内容の完全なコピーになっている。
+オーバーレイには変わったセルだけを次の形で保存する (JSON)。
+
+    {
+     "format": "notebook-overlay/1",
+     "base": "3_single_agent.ipynb",            # 元のノートブック (オーバーレイのファイルからの相対パス)
+     "base_sha256": "...",                      # 元のノートブックのファイル内容のハッシュ
+     "cells": {                                 # セル番号 (元のノートブック) → そのセルの置き換え
+      "12": {"lines": {"3": "from langgraph.graph import ____, END\n"}},  # 行番号 → 置き換える行 (行数が同じ場合)
+      "15": {"source": ["# 解答欄004\n", ...]}                           # source 全体 (行数が変わる場合)
+     },
+     "splices": [{"at": 20, "delete": 1, "insert": [{...セル...}]}],  # セルの追加・削除 (まれ)
+     "trailing_newline": false
+    }
+
+元のノートブックが変わっている (ハッシュが一致しない) 場合は、古い差分を当てないようにエラーにする。
+組み立てた .ipynb は元の難易度別ノートブックとバイト単位で一致する (json.dump(indent=1, ensure_ascii=False) の形式)。
+
+使い方:
+
+    python notebook_overlay.py build                      # 難易度別ノートブックから overlays/ を作る
+    python notebook_overlay.py materialize overlays/3_hard/3_single_agent.overlay.json > 3_single_agent.ipynb
+    python notebook_overlay.py verify                     # overlays/ から組み立てた結果が難易度別ノートブックと一致するか確認する
+"""
+import argparse
+import difflib
+import hashlib
+import json
+import os
+import sys
+import time
+
+from quiz_bundle import CHAPTERS, DIFFICULTY_DIRS
+
+OVERLAY_FORMAT = "notebook-overlay/1"
+OVERLAY_SUFFIX = ".overlay.json"
+DEFAULT_OVERLAY_DIR = "overlays"
+
+_base_cache = {}  # 元のノートブックのパス -> (mtime, サイズ, ハッシュ, 解析済みのノートブック)
+
+
+def file_sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def dump_notebook(notebook, trailing_newline=True):
+    """リポジトリのノートブックと同じ形式 (indent=1, ensure_ascii=False) の文字列にする。"""
+    return json.dumps(notebook, indent=1, ensure_ascii=False) + ("\n" if trailing_newline else "")
+
+
+def _load_base(path):
+    """元のノートブックを読み込む。ファイルが変わっていなければ前回の解析結果を使う。"""
+    stat = os.stat(path)
+    cached = _base_cache.get(path)
+    if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2], cached[3]
+    with open(path, "rb") as f:
+        data = f.read()
+    digest, notebook = file_sha256(data), json.loads(data)
+    _base_cache[path] = (stat.st_mtime_ns, stat.st_size, digest, notebook)
+    return digest, notebook
+
+
+def _same_except_source(a, b):
+    return a["cell_type"] == b["cell_type"] and {k: v for k, v in a.items() if k != "source"} == \
+        {k: v for k, v in b.items() if k != "source"}
+
+
+def _cell_patch(base_source, variant_source):
+    """セルの source の置き換えを、行数が同じなら変わった行だけ、そうでなければ source 全体で表す。"""
+    if isinstance(base_source, list) and isinstance(variant_source, list) and len(base_source) == len(variant_source):
+        return {"lines": {str(n): line for n, (old, line) in enumerate(zip(base_source, variant_source)) if old != line}}
+    return {"source": variant_source}
+
+
+def _patched_source(base_source, patch):
+    if "source" in patch:
+        return patch["source"]
+    source = list(base_source)
+    for n, line in patch["lines"].items():
+        source[int(n)] = line
+    return source
+
+
+def make_overlay(base_path, variant, overlay_path=None, trailing_newline=True):
+    """
+    元のノートブック (base_path) と難易度別ノートブック (dict) の差分からオーバーレイ (dict) を作る。
+    overlay_path を渡すと、base はそのファイルからの相対パスで記録する。
+    """
+    base_digest, base = _load_base(base_path)
+    if {k: v for k, v in base.items() if k != "cells"} != {k: v for k, v in variant.items() if k != "cells"}:
+        raise ValueError("セル以外 (metadata など) が異なるノートブックはオーバーレイにできません。")
+    base_cells, variant_cells = base["cells"], variant["cells"]
+    keys_a = [json.dumps(cell, sort_keys=True, ensure_ascii=False) for cell in base_cells]
+    keys_b = [json.dumps(cell, sort_keys=True, ensure_ascii=False) for cell in variant_cells]
+    patches, splices = {}, []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, keys_a, keys_b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            continue
+        if tag == "replace" and i2 - i1 == j2 - j1 and all(
+            _same_except_source(base_cells[i], variant_cells[j]) for i, j in zip(range(i1, i2), range(j1, j2))
+        ):
+            for i, j in zip(range(i1, i2), range(j1, j2)):
+                patches[str(i)] = _cell_patch(base_cells[i]["source"], variant_cells[j]["source"])
+        else:
+            splices.append({"at": i1, "delete": i2 - i1, "insert": variant_cells[j1:j2]})
+    base_ref = os.path.basename(base_path)
+    if overlay_path is not None:
+        base_ref = os.path.relpath(base_path, os.path.dirname(os.path.abspath(overlay_path)))
+    return {
+        "format": OVERLAY_FORMAT,
+        "base": base_ref.replace(os.sep, "/"),
+        "base_sha256": base_digest,
+        "cells": patches,
+        "splices": splices,
+        "trailing_newline": trailing_newline,
+    }
+
+
+def apply_overlay(base, overlay):
+    """解析済みの元のノートブックにオーバーレイを当てたノートブック (dict) を返す。base は変更しない。"""
+    cells = list(base["cells"])
+    for index, patch in overlay["cells"].items():
+        cell = cells[int(index)]
+        cells[int(index)] = dict(cell, source=_patched_source(cell["source"], patch))
+    for splice in sorted(overlay["splices"], key=lambda s: s["at"], reverse=True):
+        cells[splice["at"]:splice["at"] + splice["delete"]] = splice["insert"]
+    return dict(base, cells=cells)
+
+
+def load_overlay(overlay_path):
+    with open(overlay_path, "r", encoding="utf-8") as f:
+        overlay = json.load(f)
+    if overlay.get("format") != OVERLAY_FORMAT:
+        raise ValueError(f"{overlay_path} はオーバーレイ形式 ({OVERLAY_FORMAT}) ではありません。")
+    return overlay
+
+
+def materialize(overlay_path):
+    """オーバーレイのファイルから .ipynb の内容 (文字列) を組み立てる。元のノートブックが変わっていればエラー。"""
+    overlay = load_overlay(overlay_path)
+    base_path = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(overlay_path)), overlay["base"]))
+    digest, base = _load_base(base_path)
+    if digest != overlay["base_sha256"]:
+        raise ValueError(
+            f"{base_path} がオーバーレイの作成時から変わっています。"
+            "`python notebook_overlay.py build` でオーバーレイを作り直してください。"
+        )
+    return dump_notebook(apply_overlay(base, overlay), overlay["trailing_newline"])
+
+
+def write_overlay(overlay, overlay_path):
+    os.makedirs(os.path.dirname(overlay_path) or ".", exist_ok=True)
+    with open(overlay_path, "w", encoding="utf-8") as f:
+        json.dump(overlay, f, indent=1, ensure_ascii=False)
+        f.write("\n")
+
+
+def overlay_path_for(overlay_dir, difficulty_dir, chapter):
+    return os.path.join(overlay_dir, difficulty_dir, f"{chapter}{OVERLAY_SUFFIX}")
+
+
+def iter_variant_paths(root_dir="."):
+    """(元のノートブック, 難易度別ノートブック, 難易度のフォルダ名, 章) を返す。"""
+    for chapter in CHAPTERS:
+        base_path = os.path.join(root_dir, f"{chapter}.ipynb")
+        for directory in DIFFICULTY_DIRS.values():
+            variant_path = os.path.join(root_dir, directory, f"{chapter}.ipynb")
+            if os.path.exists(base_path) and os.path.exists(variant_path):
+                yield base_path, variant_path, directory, chapter
+
+
+def build_overlays(root_dir=".", overlay_dir=DEFAULT_OVERLAY_DIR):
+    """既存の難易度別ノートブックからオーバーレイを作り、[(難易度別ノートブック, オーバーレイ, 元のサイズ, オーバーレイのサイズ)] を返す。"""
+    written = []
+    for base_path, variant_path, directory, chapter in iter_variant_paths(root_dir):
+        with open(variant_path, "r", encoding="utf-8") as f:
+            text = f.read()
+        overlay_path = overlay_path_for(os.path.join(root_dir, overlay_dir), directory, chapter)
+        overlay = make_overlay(base_path, json.loads(text), overlay_path, trailing_newline=text.endswith("\n"))
+        write_overlay(overlay, overlay_path)
+        written.append((variant_path, overlay_path, os.path.getsize(variant_path), os.path.getsize(overlay_path)))
+    return written
+
+
+def verify_overlays(root_dir=".", overlay_dir=DEFAULT_OVERLAY_DIR):
+    """オーバーレイから組み立てた結果と難易度別ノートブックを比べ、一致しないファイルのリストを返す。"""
+    mismatched = []
+    for _, variant_path, directory, chapter in iter_variant_paths(root_dir):
+        overlay_path = overlay_path_for(os.path.join(root_dir, overlay_dir), directory, chapter)
+        with open(variant_path, "r", encoding="utf-8") as f:
+            expected = f.read()
+        try:
+            actual = materialize(overlay_path)
+        except (OSError, ValueError) as e:
+            mismatched.append((variant_path, str(e)))
+            continue
+        if actual != expected:
+            mismatched.append((variant_path, "内容が一致しません"))
+    return mismatched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="難易度別ノートブックのオーバーレイ形式")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="難易度別ノートブックからオーバーレイを作る")
+    verify_parser = subparsers.add_parser("verify", help="オーバーレイから組み立てた結果を難易度別ノートブックと比べる")
+    for sub in (build_parser, verify_parser):
+        sub.add_argument("--root", default=".")
+        sub.add_argument("--overlays", default=DEFAULT_OVERLAY_DIR)
+    materialize_parser = subparsers.add_parser("materialize", help="オーバーレイから .ipynb を組み立てる")
+    materialize_parser.add_argument("overlay")
+    materialize_parser.add_argument("-o", "--output", help="省略すると標準出力に書き出す")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        results = build_overlays(args.root, args.overlays)
+        elapsed = time.perf_counter() - start
+        for variant_path, overlay_path, variant_size, overlay_size in results:
+            print(f"{overlay_path}: {overlay_size / 1024:6.1f} KB (元の {variant_size / 1024:6.1f} KB)")
+        total_variant = sum(r[2] for r in results)
+        total_overlay = sum(r[3] for r in results)
+        print(f"合計: {total_overlay / 1024:.0f} KB (難易度別ノートブック {total_variant / 1024:.0f} KB, "
+              f"{total_overlay / total_variant * 100:.1f}%) / {elapsed:.2f}秒")
+    elif args.command == "verify":
+        start = time.perf_counter()
+        problems = verify_overlays(args.root, args.overlays)
+        for variant_path, reason in problems:
+            print(f"NG {variant_path}: {reason}")
+        count = len(list(iter_variant_paths(args.root)))
+        print(f"{count - len(problems)}/{count} 件が一致しました ({time.perf_counter() - start:.2f}秒)")
+        sys.exit(1 if problems else 0)
+    else:
+        content = materialize(args.overlay)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(content)
+        else:
+            sys.stdout.buffer.write(content.encode("utf-8"))
@@ -0,0 +1,294 @@
+"""
+第3章 問題005 (複数ツールの並列実行) の発展: 同時実行数の上限とツールごとのタイムアウトを持つ並列ツール実行ノード。
+
+`ToolNode` は1つの AIMessage に含まれる複数の ToolCall をまとめて実行するが、
+50件のツール呼び出しや応答の遅いツールが混ざった場合の挙動 (同時実行数・待ち時間) は制御しにくい。
+`ParallelToolNode` は各 ToolCall を1件ずつ `ToolNode` に渡して実行し (エラー処理や引数注入は ToolNode の挙動をそのまま使う)、
+その外側で同時実行数・タイムアウト・実行方式 (スレッドプール / asyncio) を制御する。
+ToolCall はグラフの状態と一緒に渡すため、InjectedState のツールにはグラフの状態がそのまま見え、
+Command を返すツールの結果も ToolNode と同じ形 (Command と {messages: [...]} のリスト) で返す。
+
+使い方 (問題005の `tool_node_q5` を置き換える場合):
+
+    from parallel_tool_node import ParallelToolNode
+    tool_node_q5 = ParallelToolNode(tools_q5, max_concurrency=8, timeout=10.0)
+    workflow_q5.add_node("tools", tool_node_q5)
+    # 非同期グラフ (graph.ainvoke / astream) で使う場合は tool_node_q5.ainvoke をノードとして登録する
+
+このファイルを直接実行すると、sleep するだけのローカルツールで逐次実行との速度比較ベンチマークを行う。
+    python parallel_tool_node.py
+"""
+import asyncio
+import concurrent.futures
+import time
+from typing import Annotated, TypedDict
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import tool
+from langgraph.graph import END, StateGraph
+from langgraph.graph.message import add_messages
+from langgraph.prebuilt import ToolNode
+from langgraph.types import Command
+
+BACKENDS = ("thread", "asyncio")
+
+
+class ParallelToolNode:
+    """
+    最後の AIMessage の tool_calls を、同時実行数の上限付きで並列実行するグラフノード。
+
+    - max_concurrency: 同時に実行するツール呼び出しの最大数
+    - timeout: すべてのツールに適用するタイムアウト秒数 (None なら無制限)
+    - tool_timeouts: ツール名ごとのタイムアウト秒数 (timeout より優先)
+    - backend: "thread" (スレッドプール) または "asyncio" (セマフォ + ToolNode.ainvoke)
+
+    タイムアウトしたツール呼び出しは status="error" の ToolMessage として返すため、
+    エージェントノードは通常のツールエラーと同じように扱える。
+    なお、スレッドは外部から停止できないため、"thread" バックエンドでタイムアウトしたツールは
+    裏で完了するまで走り続ける。確実に中断したい場合は async 実装のツールと "asyncio" バックエンドを使うこと。
+    """
+
+    def __init__(self, tools, max_concurrency=8, timeout=None, tool_timeouts=None,
+                 backend="thread", messages_key="messages"):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unsupported backend: {backend}. Please choose from {BACKENDS}.")
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency は1以上を指定してください。")
+        self.tool_node = ToolNode(tools, messages_key=messages_key)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.tool_timeouts = dict(tool_timeouts or {})
+        self.backend = backend
+        self.messages_key = messages_key
+
+    def __call__(self, state, config: RunnableConfig):
+        tool_calls = self._get_tool_calls(state)
+        if not tool_calls:
+            return {self.messages_key: []}
+        if self.backend == "thread":
+            outputs = self._run_threaded(tool_calls, state, config)
+        else:
+            outputs = _run_coroutine_sync(self._run_async(tool_calls, state, config))
+        return self._combine(outputs)
+
+    async def ainvoke(self, state, config: RunnableConfig):
+        """非同期グラフ (graph.ainvoke / astream) から呼び出す場合のエントリポイント。"""
+        tool_calls = self._get_tool_calls(state)
+        if not tool_calls:
+            return {self.messages_key: []}
+        return self._combine(await self._run_async(tool_calls, state, config))
+
+    def _get_tool_calls(self, state):
+        messages = state[self.messages_key] if isinstance(state, dict) else getattr(state, self.messages_key)
+        for message in reversed(messages):
+            if isinstance(message, AIMessage):
+                return list(message.tool_calls)
+        raise ValueError("No AIMessage found in input")
+
+    def _timeout_for(self, tool_call):
+        return self.tool_timeouts.get(tool_call["name"], self.timeout)
+
+    @staticmethod
+    def _single_call_input(tool_call, state):
+        # Send API と同じ「状態つきの ToolCall」の形で渡すと、ToolNode は InjectedState にグラフの状態をそのまま注入する
+        return {"__type": "tool_call_with_context", "tool_call": tool_call, "state": state}
+
+    def _flatten(self, output):
+        """ToolNode の出力 ({messages: [...]} または Command を含むリスト) を ToolMessage と Command のリストにする。"""
+        items = output if isinstance(output, list) else [output]
+        flat = []
+        for item in items:
+            flat.extend(item[self.messages_key] if isinstance(item, dict) else [item])
+        return flat
+
+    def _combine(self, outputs):
+        """ツール呼び出しごとの結果を、ToolNode と同じ形のノードの戻り値にまとめる。"""
+        flat = [item for output in outputs for item in output]
+        if not any(isinstance(item, Command) for item in flat):
+            return {self.messages_key: flat}
+        return self.tool_node._combine_tool_outputs(flat, "dict")
+
+    def _run_one(self, tool_call, state, config):
+        return self._flatten(self.tool_node.invoke(self._single_call_input(tool_call, state), config))
+
+    async def _arun_one(self, tool_call, state, config):
+        return self._flatten(await self.tool_node.ainvoke(self._single_call_input(tool_call, state), config))
+
+    def _run_threaded(self, tool_calls, state, config):
+        results = [None] * len(tool_calls)
+        started_at = {}
+        limits = [self._timeout_for(tool_call) for tool_call in tool_calls]
+        # タイムアウト指定があるときだけ、短い間隔で経過時間を確認する
+        poll_interval = None if all(limit is None for limit in limits) else 0.01
+
+        def run(index):
+            started_at[index] = time.perf_counter()
+            return self._run_one(tool_calls[index], state, config)
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrency)
+        try:
+            future_to_index = {executor.submit(run, i): i for i in range(len(tool_calls))}
+            pending = set(future_to_index)
+            while pending:
+                done, pending = concurrent.futures.wait(
+                    pending, timeout=poll_interval, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    results[future_to_index[future]] = future.result()
+                # タイムアウト判定は「キューで待った時間」ではなく「実行を開始してからの時間」で行う
+                now = time.perf_counter()
+                for future in list(pending):
+                    index = future_to_index[future]
+                    if limits[index] is not None and index in started_at and now - started_at[index] >= limits[index]:
+                        results[index] = [_timeout_message(tool_calls[index], limits[index])]
+                        pending.discard(future)
+        finally:
+            # タイムアウトしたスレッドの終了は待たない
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    async def _run_async(self, tool_calls, state, config):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(tool_call):
+            async with semaphore:
+                limit = self._timeout_for(tool_call)
+                try:
+                    return await asyncio.wait_for(self._arun_one(tool_call, state, config), timeout=limit)
+                except asyncio.TimeoutError:
+                    return [_timeout_message(tool_call, limit)]
+
+        return list(await asyncio.gather(*(run(tool_call) for tool_call in tool_calls)))
+
+
+def _timeout_message(tool_call, limit):
+    return ToolMessage(
+        content=f"Error: ツール {tool_call['name']} が {limit} 秒以内に完了しなかったため打ち切りました。",
+        name=tool_call["name"],
+        tool_call_id=tool_call["id"],
+        status="error",
+    )
+
+
+def _run_coroutine_sync(coroutine):
+    """
+    同期コンテキストからコルーチンを実行する。
+    Jupyter のようにイベントループが既に動いているスレッドでは asyncio.run が使えないため、別スレッドで実行する。
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+# --- ベンチマーク ---
+
+def _build_sleep_tools():
+    @tool
+    def sleep_tool(seconds: float) -> str:
+        """指定された秒数だけ待ってから応答する (遅い外部APIの代わり)。"""
+        time.sleep(seconds)
+        return f"{seconds}秒待ちました。"
+
+    @tool
+    async def async_sleep_tool(seconds: float) -> str:
+        """指定された秒数だけ非同期に待ってから応答する (遅い外部APIの代わり)。"""
+        await asyncio.sleep(seconds)
+        return f"{seconds}秒待ちました。"
+
+    return sleep_tool, async_sleep_tool
+
+
+class ToolBenchState(TypedDict):
+    messages: Annotated[list, add_messages]
+
+
+def _build_tools_graph(tools_node):
+    workflow = StateGraph(ToolBenchState)
+    workflow.add_node("tools", tools_node)
+    workflow.set_entry_point("tools")
+    workflow.add_edge("tools", END)
+    return workflow.compile()
+
+
+def _tool_call_message(tool_name, tool_count, latency):
+    return AIMessage(
+        content="",
+        tool_calls=[
+            {"name": tool_name, "args": {"seconds": latency}, "id": f"bench_{i}", "type": "tool_call"}
+            for i in range(tool_count)
+        ],
+    )
+
+
+def run_benchmark(tool_counts=(1, 5, 10, 25, 50), latencies=(0.01, 0.05, 0.1), max_concurrency=16):
+    """
+    ツール数とツール1回あたりの遅延を変えながら、逐次実行と並列実行の所要時間を比較する。
+    戻り値は各条件の計測結果 (dict) のリスト。
+    """
+    sleep_tool, async_sleep_tool = _build_sleep_tools()
+    sequential_graph = _build_tools_graph(ToolNode([sleep_tool]))
+    thread_graph = _build_tools_graph(
+        ParallelToolNode([sleep_tool], max_concurrency=max_concurrency, backend="thread")
+    )
+    asyncio_graph = _build_tools_graph(
+        ParallelToolNode([async_sleep_tool], max_concurrency=max_concurrency, backend="asyncio")
+    )
+
+    def measure(graph, message, config=None):
+        start = time.perf_counter()
+        result = graph.invoke({"messages": [message]}, config=config)
+        elapsed = time.perf_counter() - start
+        assert len(result["messages"]) == len(message.tool_calls) + 1
+        return elapsed
+
+    rows = []
+    for latency in latencies:
+        for tool_count in tool_counts:
+            sync_message = _tool_call_message(sleep_tool.name, tool_count, latency)
+            async_message = _tool_call_message(async_sleep_tool.name, tool_count, latency)
+            # max_concurrency=1 を渡すと ToolNode は ToolCall を1件ずつ実行する
+            sequential = measure(sequential_graph, sync_message, {"max_concurrency": 1})
+            thread = measure(thread_graph, sync_message)
+            asyncio_time = measure(asyncio_graph, async_message)
+            rows.append({
+                "latency": latency,
+                "tool_count": tool_count,
+                "sequential": sequential,
+                "thread": thread,
+                "asyncio": asyncio_time,
+                "speedup_thread": sequential / thread,
+                "speedup_asyncio": sequential / asyncio_time,
+            })
+    return rows
+
+
+def print_benchmark(rows, max_concurrency):
+    print(f"--- 並列ツール実行ベンチマーク (max_concurrency={max_concurrency}) ---")
+    print(f"{'遅延[s]':>8} {'ツール数':>8} {'逐次[s]':>9} {'thread[s]':>10} {'asyncio[s]':>11} {'速度比(thread)':>15} {'速度比(asyncio)':>16}")
+    for row in rows:
+        print(
+            f"{row['latency']:>8.3f} {row['tool_count']:>8d} {row['sequential']:>9.3f} {row['thread']:>10.3f} "
+            f"{row['asyncio']:>11.3f} {row['speedup_thread']:>14.1f}x {row['speedup_asyncio']:>15.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    concurrency = 16
+    print_benchmark(run_benchmark(max_concurrency=concurrency), concurrency)
+
+    # タイムアウトの動作確認: 1件だけ極端に遅いツール呼び出しが混ざっている場合
+    sleep_tool, async_sleep_tool = _build_sleep_tools()
+    slow_message = AIMessage(content="", tool_calls=[
+        {"name": async_sleep_tool.name, "args": {"seconds": 0.05}, "id": "fast", "type": "tool_call"},
+        {"name": async_sleep_tool.name, "args": {"seconds": 5.0}, "id": "slow", "type": "tool_call"},
+    ])
+    timeout_graph = _build_tools_graph(ParallelToolNode([async_sleep_tool], timeout=0.5, backend="asyncio"))
+    start = time.perf_counter()
+    result = timeout_graph.invoke({"messages": [slow_message]})
+    print(f"\n--- タイムアウト確認 ({time.perf_counter() - start:.2f}秒) ---")
+    for message in result["messages"][1:]:
+        print(f"  {message.tool_call_id}: status={message.status}, content={message.content}")
@@ -0,0 +1,415 @@
+"""
+第3章 問題006 (Plan-and-Execute) の発展: ステップ間の依存関係に基づいて、独立したステップを並行実行するエグゼキューター。
+
+問題006のエグゼキューターは計画のステップを1つずつ順番に実行するため、互いに依存しないステップがあっても
+所要時間は全ステップの合計になる。ここではプランナーの出力する各ステップに `id` と `depends_on` を持たせて計画を DAG とみなし、
+依存先がすべて完了したステップから、同時実行数の上限付きで並行に実行する。所要時間は合計ではなく、クリティカルパス (最長の依存の鎖) に近づく。
+
+計画のステップの形式 (問題006の形式に `id` と `depends_on` を追加したもの):
+
+    {"id": "s3", "tool_name": "reverse_string", "args": {"text": "<step:s1>"},
+     "step_description": "s1の結果を逆順にする", "depends_on": ["s1"]}
+
+*   引数の文字列中の `<step:ID>` は、そのステップの実行結果に置き換えられる (ID のステップは依存先 (直接・間接) でなければならない)。問題006の `<前のステップの結果>` は、最後の依存先の結果になる。
+*   `id` を省略したステップには "step1", "step2", ... が、`depends_on` を省略したステップには直前のステップが補われるため、
+    問題006のプランナーが出力する計画はそのまま (逐次実行として) 動く。
+*   実行結果は `step_results` (ステップID → 結果の dict) にリデューサー `merge_step_results` でマージされる。
+*   再計画 (`invalidate_changed_steps`) では、内容が変わったステップとその下流のステップの結果だけを無効化し、変わっていない上流の結果は再利用する。
+
+使い方:
+
+    from plan_dag_executor import build_dag_plan_execute_graph
+    graph = build_dag_plan_execute_graph(planner_node, tools=[square_number, reverse_string], max_concurrency=4)
+
+このファイルを直接実行すると、待ち時間を模擬したツールで、逐次実行・DAG 実行・クリティカルパスの時間を比較する。
+    python plan_dag_executor.py
+"""
+import collections
+import concurrent.futures
+import random
+import re
+import time
+from typing import Annotated, Dict, List, Optional, TypedDict
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+from langgraph.graph import END, StateGraph
+from langgraph.graph.message import add_messages
+
+PREVIOUS_RESULT_PLACEHOLDER = "<前のステップの結果>"
+STEP_REFERENCE_PATTERN = re.compile(r"<step:([^>]+)>")
+
+
+def merge_step_results(left: Optional[Dict[str, str]], right: Optional[Dict[str, str]]) -> Dict[str, str]:
+    """
+    step_results 用のリデューサー。ステップID → 結果をマージし、値が None のキーは削除する (再計画での無効化に使う)。
+    並行に実行したステップの結果が、どの順で返ってきても同じ状態になる。
+    """
+    merged = dict(left or {})
+    for step_id, result in (right or {}).items():
+        if result is None:
+            merged.pop(step_id, None)
+        else:
+            merged[step_id] = result
+    return merged
+
+
+def normalize_plan(plan):
+    """
+    ステップに id と depends_on を補い、依存関係を検証した計画 (新しいリスト) を返す。
+    存在しないステップへの依存や循環依存、依存先 (直接・間接) にないステップを引数の `<step:ID>` で参照している場合は
+    ValueError を送出する (参照先が完了しているとは限らず、実行のタイミングで結果が変わるため)。
+    """
+    normalized = []
+    for index, step in enumerate(plan or []):
+        step = dict(step)
+        step.setdefault("id", f"step{index + 1}")
+        if "depends_on" not in step:
+            step["depends_on"] = [normalized[-1]["id"]] if normalized else []
+        step["depends_on"] = list(step["depends_on"])
+        normalized.append(step)
+    ids = [step["id"] for step in normalized]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"計画のステップIDが重複しています: {ids}")
+    for step in normalized:
+        unknown = [dep for dep in step["depends_on"] if dep not in ids]
+        if unknown:
+            raise ValueError(f"ステップ {step['id']} が存在しないステップに依存しています: {unknown}")
+    topological_order(normalized)
+    depends_on = {step["id"]: step["depends_on"] for step in normalized}
+    for step in normalized:
+        referenced = {
+            match.group(1)
+            for value in (step.get("args") or {}).values() if isinstance(value, str)
+            for match in STEP_REFERENCE_PATTERN.finditer(value)
+        }
+        missing = sorted(referenced - _ancestors(depends_on, step["id"]))
+        if missing:
+            raise ValueError(f"ステップ {step['id']} が依存先にないステップの結果を参照しています: {missing} "
+                             "(depends_on に追加してください)")
+    return normalized
+
+
+def _ancestors(depends_on, step_id):
+    """step_id が直接・間接に依存するステップIDの集合。"""
+    found, stack = set(), list(depends_on[step_id])
+    while stack:
+        dep = stack.pop()
+        if dep not in found:
+            found.add(dep)
+            stack.extend(depends_on[dep])
+    return found
+
+
+def topological_order(plan):
+    """計画のステップIDをトポロジカル順 (同順位は計画の記載順) で返す。循環依存があれば ValueError。"""
+    remaining = {step["id"]: set(step["depends_on"]) for step in plan}
+    order = []
+    while remaining:
+        ready = [step["id"] for step in plan if step["id"] in remaining and not remaining[step["id"]]]
+        if not ready:
+            raise ValueError(f"計画に循環依存があります: {sorted(remaining)}")
+        for step_id in ready:
+            del remaining[step_id]
+            for deps in remaining.values():
+                deps.discard(step_id)
+        order.extend(ready)
+    return order
+
+
+def downstream_steps(plan, step_ids):
+    """step_ids と、それらに (直接・間接に) 依存するすべてのステップのIDを返す。"""
+    dependents = collections.defaultdict(list)
+    for step in plan:
+        for dep in step["depends_on"]:
+            dependents[dep].append(step["id"])
+    found, stack = set(), list(step_ids)
+    while stack:
+        step_id = stack.pop()
+        if step_id in found:
+            continue
+        found.add(step_id)
+        stack.extend(dependents[step_id])
+    return found
+
+
+def invalidate_changed_steps(old_plan, new_plan, step_results):
+    """
+    再計画の前後の計画を比べ、無効化すべきステップの結果を None にした step_results の更新 (dict) を返す。
+    ツール名・引数・依存先のいずれかが変わったステップ、新しく追加されたステップ、およびそれらの下流が無効化の対象で、
+    計画から削除されたステップの結果も取り除く。返り値はそのまま merge_step_results に渡せる。
+    """
+    old_steps = {step["id"]: step for step in normalize_plan(old_plan)}
+    new_plan = normalize_plan(new_plan)
+
+    def signature(step):
+        return step["tool_name"], repr(sorted(step["args"].items())), tuple(step["depends_on"])
+
+    changed = [step["id"] for step in new_plan if step["id"] not in old_steps or signature(step) != signature(old_steps[step["id"]])]
+    invalid = downstream_steps(new_plan, changed)
+    new_ids = {step["id"] for step in new_plan}
+    return {step_id: None for step_id in (step_results or {}) if step_id in invalid or step_id not in new_ids}
+
+
+def critical_path_time(plan, durations):
+    """各ステップの所要時間 (ステップID → 秒) から、計画全体のクリティカルパスの長さを求める。"""
+    plan = normalize_plan(plan)
+    steps = {step["id"]: step for step in plan}
+    finish = {}
+    for step_id in topological_order(plan):
+        start = max((finish[dep] for dep in steps[step_id]["depends_on"]), default=0.0)
+        finish[step_id] = start + durations.get(step_id, 0.0)
+    return max(finish.values(), default=0.0)
+
+
+def _resolve_args(step, results):
+    def resolve(value):
+        if not isinstance(value, str):
+            return value
+        if value == PREVIOUS_RESULT_PLACEHOLDER and step["depends_on"]:
+            return str(results[step["depends_on"][-1]])
+        return STEP_REFERENCE_PATTERN.sub(lambda m: str(results[m.group(1)]) if m.group(1) in results else m.group(0), value)
+
+    return {key: resolve(value) for key, value in step["args"].items()}
+
+
+def _run_step(step, args, tools):
+    tool_name = step["tool_name"]
+    start = time.perf_counter()
+    if tool_name in tools:
+        try:
+            result = str(tools[tool_name].invoke(args))
+        except Exception as e:
+            result = f"ツール実行エラー: {e}"
+    elif tool_name == "direct_answer":
+        result = args.get("text", "エラー: direct_answerにtextがありません")
+    else:
+        result = f"不明なツール: {tool_name}"
+    return result, time.perf_counter() - start
+
+
+def execute_plan(plan, tools, completed=None, max_concurrency=4):
+    """
+    計画のうち、completed (ステップID → 結果) に含まれないステップを依存順に実行し、
+    (新たに得た結果の dict, ステップID → 所要時間の dict, 完了順のステップIDのリスト) を返す。
+    依存先がすべて完了したステップから順に、最大 max_concurrency 個までスレッドプールで並行実行する。
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency は1以上を指定してください。")
+    plan = normalize_plan(plan)
+    tools = tools if isinstance(tools, dict) else {t.name: t for t in tools}
+    results = dict(completed or {})
+    steps = {step["id"]: step for step in plan}
+    waiting = {step["id"]: {dep for dep in step["depends_on"] if dep not in results} for step in plan if step["id"] not in results}
+    new_results, durations, finished_order = {}, {}, []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        running = {}
+
+        def submit_ready():
+            for step in plan:
+                step_id = step["id"]
+                if len(running) >= max_concurrency:
+                    break
+                if step_id in waiting and not waiting[step_id]:
+                    del waiting[step_id]
+                    running[pool.submit(_run_step, step, _resolve_args(step, results), tools)] = step_id
+
+        submit_ready()
+        while running:
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                step_id = running.pop(future)
+                result, duration = future.result()
+                results[step_id] = new_results[step_id] = result
+                durations[step_id] = duration
+                finished_order.append(step_id)
+                for deps in waiting.values():
+                    deps.discard(step_id)
+            submit_ready()
+    return new_results, durations, finished_order
+
+
+# --- グラフ (問題006のグラフのエグゼキューター部分を DAG エグゼキューターに置き換えたもの) ---
+
+class DagPlanExecuteState(TypedDict):
+    user_request: str
+    plan: Optional[List[dict]]
+    step_results: Annotated[Dict[str, str], merge_step_results]
+    final_answer: Optional[str]
+    replan_count: int
+    messages: Annotated[list, add_messages]
+
+
+def make_dag_executor_node(tools, max_concurrency=4):
+    """DagPlanExecuteState の計画のうち未実行のステップを並行実行し、結果を step_results にマージするノードを作る。"""
+    tools = {t.name: t for t in tools}
+
+    def dag_executor_node(state: DagPlanExecuteState):
+        plan = normalize_plan(state.get("plan"))
+        new_results, durations, finished_order = execute_plan(plan, tools, state.get("step_results"), max_concurrency)
+        steps = {step["id"]: step for step in plan}
+        messages = [
+            ToolMessage(content=new_results[step_id], tool_call_id=f"plan_step_{step_id}", name=steps[step_id]["tool_name"])
+            for step_id in finished_order
+        ]
+        return {"step_results": new_results, "messages": messages}
+
+    return dag_executor_node
+
+
+def make_replanner_node(replan_fn):
+    """
+    replan_fn(state) が新しい計画を返したら、変更のあったステップとその下流の結果だけを無効化して計画を差し替えるノードを作る。
+    None を返した場合は計画をそのまま確定する。
+    """
+    def replanner_node(state: DagPlanExecuteState):
+        new_plan = replan_fn(state)
+        if new_plan is None:
+            return {}
+        invalidated = invalidate_changed_steps(state["plan"], new_plan, state.get("step_results"))
+        return {
+            "plan": normalize_plan(new_plan),
+            "step_results": invalidated,
+            "replan_count": state.get("replan_count", 0) + 1,
+            "messages": [AIMessage(content=f"計画を修正しました。再実行するステップ: {sorted(invalidated)}")],
+        }
+
+    return replanner_node
+
+
+def final_answer_node(state: DagPlanExecuteState):
+    plan = normalize_plan(state.get("plan"))
+    results = state.get("step_results") or {}
+    if plan and plan[-1]["id"] in results:
+        answer = f"計画の最終結果: {results[plan[-1]['id']]}"
+    else:
+        answer = "計画が実行されなかったか、結果がありませんでした。"
+    return {"final_answer": answer, "messages": [AIMessage(content=answer)]}
+
+
+def route_after_replan(state: DagPlanExecuteState):
+    plan = normalize_plan(state.get("plan"))
+    results = state.get("step_results") or {}
+    return "execute" if any(step["id"] not in results for step in plan) else "finish"
+
+
+def build_dag_plan_execute_graph(planner_node, tools, max_concurrency=4, replan_fn=None, checkpointer=None):
+    """
+    planner → dag_executor → replanner → (未実行のステップがあれば dag_executor へ戻る / なければ final_answerer) のグラフを作る。
+    planner_node は {"plan": [...]} を返すノード。replan_fn を省略すると再計画は行わない。
+    """
+    workflow = StateGraph(DagPlanExecuteState)
+    workflow.add_node("planner", planner_node)
+    workflow.add_node("dag_executor", make_dag_executor_node(tools, max_concurrency))
+    workflow.add_node("replanner", make_replanner_node(replan_fn or (lambda state: None)))
+    workflow.add_node("final_answerer", final_answer_node)
+    workflow.set_entry_point("planner")
+    workflow.add_edge("planner", "dag_executor")
+    workflow.add_edge("dag_executor", "replanner")
+    workflow.add_conditional_edges("replanner", route_after_replan, {"execute": "dag_executor", "finish": "final_answerer"})
+    workflow.add_edge("final_answerer", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+# --- ベンチマーク ---
+
+@tool
+def simulated_step(label: str, latency: float) -> str:
+    """latency 秒待ってから label を返す (外部APIなどの待ち時間を模擬するツール)。"""
+    time.sleep(latency)
+    return f"{label}:done"
+
+
+def make_layered_plan(layers, width, latency_range=(0.02, 0.1), seed=0):
+    """
+    width 個ずつのステップが layers 段に並び、各ステップが前段のステップ1〜2個に依存する計画を作る (ランダムな DAG)。
+    """
+    rng = random.Random(seed)
+    plan, previous = [], []
+    for layer in range(layers):
+        current = []
+        for i in range(width):
+            step_id = f"L{layer}_{i}"
+            depends_on = rng.sample(previous, k=min(len(previous), rng.randint(1, 2))) if previous else []
+            plan.append({
+                "id": step_id,
+                "tool_name": "simulated_step",
+                "args": {"label": step_id, "latency": round(rng.uniform(*latency_range), 3)},
+                "step_description": f"{step_id} を実行する",
+                "depends_on": depends_on,
+            })
+            current.append(step_id)
+        previous = current
+    return plan
+
+
+def run_benchmark(shapes=((3, 4), (5, 6), (8, 8)), concurrency_levels=(1, 4, 16), seed=0):
+    """
+    計画の形 (段数, 1段あたりのステップ数) ごとに、各同時実行数での実測時間と、
+    全ステップの合計時間・クリティカルパスの時間 (いずれもツールの待ち時間から計算した理論値) を返す。
+    同時実行数1は、問題006と同じ逐次実行に相当する。
+    """
+    rows = []
+    for layers, width in shapes:
+        plan = make_layered_plan(layers, width, seed=seed)
+        latencies = {step["id"]: step["args"]["latency"] for step in plan}
+        row = {
+            "steps": len(plan),
+            "shape": f"{layers}x{width}",
+            "sum_latency": sum(latencies.values()),
+            "critical_path": critical_path_time(plan, latencies),
+            "measured": {},
+        }
+        for concurrency in concurrency_levels:
+            start = time.perf_counter()
+            execute_plan(plan, [simulated_step], max_concurrency=concurrency)
+            row["measured"][concurrency] = time.perf_counter() - start
+        rows.append(row)
+    return rows
+
+
+def print_benchmark(rows, concurrency_levels):
+    header = " ".join(f"{f'同時{c}[s]':>10}" for c in concurrency_levels)
+    print(f"{'形(段x幅)':>10} {'ステップ数':>8} {'合計[s]':>8} {'クリティカルパス[s]':>18} {header}")
+    for row in rows:
+        measured = " ".join(f"{row['measured'][c]:>10.3f}" for c in concurrency_levels)
+        print(f"{row['shape']:>10} {row['steps']:>8d} {row['sum_latency']:>8.3f} {row['critical_path']:>18.3f} {measured}")
+
+
+if __name__ == "__main__":
+    concurrency_levels = (1, 4, 16)
+    print("--- 逐次実行 (同時1) と DAG 並行実行の比較 ---")
+    print_benchmark(run_benchmark(concurrency_levels=concurrency_levels), concurrency_levels)
+
+    print("\n--- グラフでの実行と再計画 ---")
+    # 3つの調査を並行に行い、2つずつ要約してから最終レポートにまとめる計画
+    research_plan = [
+        {"id": "fetch_a", "tool_name": "simulated_step", "args": {"label": "LangGraphの資料", "latency": 0.2}, "step_description": "資料Aを集める", "depends_on": []},
+        {"id": "fetch_b", "tool_name": "simulated_step", "args": {"label": "CrewAIの資料", "latency": 0.2}, "step_description": "資料Bを集める", "depends_on": []},
+        {"id": "fetch_c", "tool_name": "simulated_step", "args": {"label": "AutoGenの資料", "latency": 0.2}, "step_description": "資料Cを集める", "depends_on": []},
+        {"id": "summary_ab", "tool_name": "simulated_step", "args": {"label": "要約(<step:fetch_a>, <step:fetch_b>)", "latency": 0.1}, "step_description": "AとBを要約する", "depends_on": ["fetch_a", "fetch_b"]},
+        {"id": "summary_c", "tool_name": "simulated_step", "args": {"label": "要約(<step:fetch_c>)", "latency": 0.1}, "step_description": "Cを要約する", "depends_on": ["fetch_c"]},
+        {"id": "report", "tool_name": "simulated_step", "args": {"label": "レポート(<step:summary_ab>, <step:summary_c>)", "latency": 0.1}, "step_description": "レポートにまとめる", "depends_on": ["summary_ab", "summary_c"]},
+    ]
+
+    def planner_node(state: DagPlanExecuteState):
+        return {"plan": research_plan, "step_results": {}, "replan_count": 0,
+                "messages": [AIMessage(content=f"{len(research_plan)}ステップの計画を立てました。")]}
+
+    def replan_fn(state: DagPlanExecuteState):
+        # 1回目の実行後に、資料Cの調査対象だけを差し替える (fetch_a / fetch_b / summary_ab は再実行されない)
+        if state.get("replan_count", 0) > 0:
+            return None
+        new_plan = [dict(step) for step in state["plan"]]
+        new_plan[2] = dict(new_plan[2], args={"label": "Swarmの資料", "latency": 0.2})
+        return new_plan
+
+    graph = build_dag_plan_execute_graph(planner_node, [simulated_step], max_concurrency=4, replan_fn=replan_fn)
+    start = time.perf_counter()
+    final_state = graph.invoke({"user_request": "エージェントフレームワークを比較して", "messages": [HumanMessage(content="エージェントフレームワークを比較して")]})
+    elapsed = time.perf_counter() - start
+    executed = [m.tool_call_id.removeprefix("plan_step_") for m in final_state["messages"] if isinstance(m, ToolMessage)]
+    print(f"実行したステップ (完了順): {executed}")
+    print(final_state["final_answer"])
+    print(f"所要時間: {elapsed:.2f}秒 (逐次実行なら初回だけで {sum(s['args']['latency'] for s in research_plan):.2f}秒)")
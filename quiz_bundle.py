@@ -0,0 +1,443 @@
+"""
+穴埋め問題 (1_easy / 2_normal / 3_hard) を1つの SQLite ファイルにまとめるビルドターゲット。
+
+生成済みの演習はノートブック (1ファイル 100〜170KB) としてしか存在しないため、
+Web のフロントエンドが1つの問題の1つの難易度を表示するだけでも、ノートブック全体を読み込んで解析する必要がある。
+このモジュールは全章・全問題・全難易度の解答欄セルを取り出して、次の形で SQLite に書き出す。
+
+*   exercises: (chapter, problem, part, difficulty) を主キーとする表。穴埋めコードへの参照と答え (穴ごとの正解トークンの JSON) を持つ
+*   problems: (chapter, problem) ごとの問題文・解答例・解説への参照 (難易度によらず共通)
+*   contents: 本文をハッシュで重複排除して1回だけ保存する表 (問題文・解答例・解説・穴埋め前後のコード)
+
+exercises と problems は WITHOUT ROWID の主キー (クラスタ化インデックス)、contents はハッシュの一意インデックスで引くため、
+1つの演習は演習の件数によらず1回のクエリ (数回の B-tree 検索) で取り出せる。
+
+答えは、穴埋めされた行を元のノートブック (リポジトリ直下) の解答欄セル、見つからなければ解答例 (<details> 内のコード) の行と
+照合して求める。難易度別のノートブックには手作業で調整された穴もあるため、照合できなかった穴の答えは None になる。
+
+使い方:
+
+    python quiz_bundle.py build                      # quiz_bundle.sqlite を作る
+    python quiz_bundle.py get 3_single_agent 006 1 hard
+
+    from quiz_bundle import QuizBundle
+    with QuizBundle("quiz_bundle.sqlite") as bundle:
+        exercise = bundle.get("3_single_agent", "006", 1, "hard")
+"""
+import argparse
+import difflib
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+from verify_notebooks import find_corresponding_answer_cell_indices, find_problem_cells
+
+CHAPTERS = ("1_basics", "2_control_flow", "3_single_agent", "4_multi_agent", "5_advanced")
+DIFFICULTY_DIRS = {"easy": "1_easy", "normal": "2_normal", "hard": "3_hard"}
+BLANK = "____"
+DEFAULT_BUNDLE_PATH = "quiz_bundle.sqlite"
+
+# 穴1つ分にマッチするトークン (識別子か、1行内の文字列リテラル)。照合できなければ任意の式 (最短 → 最長) で再試行する
+_TOKEN_PATTERN = r"(\w+|\"[^\"\n]*\"|'[^'\n]*')"
+_EXPRESSION_PATTERNS = (r"(.+?)", r"(.+)")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS contents (
+    hash TEXT PRIMARY KEY,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS problems (
+    chapter TEXT NOT NULL,
+    problem TEXT NOT NULL,
+    title TEXT NOT NULL,
+    statement_hash TEXT NOT NULL,
+    solution_hash TEXT,
+    explanation_hash TEXT,
+    PRIMARY KEY (chapter, problem)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS exercises (
+    chapter TEXT NOT NULL,
+    problem TEXT NOT NULL,
+    part INTEGER NOT NULL,
+    difficulty TEXT NOT NULL,
+    label TEXT NOT NULL,
+    cell_index INTEGER NOT NULL,
+    code_hash TEXT NOT NULL,
+    answer_keys TEXT NOT NULL,
+    blank_count INTEGER NOT NULL,
+    original_hash TEXT,
+    PRIMARY KEY (chapter, problem, part, difficulty)
+) WITHOUT ROWID;
+"""
+
+_GET_EXERCISE_SQL = """
+SELECT e.label, e.cell_index, c.body, e.answer_keys, e.blank_count, p.title, s.body
+FROM exercises AS e
+JOIN problems AS p ON p.chapter = e.chapter AND p.problem = e.problem
+JOIN contents AS c ON c.hash = e.code_hash
+JOIN contents AS s ON s.hash = p.statement_hash
+WHERE e.chapter = ? AND e.problem = ? AND e.part = ? AND e.difficulty = ?
+"""
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def load_notebook(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _source(cell):
+    source = cell.get("source", [])
+    return "".join(source) if isinstance(source, list) else source
+
+
+def _source_lines(cell):
+    return _source(cell).splitlines(keepends=True)
+
+
+def find_problems(cells):
+    """
+    ノートブックのセルから問題ごとの情報 (問題番号・タイトル・問題文・解答欄セル・解答例・解説) を取り出す。
+    戻り値は {問題番号 ("001" 形式): dict} の辞書。
+    """
+    problems = {}
+    for p_idx in find_problem_cells(cells):
+        statement = _source(cells[p_idx])
+        match = re.search(r"### ■ 問題(\d+)", statement)
+        if not match:
+            continue
+        number = match.group(1).zfill(3)
+        info = {
+            "problem_index": p_idx,
+            "title": statement.splitlines()[0].replace("### ■ ", "").strip(),
+            "statement": statement,
+            "answer_indices": find_corresponding_answer_cell_indices(cells, p_idx, number),
+            "solution": None,
+            "explanation": None,
+        }
+        for cell in cells[p_idx + 1:]:
+            text = _source(cell)
+            if cell["cell_type"] == "markdown" and text.startswith("### ■ 問題"):
+                break
+            if cell["cell_type"] == "markdown" and f"<summary>解答{number}</summary>" in text:
+                info["solution"] = text
+            elif cell["cell_type"] == "markdown" and f"<summary>解説{number}</summary>" in text:
+                info["explanation"] = text
+        problems[number] = info
+    return problems
+
+
+def solution_code_lines(solution_markdown):
+    """解答例 (<details> 内の ```python ... ```) のコードを行のリストで返す。"""
+    if not solution_markdown:
+        return []
+    match = re.search(r"```+python\n(.*?)```", solution_markdown, re.S)
+    return match.group(1).splitlines(keepends=True) if match else []
+
+
+def part_label(cell_lines):
+    """'# 解答欄006 - グラフ構築' の「グラフ構築」の部分 (なければ空文字)。"""
+    first = cell_lines[0].strip() if cell_lines else ""
+    return first.split("-", 1)[1].strip() if "-" in first else ""
+
+
+def _comment_start(line):
+    """行末コメント (# 以降) の開始位置。文字列リテラル内の # は無視する。コメントがなければ None。"""
+    quote = None
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if quote:
+            if char == "\\":
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char == "#":
+            return i
+        i += 1
+    return None
+
+
+def strip_comment(line):
+    """行末コメントを除いた行 (末尾の空白も除く)。"""
+    start = _comment_start(line)
+    return (line if start is None else line[:start]).rstrip()
+
+
+def _blank_patterns(line):
+    parts = [re.escape(part) for part in line.rstrip("\n").split(BLANK)]
+    return [re.compile(pattern.join(parts) + r"\s*\Z") for pattern in (_TOKEN_PATTERN, *_EXPRESSION_PATTERNS)]
+
+
+def is_balanced(text):
+    """括弧と引用符が閉じているか (穴1つ分の式として切り出せているか)。"""
+    depth, quote, i = 0, None, 0
+    while i < len(text):
+        char = text[i]
+        if quote:
+            if char == "\\":
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth -= 1
+            if depth < 0:
+                return False
+        i += 1
+    return depth == 0 and quote is None
+
+
+def _match_line(patterns, candidates, ignore_comments=False):
+    for pattern in patterns:
+        for candidate in candidates:
+            if BLANK in candidate:
+                continue
+            match = pattern.match(strip_comment(candidate) if ignore_comments else candidate.rstrip("\n"))
+            if match and all(is_balanced(group) for group in match.groups()):
+                return [group.strip() for group in match.groups()]
+    return None
+
+
+def extract_answer_keys(blanked_lines, original_lines, solution_lines=()):
+    """
+    穴埋めされたコードの各穴 (____) の答えを、出現順のリストで返す (照合できなかった穴は None)。
+    まず difflib で行を対応付け、対応する範囲の元の行 → 元のセル全体 (近い行から) → 解答例の行 の順に照合する。
+    """
+    matcher = difflib.SequenceMatcher(None, blanked_lines, original_lines, autojunk=False)
+    aligned = {}  # 穴埋め後の行番号 -> (対応する元の範囲, 最も近い元の行番号)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        for i in range(i1, i2):
+            aligned[i] = (j1, j2, min(j1 + (i - i1), max(j2 - 1, j1)))
+    keys = []
+    for i, line in enumerate(blanked_lines):
+        count = line.count(BLANK)
+        if not count:
+            continue
+        # コメントに穴がなければ、コメントを除いて照合する (元の行のコメントが答えに混ざらないように)
+        comment = _comment_start(line)
+        ignore_comments = comment is None or BLANK not in line[comment:]
+        patterns = _blank_patterns(strip_comment(line) if ignore_comments else line)
+        j1, j2, expected = aligned.get(i, (0, 0, i))
+        nearby = sorted(range(len(original_lines)), key=lambda j: abs(j - expected))
+        groups = (
+            _match_line(patterns, original_lines[j1:j2], ignore_comments)
+            or _match_line(patterns, [original_lines[j] for j in nearby], ignore_comments)
+            or _match_line(patterns, list(solution_lines), ignore_comments)
+        )
+        keys.extend(groups if groups and len(groups) == count else [None] * count)
+    return keys
+
+
+def iter_exercises(root_dir="."):
+    """
+    全章・全難易度の解答欄セルを1つずつ dict で返す。
+    キー: chapter, problem, part (1始まり), difficulty, label, cell_index, title, statement, solution, explanation,
+    blanked_code, original_code, answer_keys
+    """
+    for chapter in CHAPTERS:
+        base_path = os.path.join(root_dir, f"{chapter}.ipynb")
+        if not os.path.exists(base_path):
+            continue
+        base_cells = load_notebook(base_path)["cells"]
+        base_problems = find_problems(base_cells)
+        for difficulty, directory in DIFFICULTY_DIRS.items():
+            variant_path = os.path.join(root_dir, directory, f"{chapter}.ipynb")
+            if not os.path.exists(variant_path):
+                continue
+            variant_cells = load_notebook(variant_path)["cells"]
+            for number, info in find_problems(variant_cells).items():
+                base = base_problems.get(number, info)
+                solution_lines = solution_code_lines(base["solution"])
+                for part, cell_index in enumerate(info["answer_indices"], start=1):
+                    blanked_lines = _source_lines(variant_cells[cell_index])
+                    base_indices = base.get("answer_indices", [])
+                    original_lines = _source_lines(base_cells[base_indices[part - 1]]) if part <= len(base_indices) else []
+                    yield {
+                        "chapter": chapter,
+                        "problem": number,
+                        "part": part,
+                        "difficulty": difficulty,
+                        "label": part_label(blanked_lines),
+                        "cell_index": cell_index,
+                        "title": base["title"],
+                        "statement": base["statement"],
+                        "solution": base["solution"],
+                        "explanation": base["explanation"],
+                        "blanked_code": "".join(blanked_lines),
+                        "original_code": "".join(original_lines) or None,
+                        "answer_keys": extract_answer_keys(blanked_lines, original_lines, solution_lines),
+                    }
+
+
+def build_bundle(root_dir=".", path=DEFAULT_BUNDLE_PATH):
+    """
+    全演習を SQLite のバンドルに書き出し、件数などの統計を返す。既存のファイルは置き換える。
+    書き込みは一時ファイルに行ってから置き換えるため、読み込み中のサーバーが途中の状態を見ることはない。
+    """
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    stats = {"exercises": 0, "problems": 0, "contents": 0, "blanks": 0, "unresolved_blanks": 0}
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        seen_contents, seen_problems = set(), set()
+
+        def put_content(text):
+            if text is None:
+                return None
+            digest = content_hash(text)
+            if digest not in seen_contents:
+                seen_contents.add(digest)
+                conn.execute("INSERT INTO contents (hash, body) VALUES (?, ?)", (digest, text))
+            return digest
+
+        for exercise in iter_exercises(root_dir):
+            problem_key = (exercise["chapter"], exercise["problem"])
+            if problem_key not in seen_problems:
+                seen_problems.add(problem_key)
+                conn.execute(
+                    "INSERT INTO problems VALUES (?, ?, ?, ?, ?, ?)",
+                    (*problem_key, exercise["title"], put_content(exercise["statement"]),
+                     put_content(exercise["solution"]), put_content(exercise["explanation"])),
+                )
+            keys = exercise["answer_keys"]
+            commented = [key for key in keys if key is not None and _comment_start(key) is not None]
+            if commented:
+                raise ValueError(f"{problem_key} パート{exercise['part']} ({exercise['difficulty']}) の答えにコメントが含まれています: {commented}")
+            conn.execute(
+                "INSERT INTO exercises VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*problem_key, exercise["part"], exercise["difficulty"], exercise["label"], exercise["cell_index"],
+                 put_content(exercise["blanked_code"]), json.dumps(keys, ensure_ascii=False), len(keys), put_content(exercise["original_code"])),
+            )
+            stats["exercises"] += 1
+            stats["blanks"] += len(keys)
+            stats["unresolved_blanks"] += sum(key is None for key in keys)
+        stats["problems"] = len(seen_problems)
+        stats["contents"] = len(seen_contents)
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("built_at", time.strftime("%Y-%m-%dT%H:%M:%S")),
+            ("stats", json.dumps(stats)),
+        ])
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return stats
+
+
+class QuizBundle:
+    """
+    build_bundle で作った SQLite バンドルの読み取り専用ビュー。
+    get は (chapter, problem, part, difficulty) の主キー検索1回で、問題文・穴埋めコード・答えを返す。
+    """
+
+    def __init__(self, path=DEFAULT_BUNDLE_PATH):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} がありません。先に `python quiz_bundle.py build` を実行してください。")
+        self.path = path
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get(self, chapter, problem, part, difficulty):
+        """演習を dict で返す。存在しなければ None。"""
+        row = self.conn.execute(_GET_EXERCISE_SQL, (chapter, str(problem).zfill(3), int(part), difficulty)).fetchone()
+        if row is None:
+            return None
+        label, cell_index, blanked_code, answer_keys, blank_count, title, statement = row
+        return {
+            "chapter": chapter, "problem": str(problem).zfill(3), "part": int(part), "difficulty": difficulty,
+            "label": label, "cell_index": cell_index, "title": title, "statement": statement,
+            "blanked_code": blanked_code, "answer_keys": json.loads(answer_keys), "blank_count": blank_count,
+        }
+
+    def get_content(self, digest):
+        row = self.conn.execute("SELECT body FROM contents WHERE hash = ?", (digest,)).fetchone()
+        return row[0] if row else None
+
+    def get_problem(self, chapter, problem):
+        """問題文・解答例・解説を dict で返す (難易度によらず共通)。"""
+        row = self.conn.execute(
+            "SELECT title, statement_hash, solution_hash, explanation_hash FROM problems WHERE chapter = ? AND problem = ?",
+            (chapter, str(problem).zfill(3)),
+        ).fetchone()
+        if row is None:
+            return None
+        title, statement_hash, solution_hash, explanation_hash = row
+        return {
+            "chapter": chapter, "problem": str(problem).zfill(3), "title": title,
+            "statement": self.get_content(statement_hash),
+            "solution": self.get_content(solution_hash) if solution_hash else None,
+            "explanation": self.get_content(explanation_hash) if explanation_hash else None,
+        }
+
+    def list_exercises(self):
+        """(chapter, problem, part, difficulty) の一覧を主キー順で返す。"""
+        return self.conn.execute("SELECT chapter, problem, part, difficulty FROM exercises ORDER BY 1, 2, 3, 4").fetchall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="穴埋め問題の SQLite バンドル")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="ノートブックからバンドルを作る")
+    build_parser.add_argument("--root", default=".")
+    build_parser.add_argument("--out", default=DEFAULT_BUNDLE_PATH)
+    get_parser = subparsers.add_parser("get", help="演習を1つ取り出して表示する")
+    get_parser.add_argument("chapter")
+    get_parser.add_argument("problem")
+    get_parser.add_argument("part", type=int)
+    get_parser.add_argument("difficulty", choices=list(DIFFICULTY_DIRS))
+    get_parser.add_argument("--bundle", default=DEFAULT_BUNDLE_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        build_stats = build_bundle(args.root, args.out)
+        notebook_bytes = sum(
+            os.path.getsize(os.path.join(args.root, directory, f"{chapter}.ipynb"))
+            for directory in DIFFICULTY_DIRS.values() for chapter in CHAPTERS
+            if os.path.exists(os.path.join(args.root, directory, f"{chapter}.ipynb"))
+        )
+        print(f"{args.out} を作成しました ({time.perf_counter() - start:.2f}秒)")
+        print(f"  演習 {build_stats['exercises']}件 / 問題 {build_stats['problems']}件 / コンテンツ {build_stats['contents']}件 (重複排除後)")
+        print(f"  穴 {build_stats['blanks']}個 (答えを照合できなかった穴 {build_stats['unresolved_blanks']}個)")
+        print(f"  サイズ: {os.path.getsize(args.out) / 1024:.0f} KB (難易度別ノートブックの合計 {notebook_bytes / 1024:.0f} KB)")
+        with QuizBundle(args.out) as bundle:
+            keys = bundle.list_exercises()
+            start = time.perf_counter()
+            for key in keys:
+                bundle.get(*key)
+            print(f"  1件あたりの取り出し時間: {(time.perf_counter() - start) / len(keys) * 1e6:.0f} µs ({len(keys)}件の平均)")
+    else:
+        with QuizBundle(args.bundle) as bundle:
+            exercise = bundle.get(args.chapter, args.problem, args.part, args.difficulty)
+        if exercise is None:
+            raise SystemExit("該当する演習がありません。")
+        print(f"{exercise['title']} (パート{exercise['part']}: {exercise['label']}, 難易度: {exercise['difficulty']})\n")
+        print(exercise["blanked_code"])
+        print(f"\n答え: {exercise['answer_keys']}")
@@ -0,0 +1,498 @@
+"""
+穴埋め問題の提出をまとめて採点するモジュール。
+
+提出1件は次の形の dict (JSONL の1行) で、fills (穴ごとの値のリスト) か cell (穴を埋めたセル全体) のどちらかを持つ。
+
+    {"learner": "u001", "chapter": "1_basics", "problem": "001", "difficulty": "easy", "part": 1, "fills": ["StateGraph", ...]}
+    {"learner": "u002", "chapter": "1_basics", "problem": "001", "difficulty": "easy", "cell": "# 解答欄001\\n..."}
+
+答えは quiz_bundle.py のバンドル (answer_keys) を使い、次の正規化をしてから比べる。
+
+*   空白: トークンの間の空白は無視する (`add_edge( "a" ,"b")` と `add_edge("a", "b")` は同じ)
+*   文字列リテラルの引用符: 'x' と "x" は同じ
+*   import の別名: 穴を埋めたセルの import 文から別名を解決する
+    (`from langgraph.graph import StateGraph as SG` としたうえでの `SG` や、`import langgraph.graph as lg` での
+    `lg.StateGraph` は `StateGraph` と同じ)。import 文の穴に `StateGraph as SG` と書いた場合は `StateGraph` として扱う
+
+大量の提出を速く採点するため、次のようにしている。
+
+*   正規化の結果は (値, import の別名) ごとにキャッシュし、答えは演習ごとに1回だけ正規化しておく
+*   同じ演習への同じ提出 (正規化後) は1回だけ比べ、結果を使い回す
+*   提出を演習ごとに並べてからチャンクに分け、複数プロセスで採点する (CPU が1個なら同じプロセスで採点する)
+
+答えを照合できていない穴 (answer_keys が None) は採点対象外 (結果は None) とする。
+
+使い方:
+
+    python quiz_grader.py grade submissions.jsonl --out results.jsonl --stats stats.json
+    python quiz_grader.py bench --submissions 100000       # 合成した提出で計測する
+"""
+import argparse
+import ast
+import json
+import operator
+import os
+import random
+import re
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from quiz_bundle import BLANK, DEFAULT_BUNDLE_PATH, DIFFICULTY_DIRS, QuizBundle, extract_answer_keys, is_balanced
+
+# 文字列リテラル (接頭辞つきを含む) / ドットでつながった名前 / 数値 / その他の1文字
+_TOKEN_RE = re.compile(
+    r"""[rRbBuUfF]{0,2}(?:"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')"""
+    r"|[A-Za-z_]\w*(?:\s*\.\s*[A-Za-z_]\w*)*"
+    r"|\d[\w.]*"
+    r"|\S"
+)
+_IMPORT_ALIAS_FILL_RE = re.compile(r"^\s*([A-Za-z_][\w.]*)\s+as\s+[A-Za-z_]\w*\s*$")
+_IMPORT_LINE_RE = re.compile(r"^\s*(?:from\s+\S+\s+)?import\s")
+
+
+def fill_blanks(blanked_code, fills):
+    """穴 (____) を先頭から順に fills で埋めたコードを返す (値が None の穴はそのまま残す)。"""
+    pieces = blanked_code.split(BLANK)
+    out = [pieces[0]]
+    for i, piece in enumerate(pieces[1:]):
+        fill = fills[i] if i < len(fills) else None
+        out.append(BLANK if fill is None else str(fill))
+        out.append(piece)
+    return "".join(out)
+
+
+def import_statements(code):
+    """コードから import 文だけを取り出す (括弧で複数行にまたがる from import を含む)。"""
+    statements, current, depth = [], [], 0
+    for line in code.splitlines():
+        if current or _IMPORT_LINE_RE.match(line):
+            current.append(line.strip())
+            depth += line.count("(") - line.count(")")
+            if depth <= 0 and not line.rstrip().endswith("\\"):
+                statements.append(" ".join(current).replace("\\", " "))
+                current, depth = [], 0
+    return statements
+
+
+@lru_cache(maxsize=65536)
+def _aliases_for_imports(statements):
+    aliases = {}
+    for statement in statements:
+        try:
+            nodes = ast.parse(statement).body
+        except SyntaxError:
+            continue  # 書きかけの import 文は無視する
+        for node in nodes:
+            if isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                for name in node.names:
+                    if name.name == "*":
+                        continue
+                    qualified = f"{node.module}.{name.name}"
+                    aliases[name.name] = qualified
+                    if name.asname:
+                        aliases[name.asname] = qualified
+            elif isinstance(node, ast.Import):
+                for name in node.names:
+                    if name.asname:
+                        aliases[name.asname] = name.name
+    return tuple(sorted(aliases.items()))
+
+
+def import_aliases(code):
+    """import 文から {名前: 完全修飾名} の対応を作り、キャッシュのキーに使えるタプルで返す。"""
+    return _aliases_for_imports(tuple(import_statements(code)))
+
+
+def _resolve_name(dotted, aliases):
+    parts = dotted.split(".")
+    for end in range(len(parts), 0, -1):
+        qualified = aliases.get(".".join(parts[:end]))
+        if qualified is not None:
+            return ".".join([qualified, *parts[end:]])
+    return dotted
+
+
+def _canonical_string(token):
+    prefix_length = len(token) - len(token.lstrip("rRbBuUfF"))
+    prefix, body = token[:prefix_length].lower(), token[prefix_length:]
+    if body.startswith("'") and '"' not in body and "\\" not in body:
+        body = '"' + body[1:-1] + '"'
+    return prefix + body
+
+
+@lru_cache(maxsize=262144)
+def canonical_fill(fill, aliases=()):
+    """
+    穴1つ分の値を比較用の正規形にする。aliases は import_aliases の戻り値。
+    空白を除いたトークン列をスペース1つでつなぎ、名前は import の別名を完全修飾名に、文字列は二重引用符にそろえる。
+    """
+    if fill is None:
+        return None
+    match = _IMPORT_ALIAS_FILL_RE.match(fill)
+    if match:
+        fill = match.group(1)
+    alias_map = dict(aliases)
+    tokens = []
+    for token in _TOKEN_RE.findall(fill):
+        first = token[0]
+        if first in "\"'" or (len(token) > 1 and token[-1] in "\"'"):
+            tokens.append(_canonical_string(token))
+        elif first.isalpha() or first == "_":
+            tokens.append(_resolve_name(re.sub(r"\s+", "", token), alias_map))
+        else:
+            tokens.append(token)
+    return " ".join(tokens)
+
+
+class AnswerSheet:
+    """1つの演習の答え。穴埋めコード・答え・import 文の穴の位置と、正規化済みの答えを持つ。"""
+
+    def __init__(self, blanked_code, answer_keys):
+        self.blanked_code = blanked_code
+        self.answer_keys = tuple(answer_keys)
+        # import 文の中にある穴の番号 (提出側の import の別名は、この穴の値だけで決まる)
+        self.import_blank_indices = []
+        index = 0
+        for line in blanked_code.splitlines():
+            count = line.count(BLANK)
+            if count and _IMPORT_LINE_RE.match(line):
+                self.import_blank_indices.extend(range(index, index + count))
+            index += count
+        self.import_blank_indices = tuple(self.import_blank_indices)
+        self.expected_aliases = import_aliases(fill_blanks(blanked_code, self.answer_keys))
+        self.expected = tuple(canonical_fill(key, self.expected_aliases) for key in self.answer_keys)
+
+    def learner_aliases(self, fills):
+        """fills での提出側の import の別名。import 文の穴の値が同じ提出どうしで結果を使い回す。"""
+        if not self.import_blank_indices:
+            return self.expected_aliases  # import 文に穴がなければ、import 文は答えのセルと同じ
+        return _learner_aliases_from_fills(self, tuple(fills[i] for i in self.import_blank_indices))
+
+
+@lru_cache(maxsize=65536)
+def _learner_aliases_from_fills(sheet, import_fills):
+    fills = [None] * len(sheet.answer_keys)
+    for index, fill in zip(sheet.import_blank_indices, import_fills):
+        fills[index] = fill
+    return import_aliases(fill_blanks(sheet.blanked_code, fills))
+
+
+def load_answer_sheets(bundle_path=DEFAULT_BUNDLE_PATH):
+    """バンドルの全演習の AnswerSheet を {(chapter, problem, difficulty, part): AnswerSheet} で返す。"""
+    sheets = {}
+    with QuizBundle(bundle_path) as bundle:
+        for chapter, problem, part, difficulty in bundle.list_exercises():
+            exercise = bundle.get(chapter, problem, part, difficulty)
+            sheets[(chapter, problem, difficulty, part)] = AnswerSheet(exercise["blanked_code"], exercise["answer_keys"])
+    return sheets
+
+
+def submission_key(submission):
+    """
+    提出の (chapter, problem, difficulty, part)。次の場合は None (採点しない)。
+    必要な項目がない / chapter・difficulty が文字列でない / problem が文字列・整数でない / part が整数にならない /
+    cell が文字列でない / fills がリストでない
+    """
+    if not isinstance(submission, dict):
+        return None
+    chapter, problem, difficulty = submission.get("chapter"), submission.get("problem"), submission.get("difficulty")
+    if not (isinstance(chapter, str) and isinstance(difficulty, str) and isinstance(problem, (str, int))):
+        return None
+    if not isinstance(submission.get("cell", ""), str) or not isinstance(submission.get("fills") or [], list):
+        return None
+    try:
+        return chapter, str(problem).zfill(3), difficulty, int(submission.get("part", 1))
+    except (TypeError, ValueError):
+        return None
+
+
+_DOTTED_NAME_RE = re.compile(r"(?<![\w.])[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*")
+
+
+def unalias_cell(sheet, cell):
+    """
+    セル全体の提出で使われている import の別名を、答えのセルでの名前に戻す (import 文の行はそのまま)。
+    例: `import langgraph.graph as lg` のあとの `lg.StateGraph` → `StateGraph` (答えのセルが StateGraph を import している場合)
+    """
+    learner = dict(import_aliases(cell))
+    local_names = {qualified: name for name, qualified in sheet.expected_aliases}
+    if not learner or all(local_names.get(qualified) == name for name, qualified in learner.items()):
+        return cell
+
+    def rename(match):
+        parts = match.group(0).split(".")
+        for end in range(len(parts), 0, -1):
+            local = local_names.get(_resolve_name(".".join(parts[:end]), learner))
+            if local is not None:
+                return ".".join([local, *parts[end:]])
+        return match.group(0)
+
+    return "".join(
+        line if _IMPORT_LINE_RE.match(line) else _DOTTED_NAME_RE.sub(rename, line)
+        for line in cell.splitlines(keepends=True)
+    )
+
+
+def _fills_by_literals(blanked_code, cell):
+    """
+    穴以外の部分がそのまま残っているセルから、穴の値を先頭から順に切り出す (穴の値は1行に収まるものに限る)。
+    切り出せなければ None。
+    """
+    pieces = blanked_code.split(BLANK)
+    if len(pieces) == 1:
+        return []
+    text, tail = cell.rstrip(), pieces[-1].rstrip()
+    if not text.startswith(pieces[0]) or not text.endswith(tail):
+        return None
+    end = len(text) - len(tail)
+    fills, position = [], len(pieces[0])
+    for piece in pieces[1:-1]:
+        found = text.find(piece, position) if piece else position
+        if found < 0 or found > end or "\n" in text[position:found]:
+            return None
+        fills.append(text[position:found])
+        position = found + len(piece)
+    if position > end or "\n" in text[position:end]:
+        return None
+    fills.append(text[position:end])
+    return fills
+
+
+@lru_cache(maxsize=16384)
+def fills_from_cell(sheet, cell):
+    """
+    穴を埋めたセルから、穴ごとの値を取り出す (対応する行が見つからない穴は None)。
+    別名は unalias_cell で答えのセルの名前に戻してから照合するため、値は答えのセルの import で正規化できる。
+    穴以外の部分を書き換えていないセルは文字列の検索だけで取り出し、それ以外は行の対応付け (quiz_bundle.extract_answer_keys) を使う。
+    1行に穴が複数ある場合、文字列の検索では値の中のカンマなどで切り間違えることがあるため、括弧の閉じていない値が出たら行の対応付けに回す。
+    """
+    cell = unalias_cell(sheet, cell)
+    fills = _fills_by_literals(sheet.blanked_code, cell)
+    if fills is not None and all(map(is_balanced, fills)):
+        return [fill.strip() for fill in fills]
+    return extract_answer_keys(sheet.blanked_code.splitlines(keepends=True), cell.splitlines(keepends=True))
+
+
+def grade_group(sheet, submissions):
+    """
+    同じ演習への提出をまとめて採点し、提出ごとの (正解数, 採点対象の穴の数, 穴ごとの結果) を返す。
+    正規化後の提出が同じなら比較は1回だけ行う。
+    """
+    blank_count = len(sheet.answer_keys)
+    gradable = sum(key is not None for key in sheet.answer_keys)
+    graded = {}
+    results = []
+    for submission in submissions:
+        cell = submission.get("cell")
+        fills = list(submission.get("fills") or [] if cell is None else fills_from_cell(sheet, cell))
+        fills = [None if fill is None else str(fill) for fill in (fills + [None] * blank_count)[:blank_count]]
+        aliases = sheet.learner_aliases(fills) if cell is None else sheet.expected_aliases
+        learner = tuple(map(canonical_fill, fills, [aliases] * blank_count))
+        result = graded.get(learner)
+        if result is None:
+            matches = map(operator.eq, learner, sheet.expected)
+            marks = tuple(None if key is None else match for key, match in zip(sheet.answer_keys, matches))
+            result = graded[learner] = (sum(mark is True for mark in marks), gradable, marks)
+        results.append(result)
+    return results
+
+
+_worker_sheets = None
+
+
+def _init_worker(bundle_path):
+    global _worker_sheets
+    _worker_sheets = load_answer_sheets(bundle_path)
+
+
+def _grade_chunk(chunk, sheets=None):
+    """[(提出番号, 提出)] を採点し、[(提出番号, 結果)] を返す (結果は演習が見つからなければ None)。"""
+    sheets = sheets if sheets is not None else _worker_sheets
+    by_key = defaultdict(list)
+    for index, submission in chunk:
+        by_key[submission_key(submission)].append((index, submission))
+    out = []
+    for key, items in by_key.items():
+        sheet = sheets.get(key)
+        if sheet is None:
+            out.extend((index, None) for index, _ in items)
+            continue
+        results = grade_group(sheet, [submission for _, submission in items])
+        out.extend((index, result) for (index, _), result in zip(items, results))
+    return out
+
+
+def grade_submissions(submissions, bundle_path=DEFAULT_BUNDLE_PATH, processes=None, chunk_size=5000, sheets=None):
+    """
+    提出のリストを採点し、提出と同じ順の結果のリストを返す。
+    結果は {"correct", "gradable", "score", "results"} の dict (演習が見つからない提出や、項目が不正な提出は None)。
+    processes が 1 (または CPU が1個) なら同じプロセスで採点する。
+    """
+    processes = processes or os.cpu_count() or 1
+    indexed = sorted(enumerate(submissions), key=lambda item: submission_key(item[1]) or ())
+    chunks = [indexed[i:i + chunk_size] for i in range(0, len(indexed), chunk_size)]
+    graded = [None] * len(submissions)
+    if processes == 1 or len(chunks) == 1:
+        sheets = sheets if sheets is not None else load_answer_sheets(bundle_path)
+        outputs = [_grade_chunk(chunk, sheets) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(bundle_path,)) as pool:
+            outputs = list(pool.map(_grade_chunk, chunks))
+    for output in outputs:
+        for index, result in output:
+            if result is not None:
+                correct, gradable, marks = result
+                graded[index] = {"correct": correct, "gradable": gradable,
+                                 "score": correct / gradable if gradable else None, "results": list(marks)}
+    return graded
+
+
+def difficulty_stats(submissions, graded, sheets=None):
+    """
+    (chapter, problem, difficulty) ごとの統計を返す (パートはまとめて集計する)。
+    submissions: 提出数 / learners: 提出した学習者数 / mean_score: 平均正答率 / perfect_rate: 全問正解の割合 /
+    hardest_blank: 正答率が最も低い穴 (パート, 穴の番号, 答え, 正答率)
+    """
+    groups = defaultdict(lambda: {"submissions": 0, "learners": set(), "score_sum": 0.0, "scored": 0, "perfect": 0,
+                                  "blank_hits": Counter(), "blank_total": Counter()})
+    for submission, result in zip(submissions, graded):
+        if result is None:
+            continue
+        chapter, problem, difficulty, part = submission_key(submission)
+        group = groups[(chapter, problem, difficulty)]
+        group["submissions"] += 1
+        group["learners"].add(submission.get("learner"))
+        if result["score"] is not None:
+            group["score_sum"] += result["score"]
+            group["scored"] += 1
+            group["perfect"] += result["correct"] == result["gradable"]
+        for index, mark in enumerate(result["results"]):
+            if mark is not None:
+                group["blank_total"][(part, index)] += 1
+                group["blank_hits"][(part, index)] += mark
+    stats = []
+    for (chapter, problem, difficulty), group in sorted(groups.items()):
+        hardest = None
+        if group["blank_total"]:
+            part, index = min(group["blank_total"], key=lambda b: (group["blank_hits"][b] / group["blank_total"][b], b))
+            sheet = (sheets or {}).get((chapter, problem, difficulty, part))
+            hardest = {"part": part, "blank": index, "answer": sheet.answer_keys[index] if sheet else None,
+                       "accuracy": group["blank_hits"][(part, index)] / group["blank_total"][(part, index)]}
+        stats.append({
+            "chapter": chapter, "problem": problem, "difficulty": difficulty,
+            "submissions": group["submissions"], "learners": len(group["learners"]),
+            "mean_score": group["score_sum"] / group["scored"] if group["scored"] else None,
+            "perfect_rate": group["perfect"] / group["scored"] if group["scored"] else None,
+            "hardest_blank": hardest,
+        })
+    return stats
+
+
+def print_difficulty_stats(stats):
+    """問題ごとに easy / normal / hard の平均正答率 (全問正解の割合) を1行で表示する。"""
+    table = defaultdict(dict)
+    for row in stats:
+        table[(row["chapter"], row["problem"])][row["difficulty"]] = row
+    print(f"{'章':<16}{'問題':<6}" + "".join(f"{d:>20}" for d in DIFFICULTY_DIRS))
+    for (chapter, problem), by_difficulty in sorted(table.items()):
+        cells = []
+        for difficulty in DIFFICULTY_DIRS:
+            row = by_difficulty.get(difficulty)
+            if row is None or row["mean_score"] is None:
+                cells.append(f"{'-':>20}")
+            else:
+                cells.append(f"{row['mean_score'] * 100:>9.1f}% ({row['perfect_rate'] * 100:4.1f}%)")
+        print(f"{chapter:<16}{problem:<6}" + "".join(cells))
+    print("(平均正答率、括弧内は全問正解の割合)")
+
+
+def make_synthetic_submissions(sheets, n, learners=5000, seed=0):
+    """
+    計測用の提出を作る。正解・空白や引用符の揺れ・import の別名・一部誤り・セル全体の提出を混ぜる。
+    戻り値は (提出のリスト, 全問正解になるはずの提出番号の集合)。
+    """
+    rng = random.Random(seed)
+    keys = sorted(key for key, sheet in sheets.items() if sheet.answer_keys)
+    submissions, expected_perfect = [], set()
+    for i in range(n):
+        key = rng.choice(keys)
+        sheet = sheets[key]
+        fills = [answer or "x" for answer in sheet.answer_keys]
+        gradable = [i for i, answer in enumerate(sheet.answer_keys) if answer is not None]
+        perfect = True
+        mode = rng.random()
+        if mode < 0.35:
+            pass  # そのまま正解
+        elif mode < 0.50:  # 空白と引用符の揺れ
+            fills = [re.sub(r"([(),=])", r" \1 ", fill) for fill in fills]
+            fills = [f"'{fill[1:-1]}'" if re.fullmatch(r'"[^"\'\\]*"', fill) else fill for fill in fills]
+        elif mode < 0.55 and sheet.import_blank_indices:  # import の別名 (from ... import X を X as XAlias にする)
+            for index in sheet.import_blank_indices:
+                name, alias = fills[index], f"{fills[index]}Alias"
+                renamed = [alias if fill == name else fill for fill in fills]
+                renamed[index] = f"{name} as {alias}"
+                if dict(import_aliases(fill_blanks(sheet.blanked_code, renamed))).get(alias):
+                    fills = renamed
+                    break
+        elif mode < 0.90 and gradable:  # 一部誤り
+            wrong = rng.choice(gradable)
+            fills[wrong] = fills[wrong] + "_wrong"
+            perfect = False
+        submission = {"learner": f"u{rng.randrange(learners):05d}", "chapter": key[0], "problem": key[1],
+                      "difficulty": key[2], "part": key[3]}
+        if rng.random() < 0.1:
+            submission["cell"] = fill_blanks(sheet.blanked_code, fills)
+        else:
+            submission["fills"] = fills
+        submissions.append(submission)
+        if perfect:
+            expected_perfect.add(i)
+    return submissions, expected_perfect
+
+
+def _read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="穴埋め問題の提出の一括採点")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    grade_parser = subparsers.add_parser("grade", help="JSONL の提出を採点する")
+    grade_parser.add_argument("submissions")
+    grade_parser.add_argument("--out", help="提出ごとの結果を書き出す JSONL")
+    grade_parser.add_argument("--stats", help="問題・難易度ごとの統計を書き出す JSON")
+    bench_parser = subparsers.add_parser("bench", help="合成した提出で採点時間を計測する")
+    bench_parser.add_argument("--submissions", type=int, default=100000)
+    for sub in (grade_parser, bench_parser):
+        sub.add_argument("--bundle", default=DEFAULT_BUNDLE_PATH)
+        sub.add_argument("--processes", type=int, default=None, help="省略時は CPU 数")
+    args = parser.parse_args()
+
+    answer_sheets = load_answer_sheets(args.bundle)
+    if args.command == "grade":
+        all_submissions = _read_jsonl(args.submissions)
+    else:
+        all_submissions, perfect_indices = make_synthetic_submissions(answer_sheets, args.submissions)
+    start = time.perf_counter()
+    graded_results = grade_submissions(all_submissions, args.bundle, args.processes, sheets=answer_sheets)
+    elapsed = time.perf_counter() - start
+    print(f"{len(all_submissions)}件を {elapsed:.2f}秒で採点しました ({len(all_submissions) / elapsed:.0f}件/秒, "
+          f"プロセス数 {args.processes or os.cpu_count()})")
+    print(f"採点できなかった提出 (演習が見つからない・項目が不正): {sum(result is None for result in graded_results)}件\n")
+    difficulty_rows = difficulty_stats(all_submissions, graded_results, answer_sheets)
+    print_difficulty_stats(difficulty_rows)
+    if args.command == "bench":
+        judged_perfect = {i for i, result in enumerate(graded_results) if result and result["correct"] == result["gradable"]}
+        print(f"\n正解として作った提出 {len(perfect_indices)}件のうち全問正解と判定: {len(perfect_indices & judged_perfect)}件 / "
+              f"誤りを含む提出を全問正解と判定: {len(judged_perfect - perfect_indices)}件")
+    if getattr(args, "out", None):
+        with open(args.out, "w", encoding="utf-8") as f:
+            for submission, result in zip(all_submissions, graded_results):
+                f.write(json.dumps({"learner": submission.get("learner"), "key": submission_key(submission), **(result or {})},
+                                   ensure_ascii=False) + "\n")
+    if getattr(args, "stats", None):
+        with open(args.stats, "w", encoding="utf-8") as f:
+            json.dump(difficulty_rows, f, ensure_ascii=False, indent=1)
@@ -0,0 +1,191 @@
+"""
+quiz_server.py のローカル負荷試験。
+
+サーバーを別プロセスで起動し (CPU が複数あれば1コアに固定する)、keep-alive の接続を複数張って一定時間リクエストを送り続け、
+1秒あたりのリクエスト数と p50/p90/p99 レイテンシを表示する。リクエストの内訳は次のとおり (割合は引数で変えられる)。
+
+*   GET: ランダムな (章, 問題, 難易度, パート) の穴埋めコード
+*   条件付き GET: 前に受け取った ETag を If-None-Match に付けた GET (304 が返る)
+*   POST: 答え合わせ (半分は正しい答え、半分は誤った答え)
+
+使い方:
+
+    python quiz_bundle.py build
+    python quiz_loadtest.py --duration 10 --connections 64
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from quiz_bundle import DEFAULT_BUNDLE_PATH, QuizBundle
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def load_targets(bundle_path):
+    """負荷試験で使うパスと、答え合わせ用の正解 (fills) の一覧。"""
+    targets = []
+    with QuizBundle(bundle_path) as bundle:
+        for chapter, problem, part, difficulty in bundle.list_exercises():
+            keys = bundle.get(chapter, problem, part, difficulty)["answer_keys"]
+            targets.append((f"/quiz/{chapter}/{problem}/{difficulty}/{part}", [key or "" for key in keys]))
+    return targets
+
+
+async def _request(reader, writer, method, path, headers=None, body=b""):
+    lines = [f"{method} {path} HTTP/1.1", "Host: localhost"]
+    lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+    if body:
+        lines.append(f"Content-Length: {len(body)}")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+    raw_head = await reader.readuntil(b"\r\n\r\n")
+    status_line, *header_lines = raw_head.decode("latin-1").split("\r\n")
+    response_headers = {}
+    for line in header_lines:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            response_headers[name.strip().lower()] = value.strip()
+    length = int(response_headers.get("content-length", "0") or 0)
+    response_body = await reader.readexactly(length) if length else b""
+    return int(status_line.split(" ", 2)[1]), response_headers, response_body
+
+
+async def _connection_loop(host, port, targets, mix, deadline, seed, latencies, statuses):
+    rng = random.Random(seed)
+    etags = {}
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            path, fills = rng.choice(targets)
+            kind = rng.choices(("get", "conditional", "check"), weights=mix)[0]
+            headers, body, method = {}, b"", "GET"
+            if kind == "conditional" and path in etags:
+                headers["If-None-Match"] = etags[path]
+            elif kind == "check":
+                method, path = "POST", path + "/check"
+                submitted = fills if rng.random() < 0.5 else ["wrong"] * len(fills)
+                body = json.dumps({"fills": submitted}).encode("utf-8")
+            start = time.perf_counter()
+            status, response_headers, _ = await _request(reader, writer, method, path, headers, body)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+            if "etag" in response_headers:
+                etags[path] = response_headers["etag"]
+    finally:
+        writer.close()
+
+
+async def _run_clients(host, port, targets, mix, connections, duration, seed):
+    latencies, statuses = [], Counter()
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*[
+        _connection_loop(host, port, targets, mix, deadline, seed * 1000 + i, latencies, statuses)
+        for i in range(connections)
+    ])
+    return latencies, statuses
+
+
+def _client_process(args):
+    return asyncio.run(_run_clients(*args))
+
+
+def start_server_process(bundle_path, cache_size, pin_cpu):
+    """quiz_server.py を別プロセスで起動し、(プロセス, ホスト, ポート) を返す。"""
+    preexec = (lambda: os.sched_setaffinity(0, {pin_cpu})) if pin_cpu is not None else None
+    process = subprocess.Popen(
+        [sys.executable, "quiz_server.py", "--port", "0", "--bundle", bundle_path, "--cache-size", str(cache_size)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.PIPE, text=True, preexec_fn=preexec,
+    )
+    line = process.stdout.readline()
+    if not line.startswith("listening on"):
+        process.kill()
+        raise RuntimeError(f"サーバーの起動に失敗しました: {line!r}")
+    host, port = line.split("http://", 1)[1].split()[0].rsplit(":", 1)
+    return process, host, int(port)
+
+
+def run_load_test(bundle_path=DEFAULT_BUNDLE_PATH, duration=10.0, connections=64, client_processes=None,
+                  mix=(0.7, 0.2, 0.1), cache_size=1024, warmup=1.0):
+    """負荷試験を実行して結果の dict を返す。"""
+    targets = load_targets(bundle_path)
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    pin_cpu = cpus[0] if len(cpus) > 1 else None
+    if client_processes is None:
+        client_processes = max(1, min(4, len(cpus) - 1))
+    process, host, port = start_server_process(bundle_path, cache_size, pin_cpu)
+    try:
+        asyncio.run(_run_clients(host, port, targets, mix, min(connections, 8), warmup, seed=0))  # ウォームアップ
+        per_process = max(1, connections // client_processes)
+        jobs = [(host, port, targets, mix, per_process, duration, i + 1) for i in range(client_processes)]
+        start = time.perf_counter()
+        with multiprocessing.Pool(client_processes) as pool:
+            results = pool.map(_client_process, jobs)
+        elapsed = time.perf_counter() - start
+        server_stats = asyncio.run(_fetch_health(host, port))
+    finally:
+        process.terminate()
+        process.wait()
+    latencies = sorted(latency for result, _ in results for latency in result)
+    statuses = sum((result_statuses for _, result_statuses in results), Counter())
+    return {
+        "requests": len(latencies),
+        "elapsed": elapsed,
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.50),
+        "p90": percentile(latencies, 0.90),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1] if latencies else float("nan"),
+        "statuses": dict(sorted(statuses.items())),
+        "connections": per_process * client_processes,
+        "client_processes": client_processes,
+        "server_pinned_cpu": pin_cpu,
+        "server": server_stats,
+    }
+
+
+async def _fetch_health(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        _, _, body = await _request(reader, writer, "GET", "/health")
+        return json.loads(body)
+    finally:
+        writer.close()
+
+
+def print_load_test(result):
+    cpu = "全コア共有 (CPU 1個)" if result["server_pinned_cpu"] is None else f"CPU {result['server_pinned_cpu']} に固定"
+    print(f"サーバー: {cpu} / クライアント: {result['client_processes']}プロセス・{result['connections']}接続")
+    print(f"リクエスト数: {result['requests']} ({result['elapsed']:.1f}秒)")
+    print(f"スループット: {result['rps']:.0f} req/s")
+    print(f"レイテンシ: p50 {result['p50'] * 1000:.2f} ms / p90 {result['p90'] * 1000:.2f} ms / "
+          f"p99 {result['p99'] * 1000:.2f} ms / max {result['max'] * 1000:.2f} ms")
+    print(f"ステータス: {result['statuses']}")
+    server = result["server"]
+    print(f"サーバー側: LRU ヒット {server['cache_hits']} / ミス {server['cache_misses']} / 304 {server['not_modified']} / "
+          f"答え合わせ {server['checks']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="quiz_server.py のローカル負荷試験")
+    parser.add_argument("--bundle", default=DEFAULT_BUNDLE_PATH)
+    parser.add_argument("--duration", type=float, default=10.0, help="計測する秒数")
+    parser.add_argument("--connections", type=int, default=64, help="同時接続数 (全クライアントプロセスの合計)")
+    parser.add_argument("--client-processes", type=int, default=None, help="省略時は (CPU数 - 1) で最大4")
+    parser.add_argument("--mix", default="0.7,0.2,0.1", help="GET, 条件付き GET, 答え合わせ の割合")
+    parser.add_argument("--cache-size", type=int, default=1024)
+    args = parser.parse_args()
+    print_load_test(run_load_test(
+        args.bundle, args.duration, args.connections, args.client_processes,
+        tuple(float(x) for x in args.mix.split(",")), args.cache_size,
+    ))
@@ -0,0 +1,292 @@
+"""
+穴埋め問題を配信するローカルの HTTP API (asyncio のみで動き、追加の依存パッケージは不要)。
+
+起動時に quiz_bundle.py で作った SQLite バンドルの全演習をメモリに読み込むため、リクエストごとにノートブックを読んだり
+解析したりしない。主な仕組みは次のとおり。
+
+*   GET の応答は JSON にエンコードしたバイト列と ETag (本文のハッシュ) を LRU にキャッシュし、2回目以降はエンコードもしない
+*   If-None-Match が ETag と一致すれば本文なしの 304 を返す
+*   答え (answer_keys) は GET の応答には含めず、答え合わせのエンドポイントでだけ使う (正規化は quiz_grader.py と同じ)
+*   HTTP/1.1 の keep-alive に対応し、1つの接続で続けてリクエストを送れる
+
+エンドポイント:
+
+    GET  /health
+    GET  /quiz                                             演習の一覧 (章・問題・パート・難易度)
+    GET  /quiz/{chapter}/{problem}/{difficulty}            問題文と全パートの穴埋めコード
+    GET  /quiz/{chapter}/{problem}/{difficulty}/{part}     1パート分の穴埋めコード
+    POST /quiz/{chapter}/{problem}/{difficulty}/{part}/check   {"fills": ["...", ...]} を答えと照合する
+
+使い方:
+
+    python quiz_bundle.py build
+    python quiz_server.py --port 8000
+    curl http://127.0.0.1:8000/quiz/3_single_agent/006/hard/1
+    curl -X POST -d '{"fills": ["StateGraph"]}' http://127.0.0.1:8000/quiz/1_basics/001/easy/1/check
+
+負荷試験は quiz_loadtest.py を参照。
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from urllib.parse import unquote, urlsplit
+
+from quiz_bundle import DEFAULT_BUNDLE_PATH, QuizBundle
+from quiz_grader import AnswerSheet, grade_group
+
+MAX_BODY_BYTES = 64 * 1024
+MAX_HEADER_BYTES = 16 * 1024
+
+_REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 431: "Request Header Fields Too Large"}
+
+
+class QuizStore:
+    """バンドルの全演習をメモリに読み込んだもの。キーは (chapter, problem, difficulty, part)。"""
+
+    def __init__(self, bundle_path=DEFAULT_BUNDLE_PATH):
+        self.exercises = {}
+        self.problems = {}
+        with QuizBundle(bundle_path) as bundle:
+            for chapter, problem, part, difficulty in bundle.list_exercises():
+                self.exercises[(chapter, problem, difficulty, part)] = bundle.get(chapter, problem, part, difficulty)
+                if (chapter, problem) not in self.problems:
+                    self.problems[(chapter, problem)] = bundle.get_problem(chapter, problem)
+        self.sheets = {key: AnswerSheet(exercise["blanked_code"], exercise["answer_keys"])
+                       for key, exercise in self.exercises.items()}
+        self.parts = {}  # (chapter, problem, difficulty) -> パート番号の昇順リスト
+        for chapter, problem, difficulty, part in sorted(self.exercises):
+            self.parts.setdefault((chapter, problem, difficulty), []).append(part)
+
+    def public_exercise(self, key):
+        exercise = self.exercises[key]
+        return {name: exercise[name] for name in ("part", "label", "blanked_code", "blank_count")}
+
+    def problem_document(self, chapter, problem, difficulty):
+        parts = self.parts.get((chapter, problem, difficulty))
+        if parts is None:
+            return None
+        info = self.problems[(chapter, problem)]
+        return {
+            "chapter": chapter, "problem": problem, "difficulty": difficulty,
+            "title": info["title"], "statement": info["statement"],
+            "parts": [self.public_exercise((chapter, problem, difficulty, part)) for part in parts],
+        }
+
+    def part_document(self, chapter, problem, difficulty, part):
+        key = (chapter, problem, difficulty, part)
+        if key not in self.exercises:
+            return None
+        return dict(chapter=chapter, problem=problem, difficulty=difficulty,
+                    title=self.exercises[key]["title"], **self.public_exercise(key))
+
+    def index_document(self):
+        return {"exercises": [
+            {"chapter": c, "problem": p, "difficulty": d, "part": n} for c, p, d, n in sorted(self.exercises)
+        ]}
+
+
+class ResponseCache:
+    """パスごとに (ETag, エンコード済みの本文) を保持する LRU。"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        entry = self._entries.get(path)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(path)
+        self.hits += 1
+        return entry
+
+    def put(self, path, etag, body):
+        self._entries[path] = (etag, body)
+        self._entries.move_to_end(path)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+def encode_json(document):
+    return json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def make_etag(body):
+    return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+class QuizApp:
+    """
+    HTTP の解析とは切り離したリクエスト処理。handle は (ステータス, 追加ヘッダー, 本文) を返す。
+    すべての処理はメモリ上で完結するため、イベントループを止めないよう同期関数のままにしている。
+    """
+
+    def __init__(self, store, cache_size=1024, max_age=300):
+        self.store = store
+        self.cache = ResponseCache(cache_size)
+        self.max_age = max_age
+        self.stats = {"requests": 0, "not_modified": 0, "checks": 0}
+
+    def handle(self, method, target, headers, body=b""):
+        self.stats["requests"] += 1
+        path = unquote(urlsplit(target).path).rstrip("/") or "/"
+        segments = path.strip("/").split("/")
+        if method == "POST" and len(segments) == 6 and segments[0] == "quiz" and segments[5] == "check":
+            return self._check(segments[1:5], body)
+        if method not in ("GET", "HEAD"):
+            return self._error(405, "method not allowed")
+        entry = self.cache.get(path)
+        if entry is None:
+            document = self._route(segments)
+            if document is None:
+                return self._error(404, f"not found: {path}")
+            encoded = encode_json(document)
+            entry = (make_etag(encoded), encoded)
+            if segments[0] == "quiz":  # /health は毎回作り直す
+                self.cache.put(path, *entry)
+        etag, encoded = entry
+        response_headers = {"ETag": etag, "Cache-Control": f"public, max-age={self.max_age}"}
+        if _etag_matches(etag, headers.get("if-none-match", "")):
+            self.stats["not_modified"] += 1
+            return 304, response_headers, b""
+        return 200, dict(response_headers, **{"Content-Type": "application/json; charset=utf-8"}), encoded
+
+    def _route(self, segments):
+        if segments == ["health"]:
+            return dict(self.stats, status="ok", exercises=len(self.store.exercises), cache_entries=len(self.cache._entries),
+                        cache_hits=self.cache.hits, cache_misses=self.cache.misses)
+        if segments[0] != "quiz":
+            return None
+        if len(segments) == 1:
+            return self.store.index_document()
+        if len(segments) == 4:
+            return self.store.problem_document(segments[1], segments[2].zfill(3), segments[3])
+        if len(segments) == 5 and segments[4].isdigit():
+            return self.store.part_document(segments[1], segments[2].zfill(3), segments[3], int(segments[4]))
+        return None
+
+    def _check(self, key_segments, body):
+        self.stats["checks"] += 1
+        chapter, problem, difficulty, part = key_segments
+        key = (chapter, problem.zfill(3), difficulty, int(part) if part.isdigit() else -1)
+        exercise = self.store.exercises.get(key)
+        if exercise is None:
+            return self._error(404, "exercise not found")
+        try:
+            fills = json.loads(body or b"{}").get("fills")
+        except (ValueError, AttributeError):
+            fills = None
+        if not isinstance(fills, list):
+            return self._error(400, 'body must be JSON like {"fills": ["...", ...]}')
+        correct, gradable, marks = grade_group(self.store.sheets[key], [{"fills": fills}])[0]
+        document = {
+            "results": list(marks),
+            "correct": correct,
+            "gradable": gradable,
+            "blank_count": exercise["blank_count"],
+            "all_correct": len(fills) == exercise["blank_count"] and correct == gradable,
+        }
+        return 200, {"Content-Type": "application/json; charset=utf-8", "Cache-Control": "no-store"}, encode_json(document)
+
+    def _error(self, status, message):
+        return status, {"Content-Type": "application/json; charset=utf-8"}, encode_json({"error": message})
+
+
+def _etag_matches(etag, if_none_match):
+    """If-None-Match (カンマ区切り、弱い ETag、* を含む) が ETag に一致するか。"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+
+def _response_bytes(status, headers, body, keep_alive, head_only=False):
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    if status != 304:
+        lines.append(f"Content-Length: {len(body)}")
+    if not keep_alive:
+        lines.append("Connection: close")
+    head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+    return head if head_only or status == 304 else head + body
+
+
+async def serve_connection(app, reader, writer):
+    """1つの接続でリクエストを順に処理する (keep-alive)。"""
+    try:
+        while True:
+            try:
+                raw_head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.LimitOverrunError:
+                writer.write(_response_bytes(431, {}, b"", keep_alive=False))
+                break
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            request_line, *header_lines = raw_head.decode("latin-1").split("\r\n")
+            try:
+                method, target, version = request_line.split(" ", 2)
+            except ValueError:
+                writer.write(_response_bytes(400, {}, b"", keep_alive=False))
+                break
+            headers = {}
+            for line in header_lines:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            connection = headers.get("connection", "").lower()
+            keep_alive = connection != "close" and (version == "HTTP/1.1" or connection == "keep-alive")
+            raw_length = headers.get("content-length", "0") or "0"
+            if not (raw_length.isascii() and raw_length.isdigit()):  # 数値でない・負の Content-Length
+                writer.write(_response_bytes(400, {}, b"", keep_alive=False))
+                break
+            length = int(raw_length)
+            if length > MAX_BODY_BYTES:
+                writer.write(_response_bytes(413, {}, b"", keep_alive=False))
+                break
+            body = await reader.readexactly(length) if length else b""
+            status, response_headers, payload = app.handle(method, target, headers, body)
+            writer.write(_response_bytes(status, response_headers, payload, keep_alive, head_only=method == "HEAD"))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(app, host="127.0.0.1", port=8000, backlog=1024):
+    return await asyncio.start_server(
+        lambda reader, writer: serve_connection(app, reader, writer),
+        host, port, backlog=backlog, limit=MAX_HEADER_BYTES,
+    )
+
+
+async def _main(args):
+    store = QuizStore(args.bundle)
+    app = QuizApp(store, cache_size=args.cache_size)
+    server = await start_server(app, args.host, args.port)
+    host, port = server.sockets[0].getsockname()[:2]
+    # quiz_loadtest.py はこの行からポート番号を読み取る
+    print(f"listening on http://{host}:{port} ({len(store.exercises)} exercises)", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="穴埋め問題を配信するローカル HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000, help="0 を指定すると空いているポートを使う")
+    parser.add_argument("--bundle", default=DEFAULT_BUNDLE_PATH)
+    parser.add_argument("--cache-size", type=int, default=1024, help="LRU に保持する GET 応答の数")
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,386 @@
+"""
+第2章 問題006 (エラーハンドリングとリトライ処理) の発展: リトライとサーキットブレーカーを備えたノードのラッパー。
+
+問題006では、失敗すると状態の retry_count を増やして同じノードへ戻るループでリトライしている。
+この方法は待ち時間なしで即座に再試行するため、障害中のサービスにリクエストを集中させやすく、
+またリトライのたびにスーパーステップ (とチェックポイント) が1つ増える。
+
+`resilient_node` はノード関数を包み、ノードの中で次の制御を行う。
+
+*   指数バックオフ + フルジッター (0〜min(上限, 基準×2^n) の一様乱数) の待ち時間でのリトライ
+*   リトライバジェット: 直近の呼び出し数に対するリトライの割合を制限し、障害時にリトライが負荷を増幅しないようにする
+*   サーキットブレーカー: 連続して失敗したら一定時間は呼び出さずに即座に失敗させ (open)、
+    時間が経ったら少数の試し呼び出し (half-open) で回復を確認してから通常状態 (closed) に戻す
+
+LangGraph の `add_node(..., retry_policy=RetryPolicy(...))` でもバックオフ付きのリトライはできるが、
+サーキットブレーカーとリトライバジェットはないため、複数のスレッド・リクエストで共有する外部サービスの保護にはこちらを使う。
+
+使い方 (問題006の potentially_failing_node を置き換える場合):
+
+    from resilient_node import resilient_node, ExponentialBackoff, CircuitBreaker, RetryBudget
+    breaker = CircuitBreaker(failure_threshold=5, recovery_timeout=1.0)
+    process_node = resilient_node(
+        call_service_node, backoff=ExponentialBackoff(max_attempts=3), breaker=breaker, budget=RetryBudget(),
+        fallback=lambda state, error: {"error_message": str(error)},
+    )
+    workflow.add_node("process_data", process_node)
+
+このファイルを直接実行すると、失敗率と遅延スパイクを設定できるローカルの不安定なサービスに対して、
+問題006の状態カウンター方式と比較したベンチマーク (p50/p99/p999 レイテンシ、無駄な呼び出し数) を行う。
+    python resilient_node.py
+"""
+import collections
+import random
+import threading
+import time
+from typing import Optional, TypedDict
+
+from langgraph.errors import GraphBubbleUp
+from langgraph.graph import END, StateGraph
+
+
+class CircuitOpenError(RuntimeError):
+    """サーキットブレーカーが open のため、呼び出しを行わずに失敗させたことを表す例外。"""
+
+
+class ExponentialBackoff:
+    """
+    指数バックオフ + フルジッターのリトライ方針。
+    - max_attempts: 最初の呼び出しを含めた最大試行回数
+    - base_delay: 1回目のリトライの待ち時間の上限 (秒)。以降は2倍ずつ増える。
+    - max_delay: 待ち時間の上限 (秒)
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.05, max_delay=2.0, rng=None):
+        if max_attempts < 1:
+            raise ValueError("max_attempts は1以上を指定してください。")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._rng = rng or random.Random()
+
+    def delay(self, retry_number):
+        """retry_number 回目 (1始まり) のリトライまでの待ち時間 (フルジッター)。"""
+        return self._rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (retry_number - 1)))
+
+
+class RetryBudget:
+    """
+    直近 window 秒の呼び出し数に対して、リトライを ratio の割合 (+ 最低 min_retries 回) までに制限する。
+    障害時に全リクエストがリトライして負荷が数倍に膨らむのを防ぐ。
+    """
+
+    def __init__(self, ratio=0.2, min_retries=10, window=10.0, clock=time.monotonic):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._clock = clock
+        self._requests = collections.deque()
+        self._retries = collections.deque()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        for events in (self._requests, self._retries):
+            while events and events[0] <= now - self.window:
+                events.popleft()
+
+    def record_request(self):
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            self._requests.append(now)
+
+    def discard_request(self):
+        """直前の record_request を取り消す (呼び出しが失敗でも成功でもなく中断された場合)。"""
+        with self._lock:
+            if self._requests:
+                self._requests.pop()
+
+    def try_acquire_retry(self):
+        """リトライしてよければ記録して True、バジェットを使い切っていれば False を返す。"""
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            if len(self._retries) >= self.min_retries + self.ratio * len(self._requests):
+                return False
+            self._retries.append(now)
+            return True
+
+
+class CircuitBreaker:
+    """
+    連続失敗数で open になるサーキットブレーカー。
+    - failure_threshold: open にする連続失敗数
+    - recovery_timeout: open になってから half-open で試し呼び出しを許すまでの秒数
+    - half_open_max_calls: half-open 中に同時に許す試し呼び出しの数
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, recovery_timeout=1.0, half_open_max_calls=1, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self.rejected_calls = 0
+        self.transitions = []
+
+    def _transition(self, state):
+        self.state = state
+        self.transitions.append((self._clock(), state))
+
+    def allow_request(self):
+        """呼び出してよければ True。open 中 (または half-open の試し呼び出しが埋まっている) なら False。"""
+        with self._lock:
+            if self.state == self.OPEN and self._clock() - self._opened_at >= self.recovery_timeout:
+                self._transition(self.HALF_OPEN)
+                self._half_open_calls = 0
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            self.rejected_calls += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def release(self):
+        """結果を記録せずに、allow_request で確保した half-open の試し呼び出しの枠を返す。"""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self._transition(self.OPEN)
+                self._opened_at = self._clock()
+
+
+def resilient_node(node_fn, backoff=None, breaker=None, budget=None, retry_on=(Exception,), fallback=None, sleep=time.sleep):
+    """
+    ノード関数 node_fn(state) をリトライ・サーキットブレーカー・リトライバジェットで包んだノード関数を返す。
+    すべての試行が失敗した (またはブレーカーが open だった) 場合、fallback(state, error) があればその戻り値を状態の更新として返し、
+    なければ最後の例外を送出する。
+    ラップ後の関数の stats 属性に、呼び出し・失敗・リトライ・ブレーカーによる拒否の回数が集計される。
+    """
+    backoff = backoff or ExponentialBackoff()
+    stats = collections.Counter()
+
+    def wrapped(state):
+        if budget is not None:
+            budget.record_request()
+        last_error = None
+        for attempt in range(1, backoff.max_attempts + 1):
+            if attempt > 1:
+                if budget is not None and not budget.try_acquire_retry():
+                    stats["budget_exhausted"] += 1
+                    break
+                stats["retries"] += 1
+                sleep(backoff.delay(attempt - 1))
+            if breaker is not None and not breaker.allow_request():
+                stats["rejected"] += 1
+                last_error = CircuitOpenError("サーキットブレーカーが open のため呼び出しを中止しました。")
+                break
+            stats["calls"] += 1
+            try:
+                result = node_fn(state)
+            except GraphBubbleUp:
+                # interrupt() などの LangGraph の制御用の例外は失敗ではないので、リトライも記録もせずにそのまま送出する
+                # (再開時にノードがもう一度呼ばれるため、この呼び出しは集計から外し、試し呼び出しの枠も返す)
+                stats["calls"] -= 1
+                if budget is not None and attempt == 1:
+                    budget.discard_request()
+                if breaker is not None:
+                    breaker.release()
+                raise
+            except retry_on as e:
+                stats["failures"] += 1
+                last_error = e
+                if breaker is not None:
+                    breaker.record_failure()
+                continue
+            except Exception:
+                # リトライしない例外でも失敗として記録する (half-open の試し呼び出しの枠を解放するため)
+                stats["failures"] += 1
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+            except BaseException:
+                # KeyboardInterrupt などはサービスの失敗ではないので、試し呼び出しの枠だけを返す
+                if breaker is not None:
+                    breaker.release()
+                raise
+            if breaker is not None:
+                breaker.record_success()
+            return result
+        stats["gave_up"] += 1
+        if fallback is not None:
+            return fallback(state, last_error)
+        raise last_error
+
+    wrapped.stats = stats
+    wrapped.__name__ = getattr(node_fn, "__name__", "resilient_node")
+    return wrapped
+
+
+# --- ベンチマーク ---
+
+class FlakyService:
+    """
+    ローカルの不安定なサービス。failure_rate の確率で例外を送出し、spike_rate の確率で spike_latency 秒遅れて応答する。
+    outage=(開始秒, 終了秒) を指定すると、生成からの経過時間がその範囲の間はすべての呼び出しが失敗する (障害の模擬)。
+    """
+
+    def __init__(self, failure_rate=0.1, latency=0.001, spike_rate=0.01, spike_latency=0.05, outage=None, seed=0):
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.spike_rate = spike_rate
+        self.spike_latency = spike_latency
+        self.outage = outage
+        self._rng = random.Random(seed)
+        self._started = time.monotonic()
+        self.calls = 0
+        self.failed_calls = 0
+
+    def call(self, payload):
+        self.calls += 1
+        elapsed = time.monotonic() - self._started
+        time.sleep(self.spike_latency if self._rng.random() < self.spike_rate else self.latency)
+        in_outage = self.outage is not None and self.outage[0] <= elapsed < self.outage[1]
+        if in_outage or self._rng.random() < self.failure_rate:
+            self.failed_calls += 1
+            raise ConnectionError("サービスが一時的に利用できません。")
+        return f"{payload} の処理結果"
+
+
+class ServiceState(TypedDict):
+    data_to_process: str
+    processed_result: Optional[str]
+    error_message: Optional[str]
+    retry_count: int
+    max_retries: int
+
+
+def build_counter_loop_graph(service):
+    """問題006と同じ、状態の retry_count でリトライするループのグラフ。"""
+
+    def process_node(state: ServiceState):
+        try:
+            result = service.call(state["data_to_process"])
+            return {"processed_result": result, "error_message": None, "retry_count": state["retry_count"] + 1}
+        except ConnectionError as e:
+            return {"error_message": str(e), "retry_count": state["retry_count"] + 1}
+
+    def should_retry_or_finish(state: ServiceState):
+        if state.get("error_message") and state["retry_count"] < state["max_retries"]:
+            return "retry"
+        return "finish"
+
+    workflow = StateGraph(ServiceState)
+    workflow.add_node("process_data", process_node)
+    workflow.set_entry_point("process_data")
+    workflow.add_conditional_edges("process_data", should_retry_or_finish, {"retry": "process_data", "finish": END})
+    return workflow.compile()
+
+
+def build_resilient_graph(service, max_attempts, breaker, budget):
+    """process_data ノードを resilient_node で包んだグラフ (リトライはノード内で行うため、ループのエッジは不要)。"""
+
+    def process_node(state: ServiceState):
+        return {"processed_result": service.call(state["data_to_process"]), "error_message": None}
+
+    node = resilient_node(
+        process_node,
+        backoff=ExponentialBackoff(max_attempts=max_attempts, base_delay=0.002, max_delay=0.05, rng=random.Random(1)),
+        breaker=breaker,
+        budget=budget,
+        retry_on=(ConnectionError,),
+        fallback=lambda state, error: {"error_message": str(error)},
+    )
+    workflow = StateGraph(ServiceState)
+    workflow.add_node("process_data", node)
+    workflow.set_entry_point("process_data")
+    workflow.add_edge("process_data", END)
+    return workflow.compile()
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def run_scenario(build_graph, service, requests=2000, max_retries=3, interval=0.003):
+    """
+    interval 秒ごとに1件ずつリクエストが届く想定で実行する (処理が早く終わっても次の到着時刻まで待つため、
+    障害の時間帯に届くリクエスト数は方式によらず同じになる)。レイテンシは各リクエストの処理時間。
+    """
+    latencies, successes = [], 0
+    graph = build_graph(service)
+    first_arrival = time.perf_counter()
+    for i in range(requests):
+        wait = first_arrival + i * interval - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        start = time.perf_counter()
+        result = graph.invoke({"data_to_process": f"データ{i}", "processed_result": None, "error_message": None,
+                               "retry_count": 0, "max_retries": max_retries}, {"recursion_limit": 2 * max_retries + 5})
+        latencies.append(time.perf_counter() - start)
+        successes += result.get("error_message") is None
+    return {
+        "success_rate": successes / requests,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "p999_ms": percentile(latencies, 0.999) * 1000,
+        "service_calls": service.calls,
+        "wasted_calls": service.failed_calls,
+    }
+
+
+def run_benchmark(scenarios, requests=2000, max_retries=3):
+    rows = []
+    for name, service_kwargs in scenarios:
+        loop_row = run_scenario(build_counter_loop_graph, FlakyService(**service_kwargs), requests, max_retries)
+        breaker = CircuitBreaker(failure_threshold=10, recovery_timeout=0.1)
+        resilient_row = run_scenario(
+            lambda service: build_resilient_graph(service, max_retries, breaker, RetryBudget(ratio=0.2, min_retries=10, window=1.0)),
+            FlakyService(**service_kwargs), requests, max_retries,
+        )
+        resilient_row["rejected"] = breaker.rejected_calls
+        rows.append((name, loop_row, resilient_row))
+    return rows
+
+
+def print_benchmark(rows):
+    print(f"{'シナリオ':<26} {'方式':<14} {'成功率':>7} {'p50[ms]':>8} {'p99[ms]':>8} {'p999[ms]':>9} {'呼び出し':>8} {'無駄':>6} {'拒否':>6}")
+    for name, loop_row, resilient_row in rows:
+        for label, row in (("状態カウンター", loop_row), ("resilient_node", resilient_row)):
+            print(
+                f"{name:<26} {label:<14} {row['success_rate']:>7.1%} {row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['p999_ms']:>9.2f} "
+                f"{row['service_calls']:>8d} {row['wasted_calls']:>6d} {row.get('rejected', 0):>6d}"
+            )
+
+
+if __name__ == "__main__":
+    scenarios = [
+        ("失敗率10%", {"failure_rate": 0.1}),
+        ("失敗率30% + 遅延スパイク5%", {"failure_rate": 0.3, "spike_rate": 0.05}),
+        ("開始0.5〜1.5秒後は全断", {"failure_rate": 0.05, "outage": (0.5, 1.5)}),
+    ]
+    print("--- 不安定なサービスに3ミリ秒間隔で2000件のリクエスト (最大試行3回) ---")
+    print("無駄 = 失敗に終わったサービス呼び出し、拒否 = ブレーカーが open のため呼び出さなかった回数")
+    print_benchmark(run_benchmark(scenarios))
+    print("\n※ resilient_node はリトライバジェット (直近1秒の呼び出しの20% + 10回) を超えるリトライを行わず、")
+    print("  ブレーカーが open の間は即座に失敗を返すため、障害時は成功率と引き換えにサービスへの無駄な呼び出しを大きく減らす。")
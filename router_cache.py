@@ -0,0 +1,252 @@
+"""
+第4章 問題002/003 のスーパーバイザー向け、ルーティング判断のキャッシュ。
+
+スーパーバイザーは毎ターン、次のワーカーを選ぶだけのために LLM を1回呼び出す。
+同じ (またはテンプレート化された) 依頼が繰り返し届く本番のトラフィックでは、この呼び出しの多くは同じ判断を返すだけになる。
+`CachedRouter` はルーティング用の LLM 呼び出しを包み、次の順に判断を探す。
+
+1.  完全一致キャッシュ: ルーティングに使うメッセージとワーカー集合の正規化ハッシュをキーにした LRU/TTL キャッシュ
+2.  (任意) ローカルのルールによる高速判定: 確信度が閾値以上のときだけ採用し、迷う場合は LLM に任せる
+3.  LLM 呼び出し: 結果をキャッシュに保存する
+
+キャッシュに入るのは「同じ入力に対して LLM が返した判断文字列」そのものなので、
+キャッシュ有無でグラフの分岐は変わらない (ルールによる高速判定を有効にした場合は、ルールの判断が採用される点に注意)。
+
+問題002のスーパーバイザーに組み込む場合:
+
+    from router_cache import CachedRouter, RouterCache
+
+    supervisor_router = CachedRouter(lambda messages: llm.invoke(messages).content, RouterCache(maxsize=1024, ttl=3600))
+
+    def supervisor_agent(state):
+        ...
+        decision_text = supervisor_router([SystemMessage(content=system_prompt), HumanMessage(content=user_req)],
+                                          workers=["researcher", "writer", "user_responder"]).strip()
+        ...
+
+    supervisor_router.print_stats()
+
+このファイルを直接実行すると、multi_agent_benchmark.py の問題002のグラフに繰り返しの多いリクエストを流し、
+キャッシュなし/あり/ルール併用の LLM 呼び出し回数と所要時間を比較する。
+    python router_cache.py
+"""
+import collections
+import hashlib
+import json
+import threading
+import time
+
+
+def canonical_route_key(messages, workers=()):
+    """
+    ルーティングに使うメッセージとワーカー集合から、キャッシュキー (SHA-256) を作る。
+    メッセージの種類・名前・本文 (前後の空白を除き、連続する空白を1つにまとめたもの) だけを使い、
+    メッセージIDなど判断に関係しない値は含めない。ワーカーは順序に依存しないよう並べ替える。
+    """
+    if isinstance(messages, str):
+        messages = [messages]
+    canonical_messages = []
+    for message in messages:
+        if isinstance(message, str):
+            canonical_messages.append(["human", None, " ".join(message.split())])
+        else:
+            content = message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False, sort_keys=True)
+            canonical_messages.append([message.type, getattr(message, "name", None), " ".join(content.split())])
+    payload = json.dumps({"messages": canonical_messages, "workers": sorted(workers)}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RouterCache:
+    """
+    LRU と TTL で古いエントリを追い出す、スレッドセーフな辞書キャッシュ。
+    - maxsize: 保持する最大エントリ数 (超えると最も長く使われていないものから削除)
+    - ttl: エントリの有効期間 (秒)。None なら期限なし。
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        if maxsize < 1:
+            raise ValueError("maxsize は1以上を指定してください。")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and self._clock() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            expires_at = None if self.ttl is None else self._clock() + self.ttl
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class KeywordRouter:
+    """
+    最後のユーザーメッセージに含まれるキーワードで判断するローカルの高速判定。
+    rules は {判断文字列のテンプレート: [キーワード, ...]} の辞書で、テンプレート中の {request} はユーザーの依頼文に置き換えられる。
+    1つのルールだけがマッチしたときは確信度1.0、複数マッチしたときはマッチ数の割合、1つもマッチしなければ None を返す。
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+
+    def __call__(self, messages, workers=()):
+        if isinstance(messages, str):
+            request = messages
+        else:
+            request = messages[-1].content if messages else ""
+        scores = {template: sum(1 for kw in keywords if kw in request) for template, keywords in self.rules.items()}
+        total = sum(scores.values())
+        if total == 0:
+            return None
+        template, score = max(scores.items(), key=lambda item: item[1])
+        return template.format(request=request), score / total
+
+
+class CachedRouter:
+    """
+    ルーティング用の LLM 呼び出し (route_with_llm: messages -> 判断文字列) をキャッシュと高速判定で包む。
+    - cache: RouterCache (None ならキャッシュしない)
+    - fast_path: KeywordRouter のような (messages, workers) -> (判断, 確信度) または None を返す関数
+    - confidence_threshold: 高速判定を採用する確信度の下限。これ未満なら LLM に任せる。
+    """
+
+    def __init__(self, route_with_llm, cache=None, fast_path=None, confidence_threshold=0.9):
+        self.route_with_llm = route_with_llm
+        self.cache = cache if cache is not None else RouterCache()
+        self.fast_path = fast_path
+        self.confidence_threshold = confidence_threshold
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = 0
+            self.cache_hits = 0
+            self.fast_path_hits = 0
+            self.llm_calls = 0
+            self.llm_time = 0.0
+            self.lookup_time = 0.0
+
+    def __call__(self, messages, workers=()):
+        lookup_start = time.perf_counter()
+        key = canonical_route_key(messages, workers)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._count(cache_hit=True, lookup_time=time.perf_counter() - lookup_start)
+            return cached
+        if self.fast_path is not None:
+            result = self.fast_path(messages, workers)
+            if result is not None and result[1] >= self.confidence_threshold:
+                self.cache.set(key, result[0])
+                self._count(fast_path_hit=True, lookup_time=time.perf_counter() - lookup_start)
+                return result[0]
+        lookup_time = time.perf_counter() - lookup_start
+        llm_start = time.perf_counter()
+        decision = self.route_with_llm(messages)
+        llm_time = time.perf_counter() - llm_start
+        self.cache.set(key, decision)
+        self._count(llm_time=llm_time, lookup_time=lookup_time)
+        return decision
+
+    def _count(self, cache_hit=False, fast_path_hit=False, llm_time=None, lookup_time=0.0):
+        with self._lock:
+            self.requests += 1
+            self.lookup_time += lookup_time
+            if cache_hit:
+                self.cache_hits += 1
+            elif fast_path_hit:
+                self.fast_path_hits += 1
+            else:
+                self.llm_calls += 1
+                self.llm_time += llm_time
+
+    def stats(self):
+        """ヒット率と、LLM の平均レイテンシから見積もった節約時間を返す。"""
+        with self._lock:
+            avoided = self.cache_hits + self.fast_path_hits
+            avg_llm_latency = self.llm_time / self.llm_calls if self.llm_calls else 0.0
+            return {
+                "requests": self.requests,
+                "cache_hits": self.cache_hits,
+                "fast_path_hits": self.fast_path_hits,
+                "llm_calls": self.llm_calls,
+                "hit_rate": avoided / self.requests if self.requests else 0.0,
+                "avg_llm_latency": avg_llm_latency,
+                "latency_saved": max(avoided * avg_llm_latency - self.lookup_time, 0.0),
+            }
+
+    def print_stats(self):
+        s = self.stats()
+        print(
+            f"ルーティング: {s['requests']}件 / キャッシュヒット {s['cache_hits']}件 / ルール判定 {s['fast_path_hits']}件 / "
+            f"LLM呼び出し {s['llm_calls']}件 (ヒット率 {s['hit_rate']:.1%}, 節約時間の見積もり {s['latency_saved']:.2f}秒)"
+        )
+
+
+# 問題002のスーパーバイザー用のルール (システムプロンプトの例1〜3と同じ考え方)
+SUPERVISOR_KEYWORD_RULES = {
+    "DelegateToResearcher: {request}": ["調べ", "調査", "research", "find out"],
+    "DelegateToWriter: {request}": ["書い", "記事", "執筆", "write", "article"],
+}
+
+
+if __name__ == "__main__":
+    import random
+
+    from multi_agent_benchmark import build_q2_supervisor_graph, build_scripted_llm, q2_inputs
+
+    templates = [
+        "{topic}について調査し、その利点をまとめてください。",
+        "{topic}について、ブログ記事を執筆してください。",
+        "{topic}、いいですね！",
+    ]
+    topics = ["LangGraph", "マルチエージェント", "RAG", "エージェントの評価", "ストリーミング"]
+    random.seed(0)
+    traffic = [random.choice(templates).format(topic=random.choice(topics)) for _ in range(100)]
+    print(f"--- 問題002のスーパーバイザーに {len(traffic)} 件のリクエスト (異なる依頼文は {len(set(traffic))} 種類) ---")
+
+    def run(label, router_factory):
+        llm = build_scripted_llm()
+        router = router_factory(llm)
+        graph = build_q2_supervisor_graph(llm, route_decision=router)
+        start = time.perf_counter()
+        decisions = []
+        for i, request in enumerate(traffic):
+            result = graph.invoke(q2_inputs(request), config={"configurable": {"thread_id": f"{label}-{i}"}})
+            decisions.append([m.content for m in result["messages"]])
+        print(f"\n[{label}] 所要時間 {time.perf_counter() - start:.2f}秒")
+        if isinstance(router, CachedRouter):
+            router.print_stats()
+        return decisions
+
+    baseline_decisions = run("キャッシュなし", lambda llm: None)
+    cached_decisions = run("完全一致キャッシュ", lambda llm: CachedRouter(lambda m: llm.invoke(m).content, RouterCache(maxsize=256)))
+    fast_decisions = run("キャッシュ + ルール判定", lambda llm: CachedRouter(
+        lambda m: llm.invoke(m).content, RouterCache(maxsize=256), fast_path=KeywordRouter(SUPERVISOR_KEYWORD_RULES)))
+    print(f"\nキャッシュあり/なしで判断が一致: {cached_decisions == baseline_decisions}")
+    print(f"ルール併用/なしで判断が一致: {fast_decisions == baseline_decisions}")
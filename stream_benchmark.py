@@ -0,0 +1,209 @@
+"""
+第5章 問題001/002 (ストリーミング) の発展: stream_mode ごとのレイテンシとペイロードサイズの比較ハーネス。
+
+同じグラフを `values` / `updates` / `messages` の各 stream_mode で実行し、次の値を計測する。
+
+*   最初のイベントが届くまでの時間 (time to first event)
+*   LLM の最初のトークンが利用側 (for ループ) に届くまでの時間
+*   1秒あたりのイベント数
+*   1イベントあたりのバイト数 (UIバックエンドへ JSON で送る想定で、langchain_core.load.dumps でシリアライズしたサイズ)
+
+さらに、会話履歴の長さを変えて `values` モードを計測し、1イベントあたりのサイズが履歴に比例して増えるグラフを警告する。
+
+ノートブックのグラフを計測する場合 (例: 第5章 問題002のグラフ):
+
+    from stream_benchmark import run_stream_benchmark, print_stream_benchmark
+    rows = run_stream_benchmark(graph_q2, lambda: {"messages": [HumanMessage(content="LangGraphとは？")]})
+    print_stream_benchmark(rows)
+
+このファイルを直接実行すると、Fake ストリーミングモデル (fake_llm.py) を使ったチャットボットのグラフで計測する。
+    python stream_benchmark.py
+"""
+import time
+import uuid
+from typing import Annotated, TypedDict
+
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langgraph.graph import END, StateGraph
+from langgraph.graph.message import add_messages
+
+STREAM_MODES = ("values", "updates", "messages")
+
+# values モードの1イベントあたりのサイズが、履歴の長さを伸ばしたときにこの倍率以上になったら警告する
+VALUES_GROWTH_WARN_RATIO = 2.0
+
+
+def event_size(event):
+    """イベントを JSON にシリアライズしたときのバイト数。"""
+    return len(dumps(event, ensure_ascii=False).encode("utf-8"))
+
+
+def _iter_messages(obj):
+    """イベント (dict / tuple / list が入れ子になったもの) に含まれるメッセージを列挙する。"""
+    if isinstance(obj, BaseMessage):
+        yield obj
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            yield from _iter_messages(value)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            yield from _iter_messages(value)
+
+
+def _has_new_llm_output(event, known_message_ids):
+    """入力に含まれていなかった AI メッセージ (またはそのチャンク) に中身があれば True。"""
+    for message in _iter_messages(event):
+        if isinstance(message, (AIMessage, AIMessageChunk)) and message.content and message.id not in known_message_ids:
+            return True
+    return False
+
+
+def measure_stream_mode(graph, inputs, stream_mode, config=None):
+    """
+    graph.stream を1回実行し、指定した stream_mode での計測結果を dict で返す。
+    """
+    # 入力メッセージに ID を振っておき、LLM が新たに生成したメッセージと区別できるようにする
+    for message in _iter_messages(inputs):
+        if message.id is None:
+            message.id = str(uuid.uuid4())
+    known_message_ids = {m.id for m in _iter_messages(inputs)}
+    start = time.perf_counter()
+    first_event = None
+    first_llm_token = None
+    sizes = []
+    for event in graph.stream(inputs, config=config, stream_mode=stream_mode):
+        now = time.perf_counter()
+        if first_event is None:
+            first_event = now - start
+        if first_llm_token is None and _has_new_llm_output(event, known_message_ids):
+            first_llm_token = now - start
+        sizes.append(event_size(event))
+    total = time.perf_counter() - start
+    return {
+        "stream_mode": stream_mode,
+        "events": len(sizes),
+        "time_to_first_event": first_event,
+        "time_to_first_llm_token": first_llm_token,
+        "total_time": total,
+        "events_per_sec": len(sizes) / total if total > 0 else 0.0,
+        "avg_bytes_per_event": sum(sizes) / len(sizes) if sizes else 0.0,
+        "max_bytes_per_event": max(sizes) if sizes else 0,
+        "total_bytes": sum(sizes),
+    }
+
+
+def run_stream_benchmark(graph, make_inputs, modes=STREAM_MODES, config=None, repeat=3):
+    """
+    各 stream_mode で repeat 回ずつ実行し、時間は中央値、サイズは最後の実行の値を返す。
+    make_inputs は毎回新しい入力を返す関数 (メッセージIDの付与で入力が書き換わるため、使い回さない)。
+    """
+    rows = []
+    for mode in modes:
+        runs = [measure_stream_mode(graph, make_inputs(), mode, config) for _ in range(repeat)]
+        row = dict(runs[-1])
+        for key in ("time_to_first_event", "time_to_first_llm_token", "total_time", "events_per_sec"):
+            values = sorted(r[key] for r in runs if r[key] is not None)
+            row[key] = values[len(values) // 2] if values else None
+        rows.append(row)
+    return rows
+
+
+def check_values_growth(graph, make_inputs_with_history, history_lengths=(0, 10, 50, 200), config=None):
+    """
+    会話履歴の長さを変えながら values モードの1イベントあたりのサイズを計測する。
+    make_inputs_with_history は履歴のメッセージ数を受け取って入力を返す関数。
+    戻り値は (計測結果のリスト, 警告メッセージまたは None)。
+    """
+    rows = []
+    for length in history_lengths:
+        row = measure_stream_mode(graph, make_inputs_with_history(length), "values", config)
+        row["history_length"] = length
+        rows.append(row)
+    warning = None
+    smallest, largest = rows[0]["avg_bytes_per_event"], rows[-1]["avg_bytes_per_event"]
+    if smallest > 0 and largest / smallest >= VALUES_GROWTH_WARN_RATIO:
+        warning = (
+            f"WARN: values モードの1イベントあたりのサイズが履歴 {history_lengths[0]} → {history_lengths[-1]} 件で "
+            f"{largest / smallest:.1f} 倍に増えています。状態全体を毎ステップ送るため、"
+            "長い会話では updates / messages モードか、履歴のウィンドウ化を検討してください。"
+        )
+    return rows, warning
+
+
+def _fmt(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
+def print_stream_benchmark(rows):
+    print(f"{'stream_mode':<12} {'イベント数':>8} {'初回イベント[s]':>14} {'初回トークン[s]':>14} {'合計[s]':>8} {'イベント/s':>10} {'平均bytes':>10} {'最大bytes':>10}")
+    for row in rows:
+        print(
+            f"{row['stream_mode']:<12} {row['events']:>8d} {_fmt(row['time_to_first_event'], '.3f'):>14} "
+            f"{_fmt(row['time_to_first_llm_token'], '.3f'):>14} {row['total_time']:>8.3f} {row['events_per_sec']:>10.1f} "
+            f"{row['avg_bytes_per_event']:>10.0f} {row['max_bytes_per_event']:>10d}"
+        )
+
+
+def print_values_growth(rows, warning):
+    print(f"{'履歴件数':>8} {'イベント数':>8} {'平均bytes':>10} {'最大bytes':>10}")
+    for row in rows:
+        print(f"{row['history_length']:>8d} {row['events']:>8d} {row['avg_bytes_per_event']:>10.0f} {row['max_bytes_per_event']:>10d}")
+    print(warning or "values モードのイベントサイズは履歴の長さに対してほぼ一定です。")
+
+
+# --- デモ用のグラフ (第5章 問題002 と同じ「LLM ノード + 後処理ノード」構成) ---
+
+class StreamingChatState(TypedDict):
+    messages: Annotated[list, add_messages]
+    turn_count: int
+
+
+def build_chat_graph(llm):
+    def chatbot_node(state: StreamingChatState):
+        return {"messages": [llm.invoke(state["messages"])]}
+
+    def count_turn_node(state: StreamingChatState):
+        return {"turn_count": state.get("turn_count", 0) + 1}
+
+    workflow = StateGraph(StreamingChatState)
+    workflow.add_node("chatbot", chatbot_node)
+    workflow.add_node("count_turn", count_turn_node)
+    workflow.set_entry_point("chatbot")
+    workflow.add_edge("chatbot", "count_turn")
+    workflow.add_edge("count_turn", END)
+    return workflow.compile()
+
+
+def make_chat_history(length):
+    history = []
+    for i in range(length):
+        if i % 2 == 0:
+            history.append(HumanMessage(content=f"質問{i // 2}: LangGraphのストリーミングについて教えてください。"))
+        else:
+            history.append(AIMessage(content=f"回答{i // 2}: stream_mode を指定すると、状態や更新やトークンを逐次受け取れます。"))
+    return history
+
+
+if __name__ == "__main__":
+    from fake_llm import FakeStreamingChatModel
+
+    fake_llm = FakeStreamingChatModel(
+        responses=["LangGraphでは stream_mode に values / updates / messages を指定して、グラフの実行状況を逐次受け取れます。"],
+        first_token_latency=0.2,
+        token_latency=0.01,
+    )
+    chat_graph = build_chat_graph(fake_llm)
+
+    def make_inputs():
+        return {"messages": make_chat_history(20) + [HumanMessage(content="stream_mode の違いは？")], "turn_count": 0}
+
+    print("--- stream_mode 比較 (履歴20件 + 新しい質問) ---")
+    print_stream_benchmark(run_stream_benchmark(chat_graph, make_inputs))
+
+    print("\n--- values モードのイベントサイズと履歴の長さ ---")
+    growth_rows, growth_warning = check_values_growth(
+        chat_graph,
+        lambda length: {"messages": make_chat_history(length) + [HumanMessage(content="続きを教えて")], "turn_count": 0},
+    )
+    print_values_growth(growth_rows, growth_warning)